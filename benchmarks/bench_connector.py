@@ -0,0 +1,161 @@
+"""
+* Проверка параллельных попыток подключения (connector.py)
+* *************************
+* На локальной машине поднимаются слушающие сокеты на ::1 и
+* 127.0.0.1 и проверяется connect_first():
+* 1) оба адреса отвечают - побеждает первый адрес (IPv6);
+* 2) IPv6-порт закрыт - сразу используется IPv4, без ожидания сдвига;
+* 3) IPv6-адрес не отвечает - попытка к IPv4 запускается через
+*    ATTEMPT_DELAY и побеждает (порядок попыток и сдвиг);
+* 4) ни один адрес не отвечает - TimeoutError по общему крайнему сроку;
+* 5) отмена во время ожидания - ConnectCancelled не позже
+*    CANCEL_CHECK_INTERVAL после отмены.
+* "Не отвечающий" адрес - слушающий сокет с заполненной очередью
+* входящих соединений: ядро отбрасывает новые SYN, и подключение
+* зависает, как к недоступному хосту.
+*
+* Запуск: $ python3 benchmarks/bench_connector.py
+"""
+
+import os
+import sys
+import socket
+import threading
+import time
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from connector import connect_first, ConnectCancelled, ATTEMPT_DELAY, CANCEL_CHECK_INTERVAL
+
+TOLERANCE: float = 0.15 # допустимое опоздание относительно ожидаемого времени (в секундах)
+STALL_TIMEOUT: float = 0.5 # крайний срок в проверке общего крайнего срока (в секундах)
+CANCEL_AFTER: float = 0.3 # момент отмены в проверке отмены (в секундах)
+
+class Checker:
+    """
+    * Вывод результатов проверок и подсчёт неудач
+    """
+
+    def __init__(self):
+        self.failed: int = 0
+
+    def report(self, name: str, ok: bool, details: str) -> None:
+        if not ok:
+            self.failed += 1
+        print(f"{'OK  ' if ok else 'FAIL'} {name:<28} {details}")
+
+def listen(family: int, host: str) -> socket.socket:
+    """
+    * Слушающий сокет на свободном порту
+    """
+    s: socket.socket = socket.socket(family, socket.SOCK_STREAM)
+    s.bind((host, 0))
+    s.listen(16)
+    return s
+
+def stalled(family: int, host: str) -> Tuple[socket.socket, List[socket.socket]]:
+    """
+    * Адрес, подключение к которому зависает: очередь входящих соединений
+    * слушающего сокета заполняется и не разбирается
+    *
+    * @return Кортеж (слушающий сокет, сокеты, заполнившие очередь)
+    """
+    s: socket.socket = socket.socket(family, socket.SOCK_STREAM)
+    s.bind((host, 0))
+    s.listen(0)
+    fillers: List[socket.socket] = []
+    for _ in range(8):
+        c: socket.socket = socket.socket(family, socket.SOCK_STREAM)
+        c.setblocking(False)
+        c.connect_ex(s.getsockname()[:2])
+        fillers.append(c)
+    time.sleep(0.1)
+    return s, fillers
+
+def closed_port(family: int, host: str) -> int:
+    """
+    * Порт, на котором никто не слушает (подключение отвергается сразу)
+    """
+    s: socket.socket = socket.socket(family, socket.SOCK_STREAM)
+    s.bind((host, 0))
+    port: int = s.getsockname()[1]
+    s.close()
+    return port
+
+def attempt(addresses, timeout: float = 5.0, cancel: Optional[threading.Event] = None) -> Tuple[object, float]:
+    """
+    * Вызов connect_first() с замером времени
+    *
+    * @return Кортеж (подключённый сокет или исключение, время в секундах)
+    """
+    started: float = time.monotonic()
+    try:
+        result = connect_first(addresses, timeout, cancel)
+    except Exception as e:
+        result = e
+    return result, time.monotonic() - started
+
+def describe(result) -> str:
+    """
+    * Описание результата попытки (подключённый сокет закрывается)
+    """
+    if isinstance(result, socket.socket):
+        family: str = result.family.name
+        result.close()
+        return family
+    return type(result).__name__
+
+def v6(port: int) -> tuple:
+    return (socket.AF_INET6, ("::1", port, 0, 0))
+
+def v4(port: int) -> tuple:
+    return (socket.AF_INET, ("127.0.0.1", port))
+
+def main() -> None:
+    if not socket.has_ipv6:
+        print("IPv6 не поддерживается - проверка невозможна.")
+        sys.exit(0)
+    try:
+        listener6: socket.socket = listen(socket.AF_INET6, "::1")
+    except OSError as e:
+        print(f"Адрес ::1 недоступен ({e}) - проверка невозможна.")
+        sys.exit(0)
+    listener4: socket.socket = listen(socket.AF_INET, "127.0.0.1")
+    port6: int = listener6.getsockname()[1]
+    port4: int = listener4.getsockname()[1]
+    stall6, fillers6 = stalled(socket.AF_INET6, "::1")
+    stall_port6: int = stall6.getsockname()[1]
+    checker: Checker = Checker()
+    print(f"ATTEMPT_DELAY = {ATTEMPT_DELAY:g} с, CANCEL_CHECK_INTERVAL = {CANCEL_CHECK_INTERVAL:g} с")
+
+    result, elapsed = attempt([v6(port6), v4(port4)])
+    ok: bool = isinstance(result, socket.socket) and result.family == socket.AF_INET6 and elapsed < ATTEMPT_DELAY
+    checker.report("оба отвечают: IPv6", ok, f"{elapsed * 1000:.1f} мс, {describe(result)}")
+
+    result, elapsed = attempt([v6(closed_port(socket.AF_INET6, "::1")), v4(port4)])
+    ok = isinstance(result, socket.socket) and result.family == socket.AF_INET and elapsed < ATTEMPT_DELAY
+    checker.report("IPv6 закрыт: сразу IPv4", ok, f"{elapsed * 1000:.1f} мс, {describe(result)}")
+
+    result, elapsed = attempt([v6(stall_port6), v4(port4)])
+    ok = isinstance(result, socket.socket) and result.family == socket.AF_INET and ATTEMPT_DELAY <= elapsed < ATTEMPT_DELAY + TOLERANCE
+    checker.report("IPv6 молчит: IPv4 со сдвигом", ok, f"{elapsed * 1000:.1f} мс, {describe(result)}")
+
+    result, elapsed = attempt([v6(stall_port6)], STALL_TIMEOUT)
+    ok = isinstance(result, TimeoutError) and STALL_TIMEOUT <= elapsed < STALL_TIMEOUT + TOLERANCE
+    checker.report("крайний срок", ok, f"{elapsed * 1000:.1f} мс, {describe(result)}")
+
+    cancel: threading.Event = threading.Event()
+    timer: threading.Timer = threading.Timer(CANCEL_AFTER, cancel.set)
+    timer.start()
+    result, elapsed = attempt([v6(stall_port6)], 5.0, cancel)
+    ok = isinstance(result, ConnectCancelled) and CANCEL_AFTER <= elapsed < CANCEL_AFTER + CANCEL_CHECK_INTERVAL + TOLERANCE
+    checker.report("отмена", ok, f"{elapsed * 1000:.1f} мс, {describe(result)}")
+
+    for s in fillers6 + [stall6, listener6, listener4]:
+        s.close()
+    print("Все проверки пройдены." if checker.failed == 0 else f"Неудачных проверок: {checker.failed}.")
+    sys.exit(0 if checker.failed == 0 else 1)
+
+if __name__ == "__main__":
+    main()
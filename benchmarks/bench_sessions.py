@@ -0,0 +1,83 @@
+"""
+* Замер нагрузки SessionManager при большом числе сеансов
+* *************************
+* Запускается локальный сервер-заглушка DMCD (dmcd_standin.py,
+* отдельный процесс), к нему подключаются 10, 50 и 100 сеансов в
+* одном потоке SessionManager. Один виртуальный участник пишет в
+* комнату в среднем одно сообщение в секунду. Выводятся время подключения, число полученных строк и
+* загрузка процессора клиентским процессом.
+*
+* Запуск: $ python3 benchmarks/bench_sessions.py
+"""
+
+import os
+import sys
+import time
+import threading
+import subprocess
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+SIZES: List[int] = [10, 50, 100]
+DURATION: float = 10.0 # длительность замера для каждого числа сеансов (в секундах)
+MESSAGE_RATE: float = 1.0 # сообщений виртуального участника в секунду
+STANDIN: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dmcd_standin.py")
+
+def get_cpu_time() -> float:
+    """
+    * Процессорное время текущего процесса (пользователь + система)
+    """
+    return time.process_time()
+
+def measure(port: int, count: int) -> None:
+    """
+    * Замер для заданного числа сеансов
+    """
+    from session import DMconnectSession
+    from sessions import SessionManager, SessionSpec, STATE_CONNECTED, MODE_RAW
+
+    lock = threading.Lock()
+    received: List[int] = [0]
+    connected: List[int] = [0]
+
+    def listener(name: str, kind: str, payload) -> None:
+        with lock:
+            if kind == "messages":
+                received[0] += len(payload)
+            elif kind == "state" and payload[0] == STATE_CONNECTED:
+                connected[0] += 1
+
+    template = DMconnectSession()
+    manager = SessionManager(listener, template)
+    for i in range(count):
+        manager.add(SessionSpec(f"s{i}", "127.0.0.1", port, f"user{i}", "secret", "general", MODE_RAW))
+    started: float = time.monotonic()
+    manager.start()
+    while connected[0] < count and time.monotonic() - started < 60.0:
+        time.sleep(0.01)
+    connect_time: float = time.monotonic() - started
+    with lock:
+        received[0] = 0
+    cpu_start: float = get_cpu_time()
+    wall_start: float = time.monotonic()
+    time.sleep(DURATION)
+    cpu: float = get_cpu_time() - cpu_start
+    wall: float = time.monotonic() - wall_start
+    manager.stop()
+    print(f"{count:>8} | {connected[0]:>10} | {connect_time:>12.2f} | {received[0]:>10} | {received[0] / wall:>10.1f} | {100.0 * cpu / wall:>8.2f}")
+
+def main() -> None:
+    server = subprocess.Popen([sys.executable, STANDIN, "--users", "1", "--rate", str(MESSAGE_RATE), "--rooms", "general"], stdout=subprocess.PIPE, text=True)
+    try:
+        port: int = int(server.stdout.readline())
+        print(f"Сервер-заглушка: 127.0.0.1:{port}, длительность замера: {DURATION:.0f} с")
+        print(f"{'сеансов':>8} | {'подключено':>10} | {'подключение,с':>12} | {'строк':>10} | {'строк/с':>10} | {'CPU, %':>8}")
+        for count in SIZES:
+            measure(port, count)
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+"""
+* Набор замеров производительности клиента
+* *************************
+* Микрозамеры:
+*   - разбор ответа сервера в read_socket() (Telnet-совместимый и
+*     обычный режимы) для 100, 1 000 и 10 000 строк;
+*   - разбор списка участников (то, что делает get_user_list():
+*     строка "Members in ..." в MembersCache) для 10, 1 000 и
+*     10 000 участников;
+*   - add_message_to_chat() и populate_users_listbox() главного окна
+*     (только при наличии графического интерфейса; иначе замеряются
+*     их составные части: ChatHistory и ListboxReconciler над
+*     эмуляцией Listbox).
+* Сквозные сценарии (с локальным сервером-заглушкой dmcd_standin.py):
+*   - время ответа на команду (/members) и на сообщение (эхо);
+*   - задержка от отправки сообщения сервером до вывода клиентом
+*     (HeadlessClient) при небольшой нагрузке;
+*   - устойчивая скорость приёма сообщений при росте нагрузки.
+* Результаты записываются в JSON; два файла результатов можно
+* сравнить (например, до и после изменения).
+*
+* Запуск:
+* $ python3 benchmarks/bench_suite.py [--quick] [--output results.json]
+* $ python3 benchmarks/bench_suite.py --compare old.json new.json
+"""
+
+from typing import Optional, List, Dict, Callable
+import argparse
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+BENCH_DIR: str = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+from session import DMconnectSession
+from members import MembersCache
+from protocol import LIST_OF_USERS, parse_line
+from history import ChatHistory
+from listview import ListboxReconciler
+from dmcd_standin import StandInServer, LoadProfile
+from bench_users_listbox import FakeListbox
+
+OUTPUT_FILE: str = "bench_results.json"
+LINE_COUNTS: List[int] = [100, 1000, 10000]
+MEMBER_COUNTS: List[int] = [10, 1000, 10000]
+CHAT_BATCHES: List[int] = [1, 100, 1000]
+OFFERED_RATES: List[int] = [500, 2000, 8000] # сообщений в секунду, предлагаемых сервером-заглушкой
+BATCH_LINES: int = 200 # строк, записываемых в сокет между вызовами read_socket() (помещается в буфер сокета)
+SAMPLE_LINE: str = "user00042: привет всем, как дела на сервере DMconnect?"
+REGRESSION: float = 0.10 # относительное ухудшение, отмечаемое при сравнении результатов
+
+class Results:
+    """
+    * Результаты замеров: плоский словарь "имя" -> {значение, единица, лучше меньше}
+    """
+
+    def __init__(self):
+        self.items: Dict[str, Dict[str, object]] = {}
+
+    def add(self, name: str, value: float, unit: str, lower_is_better: bool = True) -> None:
+        self.items[name] = {"value": round(value, 3), "unit": unit, "lower_is_better": lower_is_better}
+        print(f"{name:<48} {value:>14.3f} {unit}", flush=True)
+
+    def skip(self, name: str, reason: str) -> None:
+        self.items[name] = {"skipped": reason}
+        print(f"{name:<48} {'пропущено':>14} ({reason})", flush=True)
+
+def percentile(values: List[float], share: float) -> float:
+    if len(values) == 0:
+        return 0.0
+    ordered: List[float] = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+def make_session() -> DMconnectSession:
+    """
+    * Сеанс с настройками из файла настроек, без истории чата
+    """
+    session: DMconnectSession = DMconnectSession()
+    session.history_db = ""
+    session.is_native = False
+    return session
+
+# --- микрозамеры ---
+
+def bench_read_socket(results: Results, repeats: int) -> None:
+    for is_telnet in (True, False):
+        mode: str = "telnet" if is_telnet else "raw"
+        for count in LINE_COUNTS:
+            session: DMconnectSession = make_session()
+            session.is_telnet = is_telnet
+            client, server = socket.socketpair()
+            session.sock = client
+            session.is_connected = True
+            batch: bytes = ((SAMPLE_LINE + "\n") * BATCH_LINES).encode(session.codepage)
+            elapsed: float = 0.0
+            for _ in range(repeats):
+                sent: int = 0
+                while sent < count:
+                    lines_count: int = min(BATCH_LINES, count - sent)
+                    server.sendall(batch[:len(batch) // BATCH_LINES * lines_count]) # все строки одинаковой длины
+                    sent += lines_count
+                    received: int = 0
+                    while received < lines_count:
+                        started: float = time.perf_counter()
+                        received += len(session.read_socket(client))
+                        elapsed += time.perf_counter() - started
+            results.add(f"micro.read_socket.{mode}.{count}", elapsed / (repeats * count) * 1e6, "мкс/строка")
+            client.close()
+            server.close()
+
+def bench_members(results: Results, repeats: int) -> None:
+    for count in MEMBER_COUNTS:
+        line: str = f"{LIST_OF_USERS}'general': " + ", ".join(f"user{n:05d}" for n in range(count))
+        cache: MembersCache = MembersCache()
+        started: float = time.perf_counter()
+        for _ in range(repeats):
+            cache.invalidate()
+            cache.apply(parse_line(line))
+            cache.get_users()
+        results.add(f"micro.members_parse.{count}", (time.perf_counter() - started) / repeats * 1e6, "мкс")
+        started = time.perf_counter()
+        for n in range(repeats): # уведомления о входе и выходе при уже заполненном кэше
+            cache.apply(parse_line(f"*** guest{n} has joined the server."))
+            cache.apply(parse_line(f"*** guest{n} has left the server."))
+        results.add(f"micro.members_notice.{count}", (time.perf_counter() - started) / (2 * repeats) * 1e6, "мкс")
+
+def make_gui():
+    """
+    * Модуль main.py (создаёт окно Tk) или None, если нет графического интерфейса
+    """
+    try:
+        from tkinter import Tk
+        Tk().destroy()
+    except Exception:
+        return None
+    import main
+    return main
+
+def bench_gui(results: Results, repeats: int) -> None:
+    main = make_gui()
+    if main is None:
+        for batch in CHAT_BATCHES:
+            results.skip(f"micro.add_message_to_chat.{batch}", "нет графического интерфейса")
+        for count in MEMBER_COUNTS:
+            results.skip(f"micro.populate_users_listbox.{count}", "нет графического интерфейса")
+        bench_gui_parts(results, repeats)
+        return
+    from tkinter import Text, Listbox
+    from collections import deque
+    app = main.Application.__new__(main.Application) # без окна подключения и сетевого воркера
+    app.message_store = None
+    app.chat_history = ChatHistory()
+    app.pending_chat_lines = deque()
+    app.chat_text = Text(main.root)
+    app.users_view = ListboxReconciler(Listbox(main.root))
+    for batch in CHAT_BATCHES:
+        lines: List[str] = [f"{SAMPLE_LINE} {n}" for n in range(batch)]
+        started: float = time.perf_counter()
+        for _ in range(repeats):
+            app.add_messages_to_chat(lines, store=False)
+            while app.render_scheduled: # остаток отрисовки - сразу, а не в следующем проходе цикла Tk
+                app.render_pending_messages()
+        results.add(f"micro.add_message_to_chat.{batch}", (time.perf_counter() - started) / repeats * 1e6, "мкс")
+    for count in MEMBER_COUNTS:
+        users: List[str] = [f"user{n:05d}" for n in range(count)]
+        targets: List[List[str]] = [users, users + ["newcomer"]]
+        started = time.perf_counter()
+        for n in range(repeats):
+            app.user_listbox_items = targets[n % 2]
+            app.populate_users_listbox()
+        results.add(f"micro.populate_users_listbox.{count}", (time.perf_counter() - started) / repeats * 1e6, "мкс")
+    app.chat_history.close()
+    bench_gui_parts(results, repeats)
+
+def bench_gui_parts(results: Results, repeats: int) -> None:
+    """
+    * Части add_message_to_chat() и populate_users_listbox(), не требующие окна
+    """
+    history: ChatHistory = ChatHistory()
+    for batch in CHAT_BATCHES:
+        lines: List[str] = [f"{SAMPLE_LINE} {n}" for n in range(batch)]
+        started: float = time.perf_counter()
+        for _ in range(repeats):
+            history.extend(lines)
+        results.add(f"micro.chat_history_extend.{batch}", (time.perf_counter() - started) / repeats * 1e6, "мкс")
+    history.close()
+    for count in MEMBER_COUNTS:
+        users: List[str] = [f"user{n:05d}" for n in range(count)]
+        targets: List[List[str]] = [users, users + ["newcomer"]]
+        reconciler: ListboxReconciler = ListboxReconciler(FakeListbox())
+        started = time.perf_counter()
+        for n in range(repeats):
+            reconciler.update(targets[n % 2])
+        results.add(f"micro.listbox_reconcile_fake.{count}", (time.perf_counter() - started) / repeats * 1e6, "мкс")
+
+# --- сквозные сценарии ---
+
+def connect(port: int, login: str) -> DMconnectSession:
+    session: DMconnectSession = make_session()
+    session.is_telnet = True
+    session.establish_connection("127.0.0.1", port, login, "secret")
+    if not session.is_connected:
+        raise RuntimeError(f"Не удалось подключиться к серверу-заглушке (порт {port}).")
+    session.execute_command(session.sock, "/join_server general")
+    return session
+
+def bench_round_trip(results: Results, repeats: int) -> None:
+    server: StandInServer = StandInServer(LoadProfile(users=100)).start()
+    try:
+        session: DMconnectSession = connect(server.port, "bench")
+        samples: List[float] = []
+        for _ in range(repeats):
+            started: float = time.perf_counter()
+            session.execute_command(session.sock, "/members")
+            samples.append((time.perf_counter() - started) * 1000.0)
+        results.add("e2e.command_rtt.members.p50", statistics.median(samples), "мс")
+        results.add("e2e.command_rtt.members.p95", percentile(samples, 0.95), "мс")
+        samples = []
+        for n in range(repeats):
+            expected: str = f"bench: rtt {n}"
+            started = time.perf_counter()
+            session.write_command(session.sock, f"rtt {n}")
+            deadline: float = time.monotonic() + 5.0
+            while time.monotonic() < deadline and expected not in session.read_socket(session.sock):
+                pass
+            samples.append((time.perf_counter() - started) * 1000.0)
+        results.add("e2e.message_echo_rtt.p50", statistics.median(samples), "мс")
+        results.add("e2e.message_echo_rtt.p95", percentile(samples, 0.95), "мс")
+        session.close()
+    finally:
+        server.stop()
+
+class LatencySink(io.TextIOBase):
+    """
+    * Поток вывода HeadlessClient: считает строки и задержку от момента
+    * отправки сервером (метка "#<time.time()>" в начале сообщения)
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.lines: int = 0
+        self.latencies: List[float] = []
+
+    def write(self, text: str) -> int:
+        now: float = time.time()
+        with self.lock:
+            for line in text.splitlines():
+                _, _, message = line.partition(": #")
+                stamp: str = message.split(" ", 1)[0]
+                if stamp:
+                    try:
+                        self.latencies.append((now - float(stamp)) * 1000.0)
+                        self.lines += 1
+                    except ValueError:
+                        pass
+        return len(text)
+
+    def take(self) -> List[float]:
+        with self.lock:
+            latencies, self.latencies, self.lines = self.latencies, [], 0
+        return latencies
+
+def run_headless(port: int, duration: float, warmup: float) -> List[float]:
+    """
+    * HeadlessClient в отдельном потоке; задержки строк, выведенных за duration секунд
+    """
+    from headless import HeadlessClient, OUTPUT_TEXT
+    session: DMconnectSession = make_session()
+    session.is_telnet = True
+    session.host, session.port, session.login, session.password = "127.0.0.1", port, "reader", "secret"
+    session.default_room = "general"
+    sink: LatencySink = LatencySink()
+    client = HeadlessClient(session, OUTPUT_TEXT, out=sink)
+    stdin = sys.stdin
+    sys.stdin = io.StringIO("") # поток чтения stdin сразу получит конец ввода
+    thread: threading.Thread = threading.Thread(target=client.run, daemon=True)
+    thread.start()
+    try:
+        time.sleep(warmup)
+        sink.take()
+        time.sleep(duration)
+        return sink.take()
+    finally:
+        client.stop()
+        thread.join(timeout=5.0)
+        sys.stdin = stdin
+
+def start_standin(rate: float) -> subprocess.Popen:
+    """
+    * Сервер-заглушка в отдельном процессе (чтобы не делить с клиентом GIL)
+    """
+    return subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, "dmcd_standin.py"), "--users", "100", "--rate", str(rate), "--rooms", "general", "--stamp"], stdout=subprocess.PIPE, text=True)
+
+def bench_receive(results: Results, duration: float) -> None:
+    server: subprocess.Popen = start_standin(50)
+    try:
+        latencies: List[float] = run_headless(int(server.stdout.readline()), duration, 1.0)
+        results.add("e2e.receive_to_output.p50", statistics.median(latencies) if latencies else 0.0, "мс")
+        results.add("e2e.receive_to_output.p95", percentile(latencies, 0.95), "мс")
+    finally:
+        server.terminate()
+        server.wait()
+    for rate in OFFERED_RATES:
+        server = start_standin(rate)
+        try:
+            cpu_start: float = time.process_time()
+            latencies = run_headless(int(server.stdout.readline()), duration, 1.0)
+            cpu: float = time.process_time() - cpu_start
+            results.add(f"e2e.sustained.{rate}.messages_per_s", len(latencies) / duration, "сообщ./с", lower_is_better=False)
+            results.add(f"e2e.sustained.{rate}.lag_p95", percentile(latencies, 0.95), "мс")
+            results.add(f"e2e.sustained.{rate}.cpu", 100.0 * cpu / (duration + 1.0), "%")
+        finally:
+            server.terminate()
+            server.wait()
+
+# --- запуск и сравнение ---
+
+def get_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+def run(quick: bool, output: str) -> None:
+    repeats: int = 5 if quick else 50
+    duration: float = 2.0 if quick else 10.0
+    results: Results = Results()
+    steps: List[Callable[[], None]] = [
+        lambda: bench_read_socket(results, max(1, repeats // 5)),
+        lambda: bench_members(results, repeats),
+        lambda: bench_gui(results, repeats),
+        lambda: bench_round_trip(results, repeats),
+        lambda: bench_receive(results, duration),
+    ]
+    for step in steps:
+        step()
+    report: Dict[str, object] = {
+        "meta": {"revision": get_revision(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "platform": platform.platform(), "quick": quick},
+        "results": results.items,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {output}")
+
+def compare(old_file: str, new_file: str) -> int:
+    """
+    * Сравнение двух файлов результатов
+    *
+    * @return 1, если есть ухудшения больше REGRESSION, иначе 0
+    """
+    with open(old_file, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_file, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"было: {old['meta'].get('revision')} ({old['meta'].get('time')}), стало: {new['meta'].get('revision')} ({new['meta'].get('time')})")
+    regressions: int = 0
+    for name, item in new["results"].items():
+        before: Optional[Dict[str, object]] = old["results"].get(name)
+        if before is None or "value" not in item or "value" not in before or before["value"] == 0:
+            continue
+        change: float = (item["value"] - before["value"]) / before["value"]
+        worse: bool = change > REGRESSION if item["lower_is_better"] else change < -REGRESSION
+        regressions += int(worse)
+        print(f"{name:<48} {before['value']:>12.3f} {item['value']:>12.3f} {change * 100.0:>+8.1f}% {'хуже' if worse else ''}")
+    return 1 if regressions > 0 else 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Набор замеров производительности клиента DMconnect.")
+    parser.add_argument("--quick", action="store_true", help="меньше повторов и короче сквозные сценарии")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="файл результатов (JSON)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="сравнить два файла результатов")
+    args = parser.parse_args()
+    if args.compare:
+        return compare(*args.compare)
+    run(args.quick, args.output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+* Проверка и замер очереди обновлений GUI (updates.py)
+* *************************
+* 1) Поток строк чата больше ограничений очереди вперемешку с
+*    управляющими записями ("connect_progress", "delivery",
+*    "connect_done"): строки отбрасываются и учитываются в overflow,
+*    управляющие записи доставляются все и в исходном порядке.
+* 2) Очередь целиком из управляющих записей сверх ограничения не
+*    теряет ни одной.
+* 3) Стоимость put() для пачек строк из разных источников (слияние
+*    невозможно, очередь всё время переполнена).
+*
+* Запуск: $ python3 benchmarks/bench_updates.py
+"""
+
+import os
+import sys
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from updates import UpdateChannel
+
+QUEUE_SIZE: int = 100 # ограничения очереди в проверках (меньше настоящих - проверка быстрее)
+QUEUE_LINES: int = 1000
+BURST_BATCHES: int = 5000 # пачек строк в проверке переполнения
+PUTS: int = 100000 # вызовов put() в замере
+
+class Checker:
+    """
+    * Вывод результатов проверок и подсчёт неудач
+    """
+
+    def __init__(self):
+        self.failed: int = 0
+
+    def report(self, name: str, ok: bool, details: str) -> None:
+        if not ok:
+            self.failed += 1
+        print(f"{'OK  ' if ok else 'FAIL'} {name:<32} {details}")
+
+def check_burst(checker: Checker) -> None:
+    channel: UpdateChannel = UpdateChannel(QUEUE_SIZE, QUEUE_LINES)
+    expected: List[Tuple[str, object]] = []
+    channel.put("connect_progress", "resolving")
+    for n in range(BURST_BATCHES):
+        channel.put("session", (f"s{n % 2}", "messages", [f"line {n}"] * 3)) # два источника чередуются - пачки не сливаются
+        if n % 1000 == 0:
+            payload = ("sent", f"message {n}", 0)
+            channel.put("delivery", payload)
+            expected.append(("delivery", payload))
+    channel.put("connect_progress", "joining")
+    channel.put("connect_done", None)
+    expected.append(("connect_done", None))
+    items: List[Tuple[str, object]] = channel.drain()
+    control: List[Tuple[str, object]] = [item for item in items if item[0] in ("delivery", "connect_done")]
+    progress: List[object] = [payload for kind, payload in items if kind == "connect_progress"]
+    lines: int = sum(len(payload[2]) for kind, payload in items if kind == "session")
+    checker.report("управляющие записи доставлены", control == expected, f"{len(control)} из {len(expected)}, connect_done последним: {control[-1:] == expected[-1:]}")
+    checker.report("этап подключения - последний", progress == ["joining"], f"{progress}")
+    checker.report("строки ограничены", lines <= QUEUE_LINES and items[0] == ("overflow", channel.overflow), f"строк: {lines}, отброшено: {channel.overflow}")
+    checker.report("строки учтены", lines + channel.overflow == 3 * BURST_BATCHES, f"{lines} + {channel.overflow} = {3 * BURST_BATCHES}")
+
+def check_control_only(checker: Checker) -> None:
+    channel: UpdateChannel = UpdateChannel(QUEUE_SIZE, QUEUE_LINES)
+    for n in range(QUEUE_SIZE * 2):
+        channel.put("delivery", ("queued", f"message {n}", n))
+    items: List[Tuple[str, object]] = channel.drain()
+    checker.report("только управляющие записи", len(items) == QUEUE_SIZE * 2 and channel.overflow == 0, f"{len(items)} из {QUEUE_SIZE * 2}")
+
+def measure_put() -> None:
+    channel: UpdateChannel = UpdateChannel()
+    batch: List[str] = ["user00042: привет"] * 10
+    started: float = time.perf_counter()
+    for n in range(PUTS):
+        channel.put("session", (f"s{n % 2}", "messages", batch))
+    elapsed: float = time.perf_counter() - started
+    print(f"put() при переполненной очереди: {elapsed / PUTS * 1e6:.2f} мкс, отброшено строк: {channel.overflow}")
+
+def main() -> None:
+    checker: Checker = Checker()
+    check_burst(checker)
+    check_control_only(checker)
+    measure_put()
+    print("Все проверки пройдены." if checker.failed == 0 else f"Неудачных проверок: {checker.failed}.")
+    sys.exit(0 if checker.failed == 0 else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+* Замер стоимости обновления списка пользователей (Listbox)
+* *************************
+* Сравнивается прежний способ (delete(0, END) и вставка всех
+* пользователей заново) и ListboxReconciler (применение только
+* различий) для 10, 1 000 и 10 000 участников в трёх сценариях:
+* список не изменился, один пользователь вошёл, один вышел.
+* При наличии графического интерфейса используется настоящий
+* виджет Listbox, иначе - его эмуляция со счётчиком обращений.
+*
+* Запуск: $ python3 benchmarks/bench_users_listbox.py
+"""
+
+import os
+import sys
+import time
+from typing import List, Callable, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from listview import ListboxReconciler
+
+SIZES: List[int] = [10, 1000, 10000]
+REPEATS: int = 20 # число повторов каждого замера
+
+class FakeListbox:
+    """
+    * Эмуляция Listbox (без графического интерфейса): хранит элементы
+    * и считает обращения к виджету
+    """
+
+    def __init__(self):
+        self.elements: List[str] = []
+        self.calls: int = 0
+
+    def delete(self, first, last=None) -> None:
+        self.calls += 1
+        if first == 0 and last == "end":
+            self.elements.clear()
+            return
+        last = first if last is None else last
+        del self.elements[first:last + 1]
+
+    def insert(self, index, *elements) -> None:
+        self.calls += 1
+        if index == "end":
+            self.elements.extend(elements)
+        else:
+            self.elements[index:index] = elements
+
+def make_listbox():
+    """
+    * Настоящий Listbox, если есть графический интерфейс, иначе эмуляция
+    """
+    try:
+        from tkinter import Tk, Listbox
+        root = Tk()
+        root.withdraw()
+        return Listbox(root), "tk"
+    except Exception:
+        return FakeListbox(), "fake"
+
+def populate_full(listbox, users: List[str]) -> None:
+    """
+    * Прежний способ: полная перерисовка списка
+    """
+    listbox.delete(0, "end")
+    for user in users:
+        listbox.insert("end", user)
+
+def measure(listbox, action: Callable[[], None]) -> Tuple[float, float]:
+    """
+    * Среднее время выполнения действия (в микросекундах) и среднее число
+    * обращений к виджету (только для эмуляции, иначе -1)
+    """
+    calls: int = getattr(listbox, "calls", 0)
+    started: float = time.perf_counter()
+    for _ in range(REPEATS):
+        action()
+    elapsed: float = (time.perf_counter() - started) / REPEATS * 1e6
+    if not hasattr(listbox, "calls"):
+        return elapsed, -1
+    return elapsed, (listbox.calls - calls) / REPEATS
+
+def main() -> None:
+    listbox, backend = make_listbox()
+    print(f"Виджет: {backend}, повторов: {REPEATS}")
+    print(f"{'участников':>10} {'сценарий':>10} {'было, мкс':>12} {'стало, мкс':>12} {'вызовов было':>13} {'вызовов стало':>14}")
+    for size in SIZES:
+        users: List[str] = [f"user{n:05d}" for n in range(size)]
+        scenarios = {
+            "без изм.": (users, users),
+            "вход": (users, users + ["newcomer"]),
+            "выход": (users, users[:size // 2] + users[size // 2 + 1:]),
+        }
+        for name, (before, after) in scenarios.items():
+            old_cost, old_calls = measure(listbox, lambda: populate_full(listbox, after))
+            populate_full(listbox, [])
+            reconciler = ListboxReconciler(listbox)
+            reconciler.update(before)
+            targets = [after] if before is after else [after, before] # чередуем, чтобы изменение было при каждом вызове
+            counter: List[int] = [0]
+            def new_way() -> None:
+                reconciler.update(targets[counter[0] % len(targets)])
+                counter[0] += 1
+            new_cost, new_calls = measure(listbox, new_way)
+            print(f"{size:>10} {name:>10} {old_cost:>12.1f} {new_cost:>12.1f} {old_calls:>13.0f} {new_calls:>14.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,424 @@
+"""
+* Локальный сервер-заглушка DMCD и генератор нагрузки
+* *************************
+* Эмулирует текстовый протокол сервера DMconnect (см. backtrace.txt):
+* /register, /login, /join_server, /members, "/" (ping), рассылку
+* сообщений участникам комнаты и уведомления о входе и выходе.
+* Нативный протокол DMconn не эмулируется - клиент подключается в
+* режиме Telnet-совместимости или без него (native = N).
+* Генератор нагрузки создаёт виртуальных участников (тысячи - без
+* отдельных соединений), которые пишут в комнаты с заданной
+* скоростью, входят и выходят. Ответы сервера можно задерживать
+* (latency, jitter) и дробить на TCP-фрагменты случайной длины
+* (в том числе посреди многобайтового символа UTF-8).
+* Всё работает в одном потоке на selector'е, без сети за пределами
+* локальной машины.
+*
+* Запуск (номер порта выводится первой строкой stdout):
+* $ python3 benchmarks/dmcd_standin.py [--port 42439] [--users 1000] [--rate 50] [--churn 1]
+*       [--fragment 16] [--latency 50] [--jitter 20] [--stamp] [--duration 60] [--stats 5]
+* Из кода:
+*   server = StandInServer(LoadProfile(users=1000, rate=50.0))
+*   server.start() # в отдельном потоке; server.port - порт
+*   ...
+*   server.stop()
+"""
+
+from typing import Optional, List, Dict, Tuple
+from collections import deque
+import argparse
+import heapq
+import random
+import selectors
+import socket
+import sys
+import threading
+import time
+
+HOST: str = "127.0.0.1"
+ROOMS: List[str] = ["general", "anekdots", "dsalin_"]
+CODEPAGE: str = "utf-8"
+RECV_SIZE: int = 65536
+TICK: float = 0.01 # шаг генератора нагрузки (в секундах)
+WORDS: List[str] = ["привет", "как", "дела", "hello", "test", "сервер", "DMconnect", "ok", "ping", "ретро", "чат", "ну", "да", "нет", "world"]
+
+class LoadProfile:
+    """
+    * Параметры нагрузки сервера-заглушки
+    """
+
+    def __init__(self, users: int = 0, rate: float = 0.0, churn: float = 0.0, message_size: int = 40, fragment: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0, rooms: Optional[List[str]] = None, seed: Optional[int] = None, stamp: bool = False):
+        """
+        * @param users Число виртуальных участников
+        * @param rate Сообщений виртуальных участников в секунду (всего, по всем комнатам)
+        * @param churn Входов и выходов виртуальных участников в секунду
+        * @param message_size Средняя длина сообщения (в символах)
+        * @param fragment Максимальная длина TCP-фрагмента ответа (0 - не дробить)
+        * @param latency_ms Задержка доставки ответов (мс)
+        * @param jitter_ms Случайный разброс задержки (мс)
+        * @param rooms Комнаты сервера
+        * @param seed Начальное значение генератора случайных чисел (для повторяемости)
+        * @param stamp Начинать сообщения виртуальных участников с момента отправки ("#<time.time()> ...")
+        """
+        self.users = max(0, users)
+        self.rate = max(0.0, rate)
+        self.churn = max(0.0, churn)
+        self.message_size = max(1, message_size)
+        self.fragment = max(0, fragment)
+        self.latency = max(0.0, latency_ms) / 1000.0
+        self.jitter = max(0.0, jitter_ms) / 1000.0
+        self.rooms = list(rooms) if rooms else list(ROOMS)
+        self.seed = seed
+        self.stamp = stamp
+
+class Client:
+    """
+    * Подключённый клиент
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.inbox: bytes = b"" # принятые, но ещё не разобранные байты
+        self.outbox: bytearray = bytearray() # байты, готовые к записи в сокет
+        self.last_due: float = 0.0 # момент доставки последнего запланированного фрагмента (порядок сохраняется)
+        self.login: Optional[str] = None
+        self.room: Optional[str] = None
+        self.closing: bool = False
+
+class StandInServer:
+
+    profile: Optional[LoadProfile] = None
+    port: int = 0
+
+    def __init__(self, profile: Optional[LoadProfile] = None, host: str = HOST, port: int = 0):
+        """
+        * @param profile Параметры нагрузки
+        * @param host Адрес прослушивания
+        * @param port Порт (0 - любой свободный)
+        """
+        self.profile = profile if profile is not None else LoadProfile()
+        self.random = random.Random(self.profile.seed)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, port))
+        self.listener.listen(1024)
+        self.listener.setblocking(False)
+        self.port = self.listener.getsockname()[1]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.clients: Dict[socket.socket, Client] = {}
+        self.accounts: Dict[str, str] = {} # логин -> пароль (зарегистрированные; прочие входят с любым паролем)
+        self.virtual: Dict[str, List[str]] = {room: [] for room in self.profile.rooms} # виртуальные участники по комнатам
+        self.offline: deque = deque() # виртуальные участники, вышедшие из чата
+        self.pending: List[Tuple[float, int, Client, bytes]] = [] # куча фрагментов, ожидающих доставки
+        self.sequence: int = 0
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.stats: Dict[str, int] = {"connections": 0, "commands": 0, "broadcasts": 0, "lines": 0, "bytes": 0, "fragments": 0}
+        for i in range(self.profile.users):
+            self.virtual[self.profile.rooms[i % len(self.profile.rooms)]].append(f"user{i:05d}")
+
+    # --- доставка ---
+
+    def schedule(self, client: Client, text: str) -> None:
+        """
+        * Постановка строк ответа в очередь доставки клиенту (с задержкой и дроблением)
+        """
+        if client.closing:
+            return
+        data: bytes = text.encode(CODEPAGE)
+        self.stats["lines"] += text.count("\n")
+        profile: LoadProfile = self.profile
+        now: float = time.monotonic()
+        due: float = now + profile.latency + (self.random.uniform(0.0, profile.jitter) if profile.jitter > 0.0 else 0.0)
+        chunks: List[bytes] = [data]
+        if profile.fragment > 0 and len(data) > 1:
+            chunks = []
+            start: int = 0
+            while start < len(data):
+                size: int = self.random.randint(1, profile.fragment)
+                chunks.append(data[start:start + size])
+                start += size
+        for i, chunk in enumerate(chunks):
+            chunk_due: float = max(due, client.last_due) + (0.001 if i > 0 else 0.0) # фрагменты - отдельными сегментами
+            client.last_due = chunk_due
+            if chunk_due <= now and len(self.pending) == 0:
+                self._write(client, chunk)
+            else:
+                self.sequence += 1
+                heapq.heappush(self.pending, (chunk_due, self.sequence, client, chunk))
+
+    def _write(self, client: Client, chunk: bytes) -> None:
+        if client.closing:
+            return
+        client.outbox += chunk
+        self.stats["fragments"] += 1
+        self._flush(client)
+
+    def _flush(self, client: Client) -> None:
+        try:
+            sent: int = client.sock.send(client.outbox)
+            self.stats["bytes"] += sent
+            del client.outbox[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self.disconnect(client)
+            return
+        events: int = selectors.EVENT_READ | (selectors.EVENT_WRITE if len(client.outbox) > 0 else 0)
+        try:
+            self.selector.modify(client.sock, events, client)
+        except (KeyError, ValueError, OSError):
+            pass
+
+    def _deliver_due(self, now: float) -> None:
+        while len(self.pending) > 0 and self.pending[0][0] <= now:
+            _, _, client, chunk = heapq.heappop(self.pending)
+            self._write(client, chunk)
+
+    def broadcast(self, room: str, line: str, exclude: Optional[Client] = None) -> None:
+        """
+        * Рассылка строки всем вошедшим в комнату клиентам
+        """
+        self.stats["broadcasts"] += 1
+        for client in list(self.clients.values()):
+            if client.room == room and client is not exclude:
+                self.schedule(client, line + "\n")
+
+    # --- протокол ---
+
+    def handle_command(self, client: Client, line: str) -> None:
+        """
+        * Обработка одной строки от клиента
+        """
+        line = line.strip()
+        if "".__eq__(line):
+            return
+        self.stats["commands"] += 1
+        parts: List[str] = line.split()
+        cmd: str = parts[0]
+        if cmd == "/": # ping: сервер не отвечает
+            return
+        if cmd in ("/login", "/register"):
+            if len(parts) < 3:
+                self.schedule(client, f"Usage: {cmd} <username> <password>\n")
+                return
+            login, password = parts[1], parts[2]
+            if cmd == "/register":
+                if login in self.accounts:
+                    self.schedule(client, "Username already taken.\n")
+                else:
+                    self.accounts[login] = password
+                    self.schedule(client, "Registration successful.\n")
+                return
+            if login in self.accounts and self.accounts[login] != password:
+                self.schedule(client, "Invalid username or password.\n")
+                return
+            client.login = login
+            self.schedule(client, f"Login successful.\nAvailable servers: {', '.join(self.profile.rooms)}\nSelect a server using /join_server <server_name>.\n")
+            return
+        if client.login is None:
+            self.schedule(client, "Enter command (/login /register): \n")
+            return
+        if cmd == "/join_server":
+            room: str = parts[1] if len(parts) > 1 else ""
+            if room not in self.virtual:
+                self.schedule(client, f"Server '{room}' not found.\n")
+                return
+            if client.room is not None:
+                self.broadcast(client.room, f"*** {client.login} has left the server.", client)
+            client.room = room
+            self.broadcast(room, f"*** {client.login} has joined the server.")
+            self.schedule(client, f"Joined server '{room}' successfully.\n")
+            return
+        if cmd == "/members":
+            if client.room is None:
+                self.schedule(client, "You are not on a server.\n")
+                return
+            members: List[str] = list(self.virtual[client.room])
+            members.extend(other.login for other in self.clients.values() if other.room == client.room)
+            self.schedule(client, f"Members in '{client.room}': {', '.join(members)}\n")
+            return
+        if cmd.startswith("/"):
+            self.schedule(client, "Unknown command.\n")
+            return
+        if client.room is None:
+            self.schedule(client, "Select a server using /join_server <server_name>.\n")
+            return
+        self.broadcast(client.room, f"{client.login}: {line}")
+
+    def _read(self, client: Client) -> None:
+        try:
+            data: bytes = client.sock.recv(RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self.disconnect(client)
+            return
+        client.inbox += data
+        *lines, client.inbox = client.inbox.split(b"\n")
+        for line in lines:
+            self.handle_command(client, line.decode(CODEPAGE, errors="replace"))
+        if len(client.inbox) > 0 and b"\n" not in data: # клиент без Telnet-совместимости шлёт команды без перевода строки
+            line, client.inbox = client.inbox, b""
+            self.handle_command(client, line.decode(CODEPAGE, errors="replace"))
+
+    def _accept(self) -> None:
+        try:
+            sock, _ = self.listener.accept()
+        except (BlockingIOError, InterruptedError, OSError):
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client: Client = Client(sock)
+        self.clients[sock] = client
+        self.selector.register(sock, selectors.EVENT_READ, client)
+        self.stats["connections"] += 1
+
+    def disconnect(self, client: Client) -> None:
+        """
+        * Закрытие соединения клиента (с уведомлением комнаты о выходе)
+        """
+        if client.closing:
+            return
+        client.closing = True
+        self.clients.pop(client.sock, None)
+        try:
+            self.selector.unregister(client.sock)
+        except (KeyError, ValueError, OSError):
+            pass
+        client.sock.close()
+        if client.room is not None and client.login is not None:
+            self.broadcast(client.room, f"*** {client.login} has left the server.")
+
+    # --- генератор нагрузки ---
+
+    def _make_text(self) -> str:
+        size: int = max(1, int(self.random.expovariate(1.0 / self.profile.message_size)))
+        words: List[str] = []
+        length: int = 0
+        while length < size:
+            word: str = self.random.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)
+
+    def _generate(self, elapsed: float) -> None:
+        """
+        * Сообщения, входы и выходы виртуальных участников за прошедшее время
+        """
+        profile: LoadProfile = self.profile
+        rooms: List[str] = [room for room in profile.rooms if len(self.virtual[room]) > 0]
+        if profile.rate > 0.0 and len(rooms) > 0:
+            for _ in range(self._count(profile.rate * elapsed)):
+                room: str = self.random.choice(rooms)
+                text: str = f"#{time.time():.6f} {self._make_text()}" if profile.stamp else self._make_text()
+                self.broadcast(room, f"{self.random.choice(self.virtual[room])}: {text}")
+        if profile.churn > 0.0 and profile.users > 0:
+            for _ in range(self._count(profile.churn * elapsed)):
+                room = self.random.choice(profile.rooms)
+                if len(self.offline) > 0 and (self.random.random() < 0.5 or len(self.virtual[room]) == 0):
+                    login: str = self.offline.popleft()
+                    self.virtual[room].append(login)
+                    self.broadcast(room, f"*** {login} has joined the server.")
+                elif len(self.virtual[room]) > 0:
+                    login = self.virtual[room].pop(self.random.randrange(len(self.virtual[room])))
+                    self.offline.append(login)
+                    self.broadcast(room, f"*** {login} has left the server.")
+
+    def _count(self, expected: float) -> int:
+        """
+        * Целое число событий с математическим ожиданием expected
+        """
+        count: int = int(expected)
+        return count + (1 if self.random.random() < expected - count else 0)
+
+    # --- цикл ---
+
+    def run(self, duration: Optional[float] = None, stats_interval: float = 0.0) -> None:
+        """
+        * Цикл сервера (до stop() или истечения duration секунд)
+        """
+        started: float = time.monotonic()
+        last: float = started
+        next_stats: float = started + stats_interval
+        try:
+            while not self.stop_event.is_set():
+                now: float = time.monotonic()
+                if duration is not None and now - started >= duration:
+                    break
+                wake_at: float = now + (TICK if self.profile.rate > 0.0 or self.profile.churn > 0.0 else 0.5)
+                if len(self.pending) > 0:
+                    wake_at = min(wake_at, self.pending[0][0])
+                for key, mask in self.selector.select(max(0.0, wake_at - now)):
+                    if key.fileobj is self.listener:
+                        self._accept()
+                        continue
+                    client: Client = key.data
+                    if mask & selectors.EVENT_WRITE:
+                        self._flush(client)
+                    if mask & selectors.EVENT_READ and not client.closing:
+                        self._read(client)
+                now = time.monotonic()
+                self._generate(now - last)
+                last = now
+                self._deliver_due(now)
+                if stats_interval > 0.0 and now >= next_stats:
+                    print(self.get_stats_text(now - started), file=sys.stderr, flush=True)
+                    next_stats = now + stats_interval
+        finally:
+            for client in list(self.clients.values()):
+                client.sock.close()
+            self.clients.clear()
+            self.selector.close()
+            self.listener.close()
+
+    def get_stats_text(self, elapsed: float) -> str:
+        stats: Dict[str, int] = self.stats
+        return f"{elapsed:8.1f} с: клиентов {len(self.clients)}, команд {stats['commands']}, рассылок {stats['broadcasts']}, строк {stats['lines']}, фрагментов {stats['fragments']}, байтов {stats['bytes']}"
+
+    def start(self) -> "StandInServer":
+        """
+        * Запуск цикла сервера в отдельном потоке
+        """
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Локальный сервер-заглушка DMCD и генератор нагрузки.")
+    parser.add_argument("--host", default=HOST, help="адрес прослушивания")
+    parser.add_argument("--port", type=int, default=0, help="порт (0 - любой свободный)")
+    parser.add_argument("--users", type=int, default=0, help="число виртуальных участников")
+    parser.add_argument("--rate", type=float, default=0.0, help="сообщений виртуальных участников в секунду")
+    parser.add_argument("--churn", type=float, default=0.0, help="входов и выходов виртуальных участников в секунду")
+    parser.add_argument("--message-size", type=int, default=40, help="средняя длина сообщения (в символах)")
+    parser.add_argument("--fragment", type=int, default=0, help="максимальная длина TCP-фрагмента ответа (0 - не дробить)")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка доставки ответов (мс)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайный разброс задержки (мс)")
+    parser.add_argument("--rooms", default=",".join(ROOMS), help="комнаты через запятую")
+    parser.add_argument("--seed", type=int, default=None, help="начальное значение генератора случайных чисел")
+    parser.add_argument("--stamp", action="store_true", help="начинать сообщения с момента отправки (для замера задержки)")
+    parser.add_argument("--duration", type=float, default=None, help="время работы (в секундах)")
+    parser.add_argument("--stats", type=float, default=0.0, help="период вывода статистики в stderr (в секундах)")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    profile: LoadProfile = LoadProfile(args.users, args.rate, args.churn, args.message_size, args.fragment, args.latency, args.jitter, [room.strip() for room in args.rooms.split(",") if room.strip()], args.seed, args.stamp)
+    server: StandInServer = StandInServer(profile, args.host, args.port)
+    print(server.port, flush=True)
+    try:
+        server.run(args.duration, args.stats)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
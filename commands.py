@@ -0,0 +1,154 @@
+"""
+* Конвейер команд серверу DMconnect
+* *************************
+* Команда отправляется сразу, а её результат - объект Future,
+* который завершится, когда придёт ответ. Одновременно может
+* выполняться несколько команд: входящая строка относится к самой
+* старой ожидающей команде, которая ждёт строку такого вида
+* (например, "/members" - список участников, "/login" - результат
+* входа и список комнат). Строки, которые не относятся ни к одной
+* команде (сообщения других пользователей), остаются в общем потоке
+* входящих строк. Конец ответа определяет ResponseCompletion (см.
+* completion.py): строка-признак, интервал тишины или крайний срок.
+* Все методы вызываются из потока, который работает с сетью; там же
+* выполняются функции, добавленные через Future.add_done_callback().
+"""
+
+from typing import Optional, List, Dict, Tuple, Type
+from concurrent.futures import Future
+from collections import deque
+import time
+
+from completion import ResponseCompletion
+from protocol import ProtocolEvent, MembersList, ServerList, LoginResult
+from metrics import METRICS
+
+# Виды событий, из которых состоит ответ на команду (кроме строк-признаков конца ответа)
+REPLY_KINDS: Dict[str, Tuple[Type[ProtocolEvent], ...]] = {
+    "/members": (MembersList,),
+    "/login": (LoginResult, ServerList),
+    "/register": (ServerList,),
+}
+# Начала строк, из которых состоит ответ на команду (кроме строк-признаков конца ответа)
+REPLY_PREFIXES: Dict[str, Tuple[str, ...]] = {
+    "/register": ("Registration ",),
+}
+
+class PendingCommand:
+    """
+    * Команда, ожидающая ответа
+    """
+
+    __slots__ = ("cmd", "name", "completion", "lines", "future", "started")
+
+    def __init__(self, cmd: str, deadline: Optional[float] = None):
+        """
+        * @param cmd Команда
+        * @param deadline Крайний срок ожидания ответа (в секундах)
+        """
+        self.cmd = cmd
+        self.name: str = cmd.strip().split(" ", 1)[0].lower()
+        self.completion: ResponseCompletion = ResponseCompletion(cmd, deadline)
+        self.lines: List[str] = []
+        self.future: Future = Future()
+        self.started: float = time.perf_counter()
+
+    def accepts(self, event: ProtocolEvent) -> bool:
+        """
+        * Относится ли строка к ответу на эту команду
+        """
+        if isinstance(event, REPLY_KINDS.get(self.name, ())):
+            return True
+        prefixes: Tuple[str, ...] = self.completion.terminators + self.completion.block + REPLY_PREFIXES.get(self.name, ())
+        return len(prefixes) > 0 and event.line.startswith(prefixes)
+
+class CommandPipeline:
+
+    def __init__(self):
+        self._pending: deque = deque() # ожидающие ответа команды в порядке отправки
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, cmd: str, deadline: Optional[float] = None) -> Future:
+        """
+        * Учёт отправленной команды
+        *
+        * @param cmd Команда
+        * @param deadline Крайний срок ожидания ответа (в секундах)
+        * @return Future, результат - массив строк ответа
+        """
+        if not ResponseCompletion.expects_reply(cmd): # ответа не будет - команда выполнена
+            future: Future = Future()
+            future.set_result([])
+            return future
+        command: PendingCommand = PendingCommand(cmd, deadline)
+        self._pending.append(command)
+        return command.future
+
+    def is_pending(self, cmd: str) -> bool:
+        """
+        * Ожидает ли ответа такая же команда
+        """
+        name: str = cmd.strip().split(" ", 1)[0].lower()
+        return any(command.name == name for command in self._pending)
+
+    def get_pending(self, cmd: str) -> Optional[Future]:
+        """
+        * Future ожидающей ответа точно такой же команды (None - такой нет)
+        """
+        cmd = cmd.strip()
+        return next((command.future for command in self._pending if command.cmd.strip() == cmd), None)
+
+    def claim(self, events: List[ProtocolEvent]) -> List[str]:
+        """
+        * Распределение входящих строк по ожидающим командам
+        *
+        * @param events События протокола в порядке строк
+        * @return Строки, не относящиеся ни к одной команде (для чата)
+        """
+        if len(self._pending) == 0:
+            return [event.line for event in events]
+        unclaimed: List[str] = []
+        for event in events:
+            for command in self._pending:
+                if command.accepts(event):
+                    command.lines.append(event.line)
+                    command.completion.feed([event.line])
+                    if command.completion.is_done:
+                        self._pending.remove(command)
+                        self._finish(command)
+                    break
+            else:
+                unclaimed.append(event.line)
+        return unclaimed
+
+    def expire(self) -> None:
+        """
+        * Завершение команд, ответ на которые закончился по тишине или крайнему сроку
+        """
+        for command in [command for command in self._pending if command.completion.next_wait() <= 0]:
+            self._pending.remove(command)
+            self._finish(command)
+
+    def get_wake_time(self) -> Optional[float]:
+        """
+        * Момент (time.monotonic()), когда нужно вызвать expire() (None - команд нет)
+        """
+        if len(self._pending) == 0:
+            return None
+        return time.monotonic() + min(command.completion.next_wait() for command in self._pending)
+
+    def fail_all(self, error: Exception) -> None:
+        """
+        * Завершение всех ожидающих команд ошибкой (соединение разорвано)
+        """
+        while len(self._pending) > 0:
+            command: PendingCommand = self._pending.popleft()
+            if not command.future.done():
+                command.future.set_exception(error)
+
+    def _finish(self, command: PendingCommand) -> None:
+        METRICS.observe(f"rtt {command.name}", (time.perf_counter() - command.started) * 1000.0)
+        if not command.future.done(): # вызывающий мог отменить ожидание
+            command.future.set_result(command.lines)
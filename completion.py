@@ -0,0 +1,135 @@
+"""
+* Определение момента завершения ответа сервера DMconnect
+* *************************
+* Вместо фиксированной паузы после отправки команды ответ
+* считается завершённым, как только:
+* 1) получена строка-признак конца ответа на команду
+*    (например, "Joined server ... successfully.") или все строки
+*    ответа из нескольких строк (например, ответа на "/login"), в
+*    любом порядке;
+* 2) получено приглашение сервера ("Enter command ...");
+* 3) после последней порции данных прошёл короткий интервал
+*    тишины (idle gap);
+* 4) истёк крайний срок (deadline) для команды.
+"""
+
+from typing import Optional, List, Dict, Tuple, Set
+import time
+
+IDLE_GAP: float = 0.3 # интервал тишины, после которого ответ считается завершённым (в секундах)
+NO_REPLY_DEADLINE: float = 0.5 # крайний срок для команд, на которые сервер не присылает явного ответа (в секундах)
+
+# Строки-признаки конца ответа для команд, на которые сервер отвечает явно
+COMMAND_TERMINATORS: Dict[str, Tuple[str, ...]] = {
+    "/login": ("Login failed", "Invalid username or password"),
+    "/register": ("Select a server using", "Registration failed"),
+    "/join_server": ("Joined server ",),
+    "/members": ("Members in ",),
+}
+
+# Ответы из нескольких строк: ответ завершён, когда получены строки со всеми префиксами
+# (сервер может присылать их в разном порядке, см. backtrace.txt)
+COMMAND_BLOCKS: Dict[str, Tuple[str, ...]] = {
+    "/login": ("Login successful", "Available servers: ", "Select a server using"),
+}
+
+# Приглашения сервера: после них сервер ничего не пришлёт, пока не получит команду
+PROMPTS: Tuple[str, ...] = ("Enter command",)
+
+class ResponseCompletion:
+
+    terminators: Tuple[str, ...] = ()
+    block: Tuple[str, ...] = () # префиксы строк ответа из нескольких строк
+    missing: Set[str] = set() # префиксы строк ответа, которые ещё не получены
+    deadline: float = 0.0 # момент времени (time.monotonic()), после которого ожидание прекращается
+    idle_gap: float = IDLE_GAP
+    last_data: Optional[float] = None # момент получения последней порции данных
+    is_done: bool = False
+
+    def __init__(self, cmd: str, deadline: Optional[float] = None, idle_gap: float = IDLE_GAP):
+        """
+        * @param cmd Команда, ответ на которую ожидается
+        * @param deadline Крайний срок ожидания ответа (в секундах от текущего момента);
+        *        если не задан, используется NO_REPLY_DEADLINE для команд без явного ответа
+        * @param idle_gap Интервал тишины, завершающий ответ (в секундах)
+        """
+        self.terminators = ResponseCompletion.get_terminators(cmd)
+        self.block = ResponseCompletion.get_block(cmd)
+        self.missing = set(self.block)
+        if deadline is None:
+            deadline = NO_REPLY_DEADLINE
+        self.deadline = time.monotonic() + deadline
+        self.idle_gap = idle_gap
+        self.last_data = None
+        self.is_done = False
+
+    @staticmethod
+    def get_terminators(cmd: str) -> Tuple[str, ...]:
+        """
+        * Строки-признаки конца ответа для команды
+        *
+        * @param cmd Команда
+        * @return Кортеж префиксов строк
+        """
+        name: str = cmd.strip().split(" ", 1)[0].lower()
+        return COMMAND_TERMINATORS.get(name, ())
+
+    @staticmethod
+    def get_block(cmd: str) -> Tuple[str, ...]:
+        """
+        * Префиксы всех строк ответа на команду из нескольких строк
+        *
+        * @param cmd Команда
+        * @return Кортеж префиксов строк (пустой - ответ из одной строки)
+        """
+        name: str = cmd.strip().split(" ", 1)[0].lower()
+        return COMMAND_BLOCKS.get(name, ())
+
+    @staticmethod
+    def expects_reply(cmd: str) -> bool:
+        """
+        * Присылает ли сервер явный ответ на команду
+        *
+        * @param cmd Команда
+        * @return True, если ответ имеет известный признак конца
+        """
+        return len(ResponseCompletion.get_terminators(cmd)) > 0 or len(ResponseCompletion.get_block(cmd)) > 0
+
+    def feed(self, lines: List[str]) -> None:
+        """
+        * Учёт очередной порции строк ответа
+        *
+        * @param lines Массив строк
+        """
+        if len(lines) == 0:
+            return
+        self.last_data = time.monotonic()
+        for line in lines:
+            if len(self.terminators) > 0 and line.startswith(self.terminators):
+                self.is_done = True
+                break
+            if len(self.block) > 0: # ответ из нескольких строк проверяется целиком, приглашение его не завершает
+                self.missing.difference_update([prefix for prefix in self.missing if line.startswith(prefix)])
+                if len(self.missing) == 0:
+                    self.is_done = True
+                    break
+            elif line.startswith(PROMPTS):
+                self.is_done = True
+                break
+
+    def next_wait(self) -> float:
+        """
+        * Сколько ещё ждать данных от сервера
+        *
+        * @return Время ожидания в секундах (0 - ответ завершён)
+        """
+        if self.is_done:
+            return 0.0
+        now: float = time.monotonic()
+        wait: float = self.deadline - now
+        if self.last_data is not None: # данные уже были - ждём не дольше интервала тишины
+            wait = min(wait, self.last_data + self.idle_gap - now)
+        if wait <= 0:
+            self.is_done = True
+            return 0.0
+        return wait
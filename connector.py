@@ -0,0 +1,163 @@
+"""
+* Установка TCP-соединения с сервером DMconnect
+* *************************
+* Имя сервера разрешается через getaddrinfo() во все адреса (IPv4
+* и IPv6), результат кэшируется на DNS_TTL секунд, поэтому
+* переподключения не обращаются к DNS повторно. Попытки подключения
+* к адресам запускаются со сдвигом в ATTEMPT_DELAY секунд,
+* чередуя семейства адресов ("Happy Eyeballs", RFC 8305):
+* первое успешное соединение используется, остальные попытки
+* прерываются. Если попытка завершилась ошибкой, следующая
+* запускается сразу. Все попытки ограничены общим крайним сроком
+* и могут быть отменены.
+"""
+
+from typing import Optional, List, Dict, Tuple
+from socket import socket, getaddrinfo, AF_UNSPEC, SOCK_STREAM, SOL_SOCKET, SO_ERROR
+import threading
+import selectors
+import errno
+import time
+import os
+
+from metrics import METRICS
+
+CONNECT_TIMEOUT: float = 5.0 # крайний срок установки TCP-соединения (в секундах)
+CANCEL_CHECK_INTERVAL: float = 0.1 # период проверки отмены подключения во время ожидания (в секундах)
+ATTEMPT_DELAY: float = 0.25 # сдвиг между запусками попыток подключения к разным адресам (в секундах)
+DNS_TTL: float = 5 * 60 # время жизни адресов сервера в кэше (в секундах)
+IN_PROGRESS: Tuple[int, ...] = (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY) # connect_ex() неблокирующего сокета
+
+Address = Tuple[int, tuple] # (семейство адресов, адрес сокета)
+
+class ConnectCancelled(Exception):
+    """
+    * Подключение к серверу отменено пользователем
+    """
+
+def interleave(addresses: List[Address]) -> List[Address]:
+    """
+    * Чередование семейств адресов: первым остаётся семейство первого адреса
+    * (порядок getaddrinfo() учитывает предпочтения системы)
+    *
+    * @param addresses Адреса в порядке getaddrinfo()
+    * @return Адреса вида v6, v4, v6, v4, ... (или v4, v6, ...)
+    """
+    by_family: Dict[int, List[Address]] = {}
+    for address in addresses:
+        by_family.setdefault(address[0], []).append(address)
+    groups: List[List[Address]] = list(by_family.values())
+    result: List[Address] = []
+    for index in range(max((len(group) for group in groups), default=0)):
+        result.extend(group[index] for group in groups if index < len(group))
+    return result
+
+class ResolverCache:
+    """
+    * Кэш адресов серверов (общий для всех сеансов и потоков)
+    """
+
+    def __init__(self, ttl: float = DNS_TTL):
+        """
+        * @param ttl Время жизни записи (в секундах)
+        """
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, int], Tuple[float, List[Address]]] = {} # (хост, порт) -> (срок годности, адреса)
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> List[Address]:
+        """
+        * Адреса сервера (из кэша или от getaddrinfo())
+        *
+        * @param host Доменное имя хоста или IP-адрес
+        * @param port TCP-порт
+        * @return Список адресов в порядке попыток подключения
+        """
+        key: Tuple[str, int] = (host.lower(), port)
+        now: float = time.monotonic()
+        with self._lock:
+            entry: Optional[Tuple[float, List[Address]]] = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                METRICS.add("dns_cache_hits")
+                return list(entry[1])
+        METRICS.add("dns_lookups")
+        addresses: List[Address] = []
+        for family, _, _, _, sockaddr in getaddrinfo(host, port, AF_UNSPEC, SOCK_STREAM): # разрешение имени - без блокировки кэша
+            if (family, sockaddr) not in addresses:
+                addresses.append((family, sockaddr))
+        addresses = interleave(addresses)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, addresses)
+        return list(addresses)
+
+    def invalidate(self, host: Optional[str] = None, port: Optional[int] = None) -> None:
+        """
+        * Удаление адресов сервера из кэша (все записи, если хост не указан)
+        """
+        with self._lock:
+            if host is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((host.lower(), port), None)
+
+RESOLVER: ResolverCache = ResolverCache() # кэш адресов процесса
+
+def connect_first(addresses: List[Address], timeout: float = CONNECT_TIMEOUT, cancel: Optional[threading.Event] = None, attempt_delay: float = ATTEMPT_DELAY) -> socket:
+    """
+    * Параллельные попытки подключения со сдвигом: побеждает первое соединение
+    *
+    * @param addresses Адреса в порядке попыток
+    * @param timeout Общий крайний срок (в секундах)
+    * @param cancel Признак отмены подключения
+    * @param attempt_delay Сдвиг между запусками попыток (в секундах)
+    * @return Подключённый сокет (в неблокирующем режиме)
+    """
+    pending: List[Address] = list(addresses)
+    attempts: Dict[socket, tuple] = {} # выполняющиеся попытки: сокет -> адрес
+    selector = selectors.DefaultSelector()
+    winner: Optional[socket] = None
+    last_error: Optional[Exception] = None
+    deadline: float = time.monotonic() + timeout
+    next_start: float = time.monotonic()
+    try:
+        while winner is None:
+            if cancel is not None and cancel.is_set():
+                raise ConnectCancelled("Подключение отменено.")
+            now: float = time.monotonic()
+            if len(pending) > 0 and (now >= next_start or len(attempts) == 0): # пора запустить следующую попытку
+                family, sockaddr = pending.pop(0)
+                s: socket = socket(family, SOCK_STREAM)
+                METRICS.add("connect_attempts")
+                try:
+                    s.setblocking(False)
+                    error: int = s.connect_ex(sockaddr)
+                    if error not in IN_PROGRESS:
+                        raise OSError(error, os.strerror(error))
+                    selector.register(s, selectors.EVENT_WRITE) # в Windows ошибка подключения тоже будит селектор
+                    attempts[s] = sockaddr
+                    next_start = now + attempt_delay
+                except OSError as e:
+                    s.close()
+                    last_error = e
+                continue
+            if len(attempts) == 0: # адреса кончились, все попытки неудачны
+                raise last_error if last_error is not None else OSError(errno.EHOSTUNREACH, "Не найдено ни одного адреса сервера.")
+            if now >= deadline:
+                raise TimeoutError(f"Сервер не ответил за {timeout:g} с.")
+            wait: float = min(deadline, next_start) if len(pending) > 0 else deadline
+            for key, _ in selector.select(min(max(0.0, wait - now), CANCEL_CHECK_INTERVAL)):
+                s = key.fileobj
+                selector.unregister(s)
+                sockaddr = attempts.pop(s)
+                error = s.getsockopt(SOL_SOCKET, SO_ERROR)
+                if error == 0:
+                    winner = s
+                    break
+                s.close()
+                last_error = OSError(error, f"{os.strerror(error)} ({sockaddr[0]})")
+                next_start = time.monotonic() # неудача - следующий адрес пробуем сразу
+    finally:
+        for s in attempts: # проигравшие и незавершённые попытки прерываются
+            s.close()
+        selector.close()
+    return winner
@@ -0,0 +1,144 @@
+"""
+* Инкрементальный разбор потока байтов на строки
+* *************************
+* Данные от сервера DMconnect приходят TCP-сегментами произвольной
+* длины: один сегмент может содержать несколько строк, а строка
+* (и даже многобайтовый символ UTF-8) может быть разрезана между
+* сегментами. Класс накапливает байты в буфере между вызовами и
+* возвращает только завершённые строки, декодированные в заданной
+* кодировке (utf-8, cp1251, cp866 и т.д.).
+"""
+
+from typing import List, Tuple
+from socket import socket
+import codecs
+import select
+
+from metrics import METRICS
+
+DEFAULT_CODEPAGE: str = "utf-8" # кодировка по умолчанию
+LINE_SEPARATOR: bytes = b"\n" # признак конца строки в потоке
+MAX_LINE_BYTES: int = 1024 * 1024 # максимальный размер строки без признака конца (защита от переполнения буфера)
+RECV_BUFFER_SIZE: int = 32768 # размер буфера одного чтения из сокета
+
+class LineFramer:
+
+    codepage: str = DEFAULT_CODEPAGE
+
+    def __init__(self, codepage: str = DEFAULT_CODEPAGE):
+        """
+        * @param codepage Кодировка потока
+        """
+        codecs.lookup(codepage) # проверка кодировки (LookupError для неизвестной)
+        self.codepage = codepage
+        self._buffer: bytearray = bytearray()
+
+    def _decode(self, data) -> str:
+        """
+        * Декодирование завершённой строки (строки разделяются по байту
+        * "\n", поэтому многобайтовый символ никогда не разрезан границей
+        * строки и состояние декодера между строками не нужно)
+        *
+        * @param data Фрагмент (memoryview/bytes)
+        * @return Строка без завершающего "\r"
+        """
+        line: str = str(data, self.codepage, "replace")
+        if line.endswith("\r"):
+            line = line[:-1]
+        return line
+
+    def feed(self, data: bytes) -> List[str]:
+        """
+        * Добавление очередной порции байтов
+        *
+        * @param data Байты, полученные из сокета
+        * @return Массив завершённых строк (в порядке получения)
+        """
+        lines: List[str] = []
+        if len(data) == 0:
+            return lines
+        self._buffer += data
+        start: int = 0
+        view = memoryview(self._buffer)
+        try:
+            while True:
+                end: int = self._buffer.find(LINE_SEPARATOR, start)
+                if end < 0:
+                    break
+                lines.append(self._decode(view[start:end]))
+                start = end + 1
+            if len(self._buffer) - start > MAX_LINE_BYTES: # слишком длинная строка - отдаём как есть
+                lines.append(self._decode(view[start:]))
+                start = len(self._buffer)
+        finally:
+            view.release()
+        if start > 0:
+            del self._buffer[:start]
+        return lines
+
+    def partial(self) -> str:
+        """
+        * Незавершённый хвост буфера (например, приглашение сервера без
+        * признака конца строки) без его извлечения
+        *
+        * @return Строка (неполный многобайтовый символ в конце отбрасывается)
+        """
+        return self._buffer.decode(self.codepage, errors="ignore")
+
+    def flush(self) -> str:
+        """
+        * Извлечение незавершённого хвоста буфера как отдельной строки
+        *
+        * @return Строка
+        """
+        line: str = self._decode(self._buffer)
+        self._buffer.clear()
+        return line
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+class SocketReader:
+    """
+    * Долгоживущий буферизованный читатель сокета (один на соединение).
+    * Непрочитанный хвост потока хранится между вызовами и не теряется.
+    """
+
+    sock: socket = None
+    framer: LineFramer = None
+    is_eof: bool = False # сервер закрыл соединение
+
+    def __init__(self, sock: socket, codepage: str = DEFAULT_CODEPAGE):
+        """
+        * @param sock Экземпляр сокета
+        * @param codepage Кодировка потока
+        """
+        self.sock = sock
+        self.framer = LineFramer(codepage)
+        self.is_eof = False
+
+    def drain(self, prompts: Tuple[str, ...] = ()) -> List[str]:
+        """
+        * Неблокирующее вычитывание всего, что уже пришло в сокет
+        *
+        * @param prompts Префиксы приглашений сервера, которые приходят
+        *        без признака конца строки и отдаются сразу
+        * @return Массив завершённых строк (пустой, если данных нет)
+        """
+        lines: List[str] = []
+        while not self.is_eof:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            if not readable:
+                break
+            data: bytes = self.sock.recv(RECV_BUFFER_SIZE)
+            if len(data) == 0: # EOF - сервер закрыл соединение
+                self.is_eof = True
+                break
+            METRICS.add("bytes_in", len(data))
+            lines.extend(self.framer.feed(data))
+            if len(data) < RECV_BUFFER_SIZE: # сокет вычитан полностью, лишний select() не нужен
+                break
+        if len(self.framer) > 0:
+            if self.is_eof or (len(prompts) > 0 and self.framer.partial().startswith(prompts)):
+                lines.append(self.framer.flush())
+        return lines
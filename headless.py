@@ -0,0 +1,396 @@
+"""
+* Клиент DMconnect без графического интерфейса
+* *************************
+* Консольный режим для серверов: журналирование чата, боты, мосты.
+* Модуль не импортирует tkinter и не требует дисплея. Параметры
+* подключения берутся из файла настроек, переменных окружения
+* (DMCONNECT_HOST, DMCONNECT_PORT, DMCONNECT_LOGIN,
+* DMCONNECT_PASSWORD, DMCONNECT_ROOM) или аргументов командной
+* строки. Входящие строки выводятся в stdout (текстом или в формате
+* JSON Lines), каждая строка stdin отправляется серверу как
+* сообщение или команда (через очередь исходящих сообщений с
+* ограничением скорости). Служебные сообщения выводятся в stderr.
+* По сигналу SIGUSR1 метрики (см. metrics.py) записываются в файл.
+* Запуск:
+* $ python3 main.py --headless [--jsonl] [--host HOST] [--port PORT] [--login LOGIN] [--room ROOM]
+"""
+
+from typing import Optional, List
+import sys
+import json
+import time
+import queue
+import signal
+import socket
+import argparse
+import selectors
+import threading
+
+from session import DMconnectSession
+from scheduler import PollScheduler
+from reconnect import ReconnectSupervisor, RECONNECT_MIN_DELAY, STATE_CONNECTED
+from outbound import OutboundQueue, OutgoingMessage, MAX_MESSAGE_BYTES, STATUS_DROPPED
+from store import MessageStore
+from metrics import METRICS, METRICS_FILE, MetricsDumper
+from miscellaneous import Miscellaneous
+
+SERVER_POLL_INTERVAL: float = 30.0 # период полного опроса сервера (список пользователей, ping) в секундах
+OUTPUT_TEXT: str = "text" # вывод строк чата как есть
+OUTPUT_JSONL: str = "jsonl" # вывод строк чата объектами JSON, по одному в строке
+
+class HeadlessClient:
+
+    session: Optional[DMconnectSession] = None
+    output_format: str = OUTPUT_TEXT
+    exit_on_eof: bool = False # завершать работу при закрытии stdin
+    members_version: int = -1 # версия кэша участников, последней выведенная в stdout
+    message_store: Optional[MessageStore] = None # постоянное хранилище сообщений (как в графическом клиенте)
+    supervisor: Optional[ReconnectSupervisor] = None # восстановление разорванного соединения
+    next_poll: float = 0.0 # момент следующего полного опроса сервера
+    outbound: Optional[OutboundQueue] = None # очередь исходящих сообщений
+    input_closed: bool = False # stdin закрыт
+
+    def __init__(self, session: DMconnectSession, output_format: str = OUTPUT_TEXT, exit_on_eof: bool = False, out=None):
+        """
+        * @param session Сетевой сеанс DMconnect
+        * @param output_format OUTPUT_TEXT или OUTPUT_JSONL
+        * @param exit_on_eof Завершать работу при закрытии stdin
+        * @param out Поток вывода строк чата (по умолчанию - sys.stdout)
+        """
+        self.session = session
+        self.output_format = output_format
+        self.exit_on_eof = exit_on_eof
+        self.out = out if out is not None else sys.stdout
+        self.input_queue: queue.Queue = queue.Queue() # строки stdin (None - конец ввода)
+        self.stop_event = threading.Event()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair() # self-pipe для пробуждения цикла
+        self.wakeup_reader.setblocking(False)
+        self.poll_scheduler = PollScheduler(session.poll_min_ms, session.poll_max_ms)
+        self.outbound = OutboundQueue(session, session.send_rate, session.send_burst, MAX_MESSAGE_BYTES, session.outbox_size, self.on_delivery_status)
+        METRICS.gauge("input_queue", self.input_queue.qsize)
+        METRICS.gauge("outbound_queue", lambda: len(self.outbound))
+        if not "".__eq__(session.history_db):
+            try:
+                self.message_store = MessageStore(session.history_db)
+            except Exception as e:
+                Miscellaneous.print_message(f"История чата не будет сохраняться: {e}")
+                self.message_store = None
+
+    def wake(self) -> None:
+        """
+        * Пробуждение основного цикла (из другого потока или обработчика сигнала)
+        """
+        try:
+            self.wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def dump_metrics(self, *args) -> None:
+        """
+        * Запись метрик в файл JSON по запросу (подходит как обработчик сигнала)
+        """
+        path: str = self.session.metrics_file if not "".__eq__(self.session.metrics_file) else METRICS_FILE
+        try:
+            METRICS.dump(path)
+        except OSError as e:
+            Miscellaneous.print_message(f"Ошибка записи метрик: {e}")
+
+    def stop(self, *args) -> None:
+        """
+        * Запрос на завершение работы (подходит как обработчик сигнала)
+        """
+        self.stop_event.set()
+        self.wake()
+
+    def emit(self, lines: List[str]) -> None:
+        """
+        * Вывод строк чата в stdout
+        *
+        * @param lines Массив строк
+        """
+        if len(lines) == 0:
+            return
+        started: float = time.perf_counter()
+        session: DMconnectSession = self.session
+        if self.output_format == OUTPUT_JSONL:
+            now: float = time.time()
+            for line in lines:
+                author, text = MessageStore.parse_author(line)
+                self.out.write(json.dumps({"type": "message", "ts": now, "server": session.server, "room": session.room, "author": author, "text": text}, ensure_ascii=False) + "\n")
+        else:
+            for line in lines:
+                self.out.write(line + "\n")
+        self.out.flush()
+        METRICS.observe("output_batch", (time.perf_counter() - started) * 1000.0)
+        if self.message_store is not None:
+            for line in lines:
+                self.message_store.add(line, session.server, session.room)
+
+    def emit_members(self) -> None:
+        """
+        * Вывод списка участников чата, если он изменился (только в формате JSON Lines)
+        """
+        members = self.session.members
+        if members is None or members.version == self.members_version:
+            return
+        self.members_version = members.version
+        if self.output_format == OUTPUT_JSONL:
+            self.out.write(json.dumps({"type": "members", "ts": time.time(), "server": self.session.server, "room": self.session.room, "users": members.get_users()}, ensure_ascii=False) + "\n")
+            self.out.flush()
+
+    def on_delivery_status(self, message: OutgoingMessage) -> None:
+        """
+        * Смена состояния исходящего сообщения: в формате JSON Lines - в stdout,
+        * иначе в stderr выводятся только неотправленные сообщения
+        """
+        if self.output_format == OUTPUT_JSONL:
+            self.out.write(json.dumps({"type": "delivery", "ts": time.time(), "server": self.session.server, "id": message.id, "status": message.status, "text": message.text}, ensure_ascii=False) + "\n")
+            self.out.flush()
+        elif message.status == STATUS_DROPPED:
+            Miscellaneous.print_message(f"Сообщение не отправлено: {message.text}")
+
+    def parse_input(self, line: str) -> Optional[str]:
+        """
+        * Строка stdin в сообщение для сервера. В формате JSON Lines
+        * ожидается объект {"text": "..."}, иначе строка берётся как есть.
+        *
+        * @param line Строка stdin
+        * @return Сообщение или команда либо None, если отправлять нечего
+        """
+        line = line.rstrip("\r\n")
+        if self.output_format == OUTPUT_JSONL and line.lstrip().startswith("{"):
+            try:
+                obj = json.loads(line)
+                line = str(obj.get("text", "")) if isinstance(obj, dict) else ""
+            except ValueError:
+                pass
+        return line if not "".__eq__(line.strip()) else None
+
+    def _stdin_loop(self) -> None:
+        """
+        * Поток чтения stdin (блокирующее чтение работает на всех платформах)
+        """
+        try:
+            for line in sys.stdin:
+                self.input_queue.put(line)
+                self.wake()
+        except (OSError, ValueError):
+            pass
+        self.input_queue.put(None)
+        self.wake()
+
+    def _drain_wakeups(self) -> None:
+        """
+        * Вычитывание байтов пробуждения из self-pipe
+        """
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _process_input(self) -> None:
+        """
+        * Постановка всех накопившихся строк stdin в очередь исходящих сообщений
+        """
+        while True:
+            try:
+                line = self.input_queue.get_nowait()
+            except queue.Empty:
+                return
+            if line is None: # stdin закрыт
+                self.input_closed = True
+                continue
+            message: Optional[str] = self.parse_input(line)
+            if message is not None: # при разрыве сообщение ждёт переподключения в очереди
+                self.outbound.submit(message)
+                self.poll_scheduler.on_activity()
+
+    def _poll_server(self) -> None:
+        """
+        * Полный опрос сервера: новые сообщения, ping и список пользователей
+        """
+        session: DMconnectSession = self.session
+        self.emit(session.get_messages_for_chat())
+        session.get_user_list()
+        if len(session.left_for_chat) > 0:
+            self.emit(list(session.left_for_chat))
+            session.left_for_chat.clear()
+        self.emit_members()
+
+    def connect(self) -> bool:
+        """
+        * Подключение к серверу и вход в комнату (если она задана)
+        *
+        * @return True, если подключение установлено
+        """
+        session: DMconnectSession = self.session
+        if not session.is_connected:
+            session.establish_connection(session.host, session.port, session.login, session.password)
+        if session.is_connected and not "".__eq__(session.default_room):
+            self.emit(session.execute_command(session.sock, f"/join_server {session.default_room}"))
+        return session.is_connected
+
+    def _watch(self, selector: selectors.BaseSelector, watched_sock):
+        """
+        * Приведение регистрации сокета сервера в selector'е к состоянию соединения
+        *
+        * @return Зарегистрированный сокет или None
+        """
+        session: DMconnectSession = self.session
+        sock = session.sock if session.is_connected and not session.is_native else None
+        if sock is watched_sock:
+            return watched_sock
+        if watched_sock is not None:
+            try:
+                selector.unregister(watched_sock)
+            except (KeyError, ValueError, OSError):
+                pass
+        if sock is not None:
+            try:
+                selector.register(sock, selectors.EVENT_READ)
+                return sock
+            except (KeyError, ValueError, OSError):
+                pass
+        return None
+
+    def on_connection_state(self, supervisor: ReconnectSupervisor) -> None:
+        """
+        * Смена состояния соединения: сообщение в stderr и (в формате JSON Lines) в stdout
+        """
+        Miscellaneous.print_message(supervisor.get_status_text())
+        if supervisor.state == STATE_CONNECTED:
+            self.next_poll = time.monotonic() # после переподключения список участников нужно получить заново
+        if self.output_format == OUTPUT_JSONL:
+            self.out.write(json.dumps({"type": "state", "ts": time.time(), "server": self.session.server, "state": supervisor.state, "attempt": supervisor.attempt}, ensure_ascii=False) + "\n")
+            self.out.flush()
+        if supervisor.state == STATE_CONNECTED and len(self.session.left_for_chat) > 0: # ответ на повторный вход в комнату
+            self.emit(list(self.session.left_for_chat))
+            self.session.left_for_chat.clear()
+
+    def run(self) -> int:
+        """
+        * Основной цикл: ожидание данных от сервера и строк stdin в selector'е.
+        * Разорванное соединение восстанавливается автоматически.
+        *
+        * @return Код завершения программы
+        """
+        session: DMconnectSession = self.session
+        try:
+            if not self.connect():
+                Miscellaneous.print_message("Не удалось подключиться к серверу.")
+                return 1
+        except Exception as e:
+            Miscellaneous.print_message(f"Ошибка подключения к серверу: {e}")
+            return 1
+        supervisor: ReconnectSupervisor = ReconnectSupervisor(session, RECONNECT_MIN_DELAY, session.reconnect_max_delay, self.on_connection_state)
+        self.supervisor = supervisor
+        threading.Thread(target=self._stdin_loop, daemon=True).start()
+        selector = selectors.DefaultSelector()
+        selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        watched_sock = None
+        self.next_poll = time.monotonic() # первый полный опрос - сразу после подключения
+        next_tick: float = time.monotonic()
+        send_at: Optional[float] = None # момент, когда можно отправить следующую строку из очереди
+        dumper: Optional[MetricsDumper] = None
+        if not "".__eq__(session.metrics_file):
+            dumper = MetricsDumper(session.metrics_file, session.metrics_interval).start()
+        try:
+            while not self.stop_event.is_set():
+                supervisor.check()
+                watched_sock = self._watch(selector, watched_sock)
+                now: float = time.monotonic()
+                wake_at: float = self.next_poll if watched_sock is not None else min(self.next_poll, next_tick)
+                reconnect_at: Optional[float] = supervisor.get_wake_time()
+                if reconnect_at is not None:
+                    wake_at = min(wake_at, reconnect_at)
+                if send_at is not None:
+                    wake_at = min(wake_at, send_at)
+                reply_at: Optional[float] = session.commands.get_wake_time() # крайний срок ответа на команду
+                if reply_at is not None:
+                    wake_at = min(wake_at, reply_at)
+                sock_ready: bool = False
+                try:
+                    events = selector.select(max(0.0, wake_at - now))
+                except (ValueError, OSError): # сокет закрыт - регистрация будет исправлена в _watch()
+                    events = []
+                cycle_started: float = time.perf_counter()
+                for key, _ in events:
+                    if key.fileobj is self.wakeup_reader:
+                        self._drain_wakeups()
+                    else:
+                        sock_ready = True
+                self._process_input()
+                send_at = self.outbound.pump()
+                session.commands.expire()
+                if self.input_closed and self.exit_on_eof and (len(self.outbound) == 0 or not session.is_connected):
+                    break # stdin закрыт и всё, что можно, отправлено
+                if not session.is_connected:
+                    continue
+                now = time.monotonic()
+                is_tick: bool = (watched_sock is None and now >= next_tick)
+                try:
+                    if sock_ready or is_tick:
+                        lines: List[str] = session.read_socket(session.sock)
+                        self.emit(lines)
+                        self.emit_members()
+                        if len(lines) > 0:
+                            self.poll_scheduler.on_activity()
+                        elif is_tick:
+                            self.poll_scheduler.on_idle()
+                    if now >= self.next_poll:
+                        self._poll_server()
+                        self.next_poll = time.monotonic() + SERVER_POLL_INTERVAL
+                except Exception as e: # соединение разорвано - его восстановит супервизор
+                    Miscellaneous.print_message(f"Ошибка обмена данными с сервером: {e}")
+                if is_tick:
+                    next_tick = now + self.poll_scheduler.get_interval()
+                METRICS.observe("poll_cycle", (time.perf_counter() - cycle_started) * 1000.0)
+        finally:
+            supervisor.stop()
+            selector.close()
+            if dumper is not None: # последняя запись метрик
+                dumper.stop()
+            if self.message_store is not None:
+                self.message_store.close()
+        session.close()
+        return 0
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """
+    * Разбор аргументов командной строки
+    """
+    parser = argparse.ArgumentParser(prog="main.py --headless", description="Клиент DMconnect без графического интерфейса.")
+    parser.add_argument("--headless", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--jsonl", action="store_true", help="ввод и вывод в формате JSON Lines")
+    parser.add_argument("--host", help="хост сервера DMconnect")
+    parser.add_argument("--port", help="TCP-порт сервера DMconnect")
+    parser.add_argument("--login", help="логин (пароль - только в файле настроек или в DMCONNECT_PASSWORD)")
+    parser.add_argument("--room", help="комната, в которую нужно войти после подключения")
+    parser.add_argument("--exit-on-eof", action="store_true", help="завершить работу при закрытии stdin")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    out = sys.stdout
+    sys.stdout = sys.stderr # служебные сообщения - в stderr, stdout - только строки чата
+    session: DMconnectSession = DMconnectSession()
+    for key in ("host", "port", "login", "room"): # аргументы командной строки имеют приоритет
+        value: Optional[str] = getattr(args, key)
+        if value is not None:
+            session.set_credential(key, value.strip())
+    if not session.is_connected and not session.has_credentials(): # в режиме отладки подключение не требуется
+        Miscellaneous.print_message("Не заданы параметры подключения (host, port, login, password).")
+        return 2
+    client: HeadlessClient = HeadlessClient(session, OUTPUT_JSONL if args.jsonl else OUTPUT_TEXT, args.exit_on_eof, out)
+    signal.signal(signal.SIGINT, client.stop)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, client.stop)
+    if hasattr(signal, "SIGUSR1"): # $ kill -USR1 <pid> - запись метрик в файл
+        signal.signal(signal.SIGUSR1, client.dump_metrics)
+    code: int = client.run()
+    Miscellaneous.print_message("Работа программы завершена.")
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+* История чата вне виджета Text
+* *************************
+* Последние строки хранятся в памяти в кольцевом буфере, а строки,
+* вытесненные из него, дописываются в файл-сегмент на диске (только
+* добавление в конец). Для быстрого чтения старых страниц в памяти
+* хранится лишь смещение начала каждой PAGE_LINES-й строки файла,
+* поэтому расход памяти не растёт вместе с длиной истории.
+* Виджет чата показывает только окно из нескольких сотен строк и
+* подгружает более старые страницы по мере прокрутки вверх.
+"""
+
+from typing import Optional, List
+from collections import deque
+from array import array
+from itertools import islice
+import os
+import tempfile
+
+RING_SIZE: int = 2000 # число последних строк, хранимых в памяти
+PAGE_LINES: int = 200 # число строк в странице (шаг индекса файла и размер подгрузки)
+HISTORY_CODEPAGE: str = "utf-8" # кодировка файла истории
+FILE_PREFIX: str = "dmconnect_history_" # префикс имени файла истории
+
+class ChatHistory:
+
+    count: int = 0 # общее число строк в истории (номер следующей строки)
+    spilled: int = 0 # число строк, вытесненных на диск (строки с номерами [0, spilled))
+    path: Optional[str] = None # путь к файлу-сегменту
+
+    def __init__(self, ring_size: int = RING_SIZE, directory: Optional[str] = None):
+        """
+        * @param ring_size Размер кольцевого буфера в памяти (в строках)
+        * @param directory Каталог для файла истории (по умолчанию - временный каталог системы)
+        """
+        self.ring_size = max(1, ring_size)
+        self._ring: deque = deque()
+        self._page_offsets: array = array("Q") # смещение в файле первой строки каждой страницы
+        self._file_size: int = 0
+        self._writer = None
+        self._reader = None
+        self.count = 0
+        self.spilled = 0
+        fd, self.path = tempfile.mkstemp(prefix=FILE_PREFIX, suffix=".txt", dir=directory)
+        os.close(fd)
+
+    def _spill(self, line: str) -> None:
+        """
+        * Дописывание вытесненной из памяти строки в файл
+        *
+        * @param line Строка
+        """
+        if self._writer is None:
+            self._writer = open(self.path, "ab")
+        if self.spilled % PAGE_LINES == 0:
+            self._page_offsets.append(self._file_size)
+        data: bytes = (line.replace("\n", " ") + "\n").encode(HISTORY_CODEPAGE)
+        self._writer.write(data)
+        self._file_size += len(data)
+        self.spilled += 1
+
+    def append(self, line: str) -> int:
+        """
+        * Добавление строки в историю
+        *
+        * @param line Строка
+        * @return Номер строки
+        """
+        if len(self._ring) >= self.ring_size:
+            self._spill(self._ring.popleft())
+        self._ring.append(line)
+        self.count += 1
+        return self.count - 1
+
+    def extend(self, lines: List[str]) -> None:
+        """
+        * Добавление массива строк в историю
+        *
+        * @param lines Массив строк
+        """
+        for line in lines:
+            self.append(line)
+
+    def _read_spilled(self, start: int, end: int) -> List[str]:
+        """
+        * Чтение строк [start, end) из файла
+        """
+        if self._writer is not None:
+            self._writer.flush()
+        if self._reader is None:
+            self._reader = open(self.path, "rb")
+        page: int = start // PAGE_LINES
+        self._reader.seek(self._page_offsets[page])
+        for _ in range(start - page * PAGE_LINES): # пропускаем строки до начала диапазона внутри страницы
+            self._reader.readline()
+        lines: List[str] = []
+        for _ in range(end - start):
+            lines.append(self._reader.readline().decode(HISTORY_CODEPAGE, errors="replace").rstrip("\n"))
+        return lines
+
+    def get_range(self, start: int, end: int) -> List[str]:
+        """
+        * Строки истории с номерами [start, end)
+        *
+        * @param start Номер первой строки
+        * @param end Номер строки, следующей за последней
+        * @return Массив строк
+        """
+        start = max(0, start)
+        end = min(end, self.count)
+        lines: List[str] = []
+        if start >= end:
+            return lines
+        if start < self.spilled:
+            lines.extend(self._read_spilled(start, min(end, self.spilled)))
+        if end > self.spilled:
+            lines.extend(islice(self._ring, max(start, self.spilled) - self.spilled, end - self.spilled))
+        return lines
+
+    def close(self) -> None:
+        """
+        * Закрытие и удаление файла истории
+        """
+        for f in (self._writer, self._reader):
+            if f is not None:
+                try:
+                    f.close()
+                except Exception:
+                    pass
+        self._writer = None
+        self._reader = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
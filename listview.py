@@ -0,0 +1,95 @@
+"""
+* Отображение списка в виджете Listbox без полной перерисовки
+* *************************
+* Модель (список строк) сортируется, а в виджет применяются только
+* различия между старым и новым содержимым: удаления и вставки
+* непрерывными диапазонами. Если список не изменился, к виджету
+* не выполняется ни одного обращения, поэтому сохраняются выделение
+* и позиция прокрутки, а список не мерцает.
+"""
+
+from typing import List, Tuple
+
+class ListboxReconciler:
+
+    listbox = None # виджет Listbox (или объект с методами insert/delete)
+
+    def __init__(self, listbox):
+        """
+        * @param listbox Виджет Listbox, содержимым которого управляет класс
+        """
+        self.listbox = listbox
+        self.items: List[str] = [] # текущее содержимое виджета (отсортировано)
+        self._last_input: List[str] = [] # последний полученный список (для быстрой проверки "без изменений")
+
+    @staticmethod
+    def sort_key(item: str) -> Tuple[str, str]:
+        """
+        * Ключ сортировки: без учёта регистра, при равенстве - с учётом
+        """
+        return item.casefold(), item
+
+    @staticmethod
+    def diff(old: List[str], new: List[str]) -> Tuple[List[int], List[int]]:
+        """
+        * Различия между двумя отсортированными списками (слиянием за O(n))
+        *
+        * @param old Старый список
+        * @param new Новый список
+        * @return Кортеж (индексы удаляемых элементов old, индексы вставляемых элементов new)
+        """
+        deletions: List[int] = []
+        insertions: List[int] = []
+        i: int = 0
+        j: int = 0
+        key = ListboxReconciler.sort_key
+        while i < len(old) and j < len(new):
+            if old[i] == new[j]:
+                i += 1
+                j += 1
+            elif key(old[i]) < key(new[j]):
+                deletions.append(i)
+                i += 1
+            else:
+                insertions.append(j)
+                j += 1
+        deletions.extend(range(i, len(old)))
+        insertions.extend(range(j, len(new)))
+        return deletions, insertions
+
+    @staticmethod
+    def runs(indexes: List[int]) -> List[Tuple[int, int]]:
+        """
+        * Группировка возрастающих индексов в непрерывные диапазоны
+        *
+        * @param indexes Индексы
+        * @return Массив диапазонов (первый, последний)
+        """
+        result: List[Tuple[int, int]] = []
+        for index in indexes:
+            if len(result) > 0 and result[-1][1] + 1 == index:
+                result[-1] = (result[-1][0], index)
+            else:
+                result.append((index, index))
+        return result
+
+    def update(self, new_items: List[str]) -> Tuple[int, int]:
+        """
+        * Приведение содержимого виджета к новому списку
+        *
+        * @param new_items Новый список (в любом порядке, возможны повторы)
+        * @return Кортеж (число удалённых, число вставленных элементов)
+        """
+        if new_items == self._last_input: # тот же список, что и в прошлый раз - виджет не трогаем
+            return 0, 0
+        self._last_input = list(new_items)
+        new: List[str] = sorted(sorted(set(new_items)), key=str.casefold) # устойчивая сортировка даёт порядок sort_key()
+        if new == self.items: # изменился только порядок или повторы
+            return 0, 0
+        deletions, insertions = ListboxReconciler.diff(self.items, new)
+        for first, last in reversed(ListboxReconciler.runs(deletions)): # с конца, чтобы не сдвигать индексы
+            self.listbox.delete(first, last)
+        for first, last in ListboxReconciler.runs(insertions): # по возрастанию: все предыдущие элементы уже на месте
+            self.listbox.insert(first, *new[first:last + 1])
+        self.items = new
+        return len(deletions), len(insertions)
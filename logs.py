@@ -0,0 +1,119 @@
+"""
+* Журналирование клиента DMconnect
+* *************************
+* Журналы подсистем: "dmconnect.transport" (сокеты, чтение/запись),
+* "dmconnect.protocol" (команды и ответы сервера), "dmconnect.ui"
+* (интерфейс). Сообщения форматируются, только если уровень журнала
+* позволяет их вывести, поэтому при уровне по умолчанию (WARNING)
+* горячие участки кода не строят строк для журнала.
+* Последние строки обмена с сервером хранятся в кольцевом буфере
+* (без форматирования) и выводятся в журнал при ошибке соединения.
+"""
+
+from typing import List, Optional
+from collections import deque
+from logging.handlers import RotatingFileHandler
+import logging
+import time
+
+LOGGER_NAME: str = "dmconnect" # корневой журнал клиента
+TRANSPORT_LOG = logging.getLogger(f"{LOGGER_NAME}.transport")
+PROTOCOL_LOG = logging.getLogger(f"{LOGGER_NAME}.protocol")
+UI_LOG = logging.getLogger(f"{LOGGER_NAME}.ui")
+
+LOG_LEVEL: str = "WARNING" # уровень журнала по умолчанию
+LOG_FORMAT: str = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+LOG_FILE_MAX_BYTES: int = 1024 * 1024 # максимальный размер файла журнала до ротации
+LOG_FILE_BACKUPS: int = 3 # число хранимых старых файлов журнала
+TRAFFIC_RING_SIZE: int = 500 # число последних строк обмена с сервером, хранимых в памяти
+
+INCOMING: str = "<" # строка получена от сервера
+OUTGOING: str = ">" # строка отправлена серверу
+SECRET_COMMANDS: tuple = ("/login ", "/register ") # команды, содержащие пароль
+
+class TrafficRing:
+    """
+    * Кольцевой буфер последних строк обмена с сервером
+    """
+
+    def __init__(self, size: int = TRAFFIC_RING_SIZE):
+        """
+        * @param size Число хранимых строк
+        """
+        self._ring: deque = deque(maxlen=size)
+
+    def record(self, direction: str, line: str) -> None:
+        """
+        * Запись строки (без форматирования)
+        *
+        * @param direction INCOMING или OUTGOING
+        * @param line Строка
+        """
+        self._ring.append((time.time(), direction, line))
+
+    def record_lines(self, direction: str, lines: List[str]) -> None:
+        """
+        * Запись массива строк
+        *
+        * @param direction INCOMING или OUTGOING
+        * @param lines Массив строк
+        """
+        if len(lines) > 0:
+            now: float = time.time()
+            self._ring.extend((now, direction, line) for line in lines)
+
+    @staticmethod
+    def mask(line: str) -> str:
+        """
+        * Скрытие пароля в командах /login и /register
+        """
+        if line.startswith(SECRET_COMMANDS):
+            parts: List[str] = line.split(" ", 2)
+            if len(parts) == 3:
+                return f"{parts[0]} {parts[1]} ***"
+        return line
+
+    def dump(self, logger: logging.Logger, level: int = logging.ERROR) -> None:
+        """
+        * Вывод содержимого буфера в журнал (например, при ошибке соединения)
+        *
+        * @param logger Журнал
+        * @param level Уровень сообщений
+        """
+        if not logger.isEnabledFor(level) or len(self._ring) == 0:
+            return
+        logger.log(level, "Последние строки обмена с сервером (%d):", len(self._ring))
+        for ts, direction, line in list(self._ring):
+            logger.log(level, "%s.%03d %s %s", time.strftime("%H:%M:%S", time.localtime(ts)), int(ts * 1000) % 1000, direction, TrafficRing.mask(line))
+
+    def clear(self) -> None:
+        self._ring.clear()
+
+def setup_logging(level: str = LOG_LEVEL, log_file: Optional[str] = None) -> None:
+    """
+    * Настройка журналирования: вывод в консоль и (необязательно)
+    * в файл с ротацией
+    *
+    * @param level Уровень журнала (DEBUG, INFO, WARNING, ERROR)
+    * @param log_file Путь к файлу журнала (None или пустая строка - только консоль)
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    numeric_level = logging.getLevelName(level.upper().strip())
+    if not isinstance(numeric_level, int):
+        numeric_level = logging.getLevelName(LOG_LEVEL)
+    logger.setLevel(numeric_level)
+    for handler in list(logger.handlers): # повторная настройка заменяет обработчики
+        logger.removeHandler(handler)
+        handler.close()
+    formatter = logging.Formatter(LOG_FORMAT)
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    logger.addHandler(console)
+    if log_file:
+        try:
+            file_handler = RotatingFileHandler(log_file, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding="utf-8")
+            file_handler.setFormatter(formatter)
+            logger.addHandler(file_handler)
+        except OSError as e:
+            logger.error("Не удалось открыть файл журнала %s: %s", log_file, e)
+    logger.propagate = False
@@ -9,31 +9,56 @@
 * $ pip3 install --trusted-host pypi.org --trusted-host files.pythonhosted.org --upgrade pip
 * Программа является кроссплатформенной. Она должна работать
 * под Microsoft Windows, Linux, macOS и т.д.
+* Без графического интерфейса (сервер, бот, мост):
+* $ python3 main.py --headless [--jsonl]
 *
 * @author Ефремов А. В., 15.10.2025
 """
 
 import sys, os
-from typing import Optional, List
+if __name__ == "__main__" and "--headless" in sys.argv[1:]: # консольный режим: tkinter не импортируется
+    from headless import main as headless_main
+    sys.exit(headless_main(sys.argv[1:]))
+from typing import Optional, List, Dict
 from tkinter import *
 from tkinter import ttk
 
 import threading
 import queue
-from concurrent.futures import ThreadPoolExecutor
+import time
+from collections import deque
+import selectors
+import socket
+from concurrent.futures import ThreadPoolExecutor, Future
 
 from dmconnect import DMconnect
+from session import ConnectCancelled, CONNECT_STAGES, STAGE_JOINING
+from completion import ResponseCompletion
 from miscellaneous import Miscellaneous
+from listview import ListboxReconciler
+from history import ChatHistory, PAGE_LINES
+from store import MessageStore, StoredMessage
+from scheduler import PollScheduler
+from sessions import SessionManager, SessionSpec, load_session_specs
+from reconnect import ReconnectSupervisor, RECONNECT_MIN_DELAY, STATE_CONNECTED
+from outbound import OutboundQueue, OutgoingMessage, MAX_MESSAGE_BYTES, STATUS_DROPPED
+from metrics import METRICS, METRICS_FILE, MetricsDumper
+from updates import UpdateChannel
+from logs import UI_LOG
 
 # --- Константы ---
 ICON_FILE: str = os.path.join(os.path.join(os.path.dirname(__file__), "."), "logo.ico")
 FONT_FACE: str = "Courier New"
 FONT_BGCOLOR: str = "#F5F5DC" # https://python-charts.com/colors/
-REFRESH_INTERVAL_MS: int = 5 * 1000 # интервал обновления чата в миллисекундах (чем больше время, тем ниже отзывчивость программы для пользователя)
-NETWORK_WORKER_POLL_INTERVAL_MS: int = 1000  # период опроса очереди задач воркером (мс)
+REFRESH_INTERVAL_MS: int = 5 * 1000 # страховочный интервал обновления чата в миллисекундах (основное обновление - по событию от воркера)
+SERVER_POLL_INTERVAL_MS: int = 30 * 1000  # период полного опроса сервера (список пользователей, ping), когда входящие данные приходят по событию (мс)
+NETWORK_RESULT_EVENT: str = "<<NetworkResult>>"  # виртуальное событие Tk: воркер положил результат в result_queue
 MAX_WORKER_THREADS: int = 1  # один поток для всех сетевых операций
-MAX_LINES: int = 500  # количество строк, хранимых в чате
+MAX_LINES: int = 500  # количество строк, одновременно показываемых в чате (вся история - в ChatHistory)
 MAX_STRING: int = 1024  # максимальное число символов в одной строке чата
+RENDER_CHUNK_LINES: int = 100  # число строк чата, вставляемых в Text за одно обращение
+RENDER_BUDGET_MS: int = 20  # предельное время отрисовки чата за один проход цикла Tk (мс), остаток - в следующем проходе
+DIAGNOSTICS_REFRESH_MS: int = 1000  # период обновления окна диагностики (мс)
 
 # --- Основное окно ---
 root: Optional[Tk] = None
@@ -43,39 +68,175 @@ except Exception:
     Miscellaneous.print_message("Для работы программы требуется графический интерфейс.")
     sys.exit()
 
+class SessionTab:
+    """
+    * Вкладка дополнительного сеанса (см. sessions.py): чат и список участников
+    """
+
+    def __init__(self, notebook: ttk.Notebook, spec: SessionSpec):
+        """
+        * @param notebook Набор вкладок главного окна
+        * @param spec Параметры сеанса
+        """
+        self.spec = spec
+        self.notebook = notebook
+        self.frame = ttk.Frame(notebook)
+        notebook.add(self.frame, text=self.get_title(False))
+
+        self.status_label = ttk.Label(self.frame, text=" ", anchor=W, padding=(5, 2))
+        self.status_label.pack(side=BOTTOM, fill=X)
+
+        chat_frame = ttk.Frame(self.frame)
+        chat_frame.pack(side=LEFT, fill=BOTH, expand=True, padx=(0, 5))
+        self.chat_text = Text(chat_frame, wrap=WORD, state=DISABLED, font=(FONT_FACE, 10), bg=FONT_BGCOLOR)
+        self.chat_text.pack(side=LEFT, fill=BOTH, expand=True)
+        chat_scrollbar = ttk.Scrollbar(chat_frame, command=self.chat_text.yview)
+        chat_scrollbar.pack(side=RIGHT, fill=Y)
+        self.chat_text.config(yscrollcommand=chat_scrollbar.set)
+
+        users_frame = ttk.Frame(self.frame, width=180)
+        users_frame.pack(side=RIGHT, fill=Y)
+        self.users_listbox = Listbox(users_frame, selectmode=SINGLE, font=(FONT_FACE, 10), bg=FONT_BGCOLOR)
+        self.users_listbox.pack(side=LEFT, fill=BOTH, expand=True)
+        users_scrollbar = ttk.Scrollbar(users_frame, command=self.users_listbox.yview)
+        users_scrollbar.pack(side=RIGHT, fill=Y)
+        self.users_listbox.config(yscrollcommand=users_scrollbar.set)
+        self.users_view = ListboxReconciler(self.users_listbox)
+
+    def get_title(self, is_connected: bool) -> str:
+        """
+        * Заголовок вкладки: имя сеанса и признак отсутствия соединения
+        """
+        return self.spec.name if is_connected else f"{self.spec.name} (нет связи)"
+
+    def add_lines(self, lines: List[str]) -> None:
+        """
+        * Добавление строк в чат вкладки (хранятся только последние MAX_LINES строк)
+        """
+        _, last = self.chat_text.yview()
+        text: str = "".join((line if len(line) <= MAX_STRING else line[:MAX_STRING - 3] + "...") + "\n" for line in lines)
+        self.chat_text.config(state=NORMAL)
+        self.chat_text.insert(END, text)
+        excess: int = int(self.chat_text.index("end-1c").split(".")[0]) - 1 - MAX_LINES
+        if excess > 0:
+            self.chat_text.delete("1.0", f"{excess + 1}.0")
+        self.chat_text.config(state=DISABLED)
+        if last >= 1.0: # прокручиваем вниз, только если пользователь уже был внизу
+            self.chat_text.see(END)
+
+    def set_users(self, users: List[str]) -> None:
+        self.users_view.update(users)
+
+    def set_state(self, state: str, status_text: str) -> None:
+        """
+        * Отображение состояния соединения сеанса
+        *
+        * @param state Состояние (STATE_* из reconnect.py)
+        * @param status_text Текст для строки состояния
+        """
+        self.notebook.tab(self.frame, text=self.get_title(state == STATE_CONNECTED))
+        self.status_label.config(text=status_text)
+
 class Application:
 
     objDMconnect: Optional[DMconnect] = None
 
     task_queue: Optional[queue.Queue] = None
-    result_queue: Optional[queue.Queue] = None
+    result_queue: Optional[UpdateChannel] = None
     worker_executor: Optional[ThreadPoolExecutor] = None
     worker_thread: Optional[threading.Thread] = None
     worker_stop_event: Optional[threading.Event] = None
+    wakeup_reader: Optional[socket.socket] = None # self-pipe для пробуждения воркера при появлении задачи
+    wakeup_writer: Optional[socket.socket] = None
+    gui_wakeup_pending: bool = False # событие NETWORK_RESULT_EVENT уже отправлено и ещё не обработано
+    gui_wakeup_supported: bool = True # можно ли генерировать события Tk из потока воркера
+    members_version: int = -1 # версия кэша участников, последней отправленная в GUI
+    pending_chat_lines: Optional[deque] = None # строки, ожидающие отрисовки в чате
+    render_scheduled: bool = False # отрисовка остатка строк уже запланирована
+    render_reset: bool = False # окно чата нужно заполнить заново с хвоста истории
+    chat_history: Optional[ChatHistory] = None # вся история чата (память + файл на диске)
+    view_start: int = 0 # номер в истории первой строки, показанной в окне чата
+    view_end: int = 0 # номер в истории строки, следующей за последней показанной
+    view_following: bool = True # окно чата показывает хвост истории (новые строки отрисовываются сразу)
+    page_load_scheduled: bool = False # подгрузка страницы истории уже запланирована
+    message_store: Optional[MessageStore] = None # постоянное хранилище сообщений с поиском
+    search_results: Optional[List[StoredMessage]] = None # результаты последнего поиска
+    poll_scheduler: Optional[PollScheduler] = None # адаптивный интервал опроса сервера, когда нет сокета для ожидания (нативный протокол, нет подключения)
+    session_specs: Optional[List[SessionSpec]] = None # дополнительные сеансы из файла настроек
+    session_manager: Optional[SessionManager] = None # все дополнительные сеансы - в одном потоке
+    session_tabs: Optional[Dict[str, SessionTab]] = None # вкладки дополнительных сеансов по имени сеанса
+    notebook: Optional[ttk.Notebook] = None # вкладки сеансов (только если есть дополнительные сеансы)
+    main_tab: Optional[ttk.Frame] = None # вкладка основного сеанса (форма подключения)
+    reconnect_supervisor: Optional[ReconnectSupervisor] = None # восстановление соединения основного сеанса
+    outbound: Optional[OutboundQueue] = None # очередь исходящих сообщений основного сеанса
+    connection_status_text: str = "Отсутствует подключение к серверу." # состояние соединения для строки состояния
+    delivery_status_text: str = "" # состояние очереди исходящих сообщений для строки состояния
+    metrics_dumper: Optional[MetricsDumper] = None # периодическая запись метрик в файл
+    diagnostics_window: Optional[Toplevel] = None # окно диагностики (метрики обновляются, только пока оно открыто)
+    diagnostics_text: Optional[Text] = None
+    connect_cancel: Optional[threading.Event] = None # отмена выполняющегося подключения из формы
 
     def __init__(self):
         self.objDMconnect = DMconnect(root)
 
         # Инициализация очередей и фонового воркера для сетевых операций
         self.task_queue = queue.Queue()
-        self.result_queue = queue.Queue()
+        self.result_queue = UpdateChannel() # ограничена: старые снимки заменяются новыми, пачки строк сливаются
         self.worker_stop_event = threading.Event()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.pending_chat_lines = deque()
+        self.chat_history = ChatHistory()
+        if not "".__eq__(self.objDMconnect.history_db):
+            try:
+                self.message_store = MessageStore(self.objDMconnect.history_db)
+            except Exception as e:
+                Miscellaneous.print_message(f"История чата не будет сохраняться: {e}")
+                self.message_store = None
 
         # Используем один поток-воркер для всех сетевых операций (чтобы DMconnect не обрабатывался конкурентно)
         self.worker_executor = ThreadPoolExecutor(max_workers=MAX_WORKER_THREADS)
 
+        # Разорванное соединение восстанавливается автоматически (состояние - в строке состояния)
+        self.reconnect_supervisor = ReconnectSupervisor(self.objDMconnect, RECONNECT_MIN_DELAY, self.objDMconnect.reconnect_max_delay, self.on_connection_state)
+        # Сообщения отправляются подряд, с ограничением скорости; при разрыве соединения - ждут в очереди
+        self.outbound = OutboundQueue(self.objDMconnect, self.objDMconnect.send_rate, self.objDMconnect.send_burst, MAX_MESSAGE_BYTES, self.objDMconnect.outbox_size, self.on_delivery_status)
+
+        # Глубина очередей опрашивается, только когда метрики читают
+        METRICS.gauge("task_queue", self.task_queue.qsize)
+        METRICS.gauge("result_queue", lambda: len(self.result_queue))
+        METRICS.gauge("result_overflow", lambda: self.result_queue.overflow)
+        METRICS.gauge("pending_chat_lines", lambda: len(self.pending_chat_lines))
+        METRICS.gauge("outbound_queue", lambda: len(self.outbound))
+        if not "".__eq__(self.objDMconnect.metrics_file):
+            self.metrics_dumper = MetricsDumper(self.objDMconnect.metrics_file, self.objDMconnect.metrics_interval).start()
+
+        # Форма подключения не ждёт сети: подключение выполняет воркер, форма показывает его этапы
+        self.objDMconnect.connect_handler = self.start_connect
+        self.objDMconnect.cancel_handler = self.cancel_connect
+
         # Запуск фонового потока, который будет обрабатывать задачи из task_queue
+        self.poll_scheduler = PollScheduler(self.objDMconnect.poll_min_ms, self.objDMconnect.poll_max_ms)
         self.worker_thread = threading.Thread(target=self._network_worker_loop, daemon=True)
         self.worker_thread.start()
 
+        self.session_specs = load_session_specs()
+        self.session_tabs = {}
+
         self.apply_icon()
         self.build_app()
 
+        if len(self.session_specs) > 0: # дополнительные сеансы ведёт отдельный поток с одним selector'ом на всех
+            self.session_manager = SessionManager(self.on_session_event, self.objDMconnect)
+            for spec in self.session_specs:
+                self.session_manager.add(spec)
+            self.session_manager.start()
+
         # Инициализируем пустой список пользователей - начальный опрос выполнит фоновой воркер
         self.user_listbox_items = []
 
         # Начальная асинхронная загрузка пользователей/сообщений выполнится в воркере
-        self.task_queue.put(("initial_poll", None))
+        self.submit_task("initial_poll", None)
 
         # Запускаем периодическое обновление чата
         self.schedule_message_update()
@@ -89,8 +250,7 @@ class Application:
         if self.objDMconnect is not None:
             if self.objDMconnect.is_connected:
                 if len(self.objDMconnect.left_for_chat) > 0: # есть что-нибудь для чата?
-                    for line in self.objDMconnect.left_for_chat:
-                        self.add_message_to_chat(line)
+                    self.put_result("messages", list(self.objDMconnect.left_for_chat)) # вызывается из воркера - отрисует GUI
                     self.objDMconnect.left_for_chat.clear()
 
     def get_user_list(self) -> List[str]:
@@ -113,9 +273,7 @@ class Application:
         """
         self.has_it_got_anything_left_for_chat()
         messages = []
-        if self.objDMconnect.is_connected:
-            self.user_listbox_items = self.get_user_list()
-            self.populate_users_listbox()
+        if self.objDMconnect.is_connected: # список пользователей запрашивается отдельно в _poll_server()
             messages = self.objDMconnect.get_messages_for_chat()
         return messages
 
@@ -153,8 +311,36 @@ class Application:
         style.configure("Accent.TButton", padding=5)
 
         # --- Основная структура окна ---
-        chat_and_users_container = ttk.Frame(root)
-        chat_and_users_container.pack(side=TOP, fill=BOTH, expand=True, padx=5, pady=(5, 0))
+        # Строка поиска по сохранённой истории чата
+        search_container = ttk.Frame(root)
+        search_container.pack(side=TOP, fill=X, padx=5, pady=(5, 0))
+
+        self.search_entry = ttk.Entry(search_container, style="TEntry", font=(FONT_FACE, 10))
+        self.search_entry.pack(side=LEFT, fill=X, expand=True, padx=(0, 5))
+        self.search_entry.bind("<Return>", self.search_history_event)
+
+        self.search_button = ttk.Button(search_container, text="Найти", command=self.search_history)
+        self.search_button.pack(side=RIGHT)
+
+        self.diagnostics_button = ttk.Button(search_container, text="Диагностика", command=self.open_diagnostics)
+        self.diagnostics_button.pack(side=RIGHT, padx=(0, 5))
+        root.bind("<F12>", lambda event: self.open_diagnostics())
+
+        chat_parent = root
+        if len(self.session_specs) > 0: # несколько сеансов - переключение вкладками
+            self.notebook = ttk.Notebook(root)
+            self.notebook.pack(side=TOP, fill=BOTH, expand=True, padx=5, pady=(5, 0))
+            self.main_tab = ttk.Frame(self.notebook)
+            self.notebook.add(self.main_tab, text="Основной")
+            chat_parent = self.main_tab
+            for spec in self.session_specs:
+                self.session_tabs[spec.name] = SessionTab(self.notebook, spec)
+
+        chat_and_users_container = ttk.Frame(chat_parent)
+        chat_and_users_container.pack(side=TOP, fill=BOTH, expand=True, padx=5 if chat_parent is root else 0, pady=(5, 0))
+
+        self.status_label = ttk.Label(root, text="Отсутствует подключение к серверу.", relief=SUNKEN, anchor=W, background="#D3D3D3", foreground="black", padding=(5, 2))
+        self.status_label.pack(side=BOTTOM, fill=X)
 
         input_container = ttk.Frame(root, height=80)
         input_container.pack(side=BOTTOM, fill=X, padx=5, pady=(0, 5))
@@ -169,7 +355,7 @@ class Application:
 
         self.chat_scrollbar = ttk.Scrollbar(chat_frame, command=self.chat_text.yview)
         self.chat_scrollbar.pack(side=RIGHT, fill=Y)
-        self.chat_text.config(yscrollcommand=self.chat_scrollbar.set)
+        self.chat_text.config(yscrollcommand=self.on_chat_yscroll) # прокрутка подгружает страницы истории
 
         # Правая часть: список пользователей с возможностью прокрутки
         users_frame = ttk.Frame(chat_and_users_container, width=180)
@@ -181,13 +367,22 @@ class Application:
         self.users_scrollbar = ttk.Scrollbar(users_frame, command=self.users_listbox.yview)
         self.users_scrollbar.pack(side=RIGHT, fill=Y)
         self.users_listbox.config(yscrollcommand=self.users_scrollbar.set)
+        self.users_view = ListboxReconciler(self.users_listbox) # в Listbox применяются только изменения списка
 
         self.users_listbox.bind("<Double-Button-1>", self.on_user_double_click)
 
+        # Воркер сообщает о новых результатах виртуальным событием (без ожидания таймера)
+        root.bind(NETWORK_RESULT_EVENT, self.on_network_result)
+
+        # Сворачивание окна замедляет опрос сервера, разворачивание - возвращает прежний темп
+        root.bind("<Unmap>", self.on_window_state_change, add="+")
+        root.bind("<Map>", self.on_window_state_change, add="+")
+
         # --- Настройка нижней области (input_container) ---
         self.message_entry = ttk.Entry(input_container, style="TEntry", font=(FONT_FACE, 10))
         self.message_entry.pack(side=LEFT, fill=X, expand=True, padx=(0, 5))
         self.message_entry.bind("<Return>", self.send_message_event)
+        self.message_entry.bind("<Key>", self.on_user_typing, add="+")
 
         self.send_button = ttk.Button(input_container, text="Отправить", command=self.send_message, style="Accent.TButton")
         self.send_button.pack(side=RIGHT)
@@ -195,10 +390,9 @@ class Application:
     def populate_users_listbox(self) -> None:
         """
         * Заполняет Listbox пользователями из self.user_listbox_items
+        * (применяются только вставки и удаления, выделение и прокрутка сохраняются)
         """
-        self.users_listbox.delete(0, END)
-        for user in self.user_listbox_items:
-            self.users_listbox.insert(END, user)
+        self.users_view.update(self.user_listbox_items)
 
     def send_message_event(self, event):
         """
@@ -207,134 +401,723 @@ class Application:
         self.send_message()
         return "break"
 
+    def get_selected_session_tab(self) -> Optional[SessionTab]:
+        """
+        * Вкладка дополнительного сеанса, выбранная пользователем
+        *
+        * @return Экземпляр SessionTab или None (выбран основной сеанс)
+        """
+        if self.notebook is None:
+            return None
+        selected: str = self.notebook.select()
+        for tab in self.session_tabs.values():
+            if str(tab.frame) == selected:
+                return tab
+        return None
+
+    def on_connection_state(self, supervisor: ReconnectSupervisor) -> None:
+        """
+        * Смена состояния соединения основного сеанса (вызывается в потоке воркера)
+        """
+        self.put_result("connection_state", supervisor.get_status_text())
+        if supervisor.state == STATE_CONNECTED:
+            self.has_it_got_anything_left_for_chat() # ответ на повторный вход в комнату
+            self.submit_task("initial_poll", None) # после переподключения - полный опрос (список участников)
+
+    def start_connect(self, host: str, port: int, login: str, password: str) -> None:
+        """
+        * Запуск подключения из формы в потоке воркера (вызывается в потоке Tk)
+        """
+        self.connect_cancel = threading.Event()
+        self.submit_task("connect", (host, port, login, password, self.connect_cancel))
+
+    def cancel_connect(self) -> None:
+        """
+        * Отмена подключения, запущенного из формы (вызывается в потоке Tk)
+        """
+        if self.connect_cancel is not None:
+            self.connect_cancel.set()
+
+    def _connect(self, host: str, port: int, login: str, password: str, cancel: threading.Event) -> None:
+        """
+        * Подключение, вход и вход в комнату по умолчанию (в потоке воркера)
+        """
+        session = self.objDMconnect
+        progress = lambda stage: self.put_result("connect_progress", stage)
+        error: Optional[str] = None
+        try:
+            session.close()
+            session.establish_connection(host, port, login, password, progress, cancel)
+            if session.is_connected and not "".__eq__(session.default_room):
+                progress(STAGE_JOINING)
+                self.put_result("messages", session.execute_command(session.sock, f"/join_server {session.default_room}"))
+        except ConnectCancelled:
+            session.close()
+            error = "Подключение отменено."
+        except Exception as e:
+            session.close()
+            error = f"Не удалось подключиться: {e}"
+        if error is None and not session.is_connected:
+            error = "Отсутствует подключение к серверу."
+        self.put_result("connect_done", error)
+
+    def execute_command(self, cmd: str) -> Future:
+        """
+        * Команда серверу (можно вызывать из любого потока). Команды не ждут
+        * друг друга: ответ каждой соотносится с ней по виду строк
+        *
+        * @param cmd Команда
+        * @return Future, результат - массив строк ответа; функции, добавленные
+        *         через add_done_callback(), выполняются в потоке воркера
+        """
+        future: Future = Future()
+        self.submit_task("execute_command", (cmd, future))
+        return future
+
+    @staticmethod
+    def copy_future(source: Future, target: Future) -> None:
+        """
+        * Передача результата Future воркера в Future вызывающего кода
+        """
+        if target.done():
+            return
+        if source.cancelled():
+            target.cancel()
+        elif source.exception() is not None:
+            target.set_exception(source.exception())
+        else:
+            target.set_result(source.result())
+
+    def on_command_done(self, cmd: str, future: Future) -> None:
+        """
+        * Ответ на команду пользователя получен (вызывается в потоке воркера)
+        *
+        * @param cmd Команда
+        * @param future Future, возвращённый execute_command()
+        """
+        if future.cancelled():
+            self.put_result("command_failed", f"Команда {cmd} отменена.")
+        elif future.exception() is not None:
+            self.put_result("command_failed", f"Команда {cmd} не выполнена: {future.exception()}")
+        elif len(future.result()) == 0:
+            self.put_result("command_failed", f"Сервер не ответил на команду {cmd}.")
+        else:
+            self.put_result("command_response", future.result())
+
+    def on_delivery_status(self, message: OutgoingMessage) -> None:
+        """
+        * Смена состояния исходящего сообщения основного сеанса (вызывается в потоке воркера)
+        """
+        self.put_result("delivery", (message.status, message.text, len(self.outbound)))
+
+    def on_session_event(self, name: str, kind: str, payload) -> None:
+        """
+        * Событие дополнительного сеанса (вызывается в потоке SessionManager)
+        """
+        self.put_result("session", (name, kind, payload))
+
+    def process_session_event(self, name: str, kind: str, payload) -> None:
+        """
+        * Отображение события дополнительного сеанса на его вкладке
+        """
+        tab: Optional[SessionTab] = self.session_tabs.get(name)
+        if tab is None:
+            return
+        if kind == "messages":
+            if self.message_store is not None:
+                managed = self.session_manager.sessions.get(name)
+                for line in payload:
+                    self.message_store.add(line, managed.session.server, managed.session.room)
+            tab.add_lines(payload)
+        elif kind == "users":
+            tab.set_users(payload)
+        elif kind == "state":
+            tab.set_state(*payload)
+        elif kind == "delivery":
+            status, text, _ = payload
+            if status == STATUS_DROPPED:
+                tab.add_lines([f"Сообщение не отправлено: {text}"])
+
     def send_message(self):
         """
         * Отправка сообщения
         """
-        if self.objDMconnect.is_connected:
+        tab: Optional[SessionTab] = self.get_selected_session_tab()
+        if tab is not None: # сообщение в дополнительный сеанс
             message = self.message_entry.get()
             if message:
-                self.add_message_to_chat(f"Вы: {message}")
+                tab.add_lines([f"Вы: {message}"])
                 self.message_entry.delete(0, END)
-                # Кладём задачу на выполнение команды в фоновой воркер
+                self.session_manager.send(tab.spec.name, message)
+            return
+        if self.objDMconnect.is_connected or self.reconnect_supervisor.is_active(): # при разрыве сообщение ждёт переподключения
+            message = self.message_entry.get()
+            if message:
+                self.add_message_to_chat(f"Вы: {message}", store=False) # в хранилище попадёт эхо от сервера
+                self.message_entry.delete(0, END)
+                if self.objDMconnect.is_connected and ResponseCompletion.expects_reply(message):
+                    # Команда с известным ответом: ответ (или причина его отсутствия) будет показан, когда придёт
+                    command: str = message.strip()
+                    self.execute_command(command).add_done_callback(lambda future: self.on_command_done(command, future))
+                    return
+                # Кладём сообщение в очередь исходящих сообщений фонового воркера
                 try:
-                    self.task_queue.put(("execute_command", message))
-                    Miscellaneous.print_message(f"Отправлено: {message}")
+                    self.submit_task("send_message", message)
+                    UI_LOG.debug("Отправлено: %s", message)
                 except Exception:
                     Miscellaneous.print_message("Ошибка при постановке задачи на выполнение команды.")
 
-    def add_message_to_chat(self, message: str):
+    def add_message_to_chat(self, message: str, store: bool = True):
         """
         * Добавляет сообщение в область чата
         """
-        if len(message) > MAX_STRING: # обрезаем слишком длинную строку
-            message = message[:MAX_STRING - 3] + "..."
-        self.chat_text.config(state=NORMAL)
-        self.chat_text.insert(END, message + "\n")
-        try: # удаляем старые строки, если превышен лимит строк
-            line_count = int(self.chat_text.index('end-1c').split('.')[0])
+        self.add_messages_to_chat([message], store=store)
+
+    def add_messages_to_chat(self, messages: List[str], render: bool = True, store: bool = True):
+        """
+        * Добавляет пачку сообщений в историю и в область чата (отрисовка - пакетом)
+        *
+        * @param messages Массив строк
+        * @param render Отрисовать сразу (False - строки только накапливаются)
+        * @param store Сохранить строки в постоянное хранилище
+        """
+        for message in messages:
+            if store and self.message_store is not None: # запись выполняет поток хранилища
+                self.message_store.add(message, self.objDMconnect.server, self.objDMconnect.room, self.chat_history.count)
+            if len(message) > MAX_STRING: # обрезаем слишком длинную строку
+                message = message[:MAX_STRING - 3] + "..."
+            self.chat_history.append(message)
+            if self.view_following: # пользователь листает старую историю - новые строки только сохраняем
+                self.pending_chat_lines.append(message)
+        if len(self.pending_chat_lines) > MAX_LINES: # всё, что старше MAX_LINES, в окно чата всё равно не попадёт
+            while len(self.pending_chat_lines) > MAX_LINES:
+                self.pending_chat_lines.popleft()
+            self.render_reset = True
+        if render and not self.render_scheduled:
+            self.render_pending_messages()
+
+    def render_pending_messages(self):
+        """
+        * Отрисовка накопленных строк чата: вставка пачками, однократная
+        * обрезка лишних строк и прокрутка вниз, только если пользователь
+        * уже находился внизу. Если время RENDER_BUDGET_MS исчерпано,
+        * остаток отрисовывается в следующем проходе цикла Tk.
+        """
+        self.render_scheduled = False
+        if len(self.pending_chat_lines) == 0:
+            return
+        started: float = time.perf_counter()
+        deadline: float = started + RENDER_BUDGET_MS / 1000.0
+        try:
+            at_bottom: bool = self.chat_text.yview()[1] >= 1.0
         except Exception:
-            line_count = 0
-        if line_count > MAX_LINES:
-            remove_lines = line_count - MAX_LINES
+            at_bottom = True
+        self.chat_text.config(state=NORMAL)
+        if self.render_reset: # часть строк пропущена - окно чата заполняется заново с хвоста истории
+            self.render_reset = False
+            self.chat_text.delete("1.0", END)
+            self.view_start = self.view_end = self.chat_history.count - len(self.pending_chat_lines)
+        while len(self.pending_chat_lines) > 0:
+            chunk: List[str] = []
+            while len(self.pending_chat_lines) > 0 and len(chunk) < RENDER_CHUNK_LINES:
+                chunk.append(self.pending_chat_lines.popleft())
+            self.chat_text.insert(END, "\n".join(chunk) + "\n")
+            self.view_end += len(chunk)
+            if time.perf_counter() >= deadline:
+                break
+        remove_lines: int = (self.view_end - self.view_start) - MAX_LINES
+        if remove_lines > 0: # удаляем из окна старые строки (они остаются в истории)
             self.chat_text.delete('1.0', f'{remove_lines + 1}.0') # удалить первые remove_lines строк (1.0 по числам линий)
+            self.view_start += remove_lines
         self.chat_text.config(state=DISABLED)
-        self.chat_text.see(END)
+        if at_bottom:
+            self.chat_text.see(END)
+        METRICS.observe("render_batch", (time.perf_counter() - started) * 1000.0)
+        if len(self.pending_chat_lines) > 0: # остаток - в следующем проходе цикла Tk, чтобы интерфейс не замирал
+            self.render_scheduled = True
+            root.after(1, self.render_pending_messages)
 
-    def update_chat_messages(self):
+    def on_chat_yscroll(self, first, last):
         """
-        * Получает результаты от фонового потока и добавляет их в чат / список пользователей
+        * Обработчик прокрутки чата: при достижении верха окна подгружается
+        * более старая страница истории, низа - более новая
+        *
+        * @param first Доля текста выше видимой области
+        * @param last Доля текста до конца видимой области
         """
-        # Обрабатываем все доступные результаты из воркера
-        while True:
-            try:
-                item = self.result_queue.get_nowait()
-            except queue.Empty:
-                break
+        self.chat_scrollbar.set(first, last)
+        if self.page_load_scheduled:
+            return
+        if float(first) <= 0.0 and self.view_start > 0:
+            self.page_load_scheduled = True
+            root.after_idle(self.load_older_page)
+        elif float(last) >= 1.0 and not self.view_following:
+            self.page_load_scheduled = True
+            root.after_idle(self.load_newer_page)
+
+    def get_top_visible_line(self) -> int:
+        """
+        * Номер (в виджете) первой видимой строки чата
+        """
+        try:
+            return int(self.chat_text.index("@0,0").split(".")[0])
+        except Exception:
+            return 1
+
+    def load_older_page(self):
+        """
+        * Подгрузка в окно чата страницы истории перед первой показанной строкой
+        """
+        self.page_load_scheduled = False
+        start: int = max(0, self.view_start - PAGE_LINES)
+        lines: List[str] = self.chat_history.get_range(start, self.view_start)
+        if len(lines) == 0:
+            return
+        top: int = self.get_top_visible_line()
+        self.chat_text.config(state=NORMAL)
+        self.chat_text.insert("1.0", "\n".join(lines) + "\n")
+        self.view_start = start
+        excess: int = (self.view_end - self.view_start) - MAX_LINES
+        if excess > 0: # окно не растёт: снизу убираем столько же строк (они остаются в истории)
+            self.chat_text.delete(f"{self.view_end - self.view_start - excess + 1}.0", "end-1c")
+            self.view_end -= excess
+            self.view_following = False
+            self.pending_chat_lines.clear() # эти строки уже в истории и будут подгружены при прокрутке вниз
+            self.render_reset = False
+        self.chat_text.config(state=DISABLED)
+        self.chat_text.yview(f"{top + len(lines)}.0") # та же строка остаётся вверху видимой области
+
+    def load_newer_page(self):
+        """
+        * Подгрузка в окно чата страницы истории после последней показанной строки
+        """
+        self.page_load_scheduled = False
+        end: int = min(self.chat_history.count, self.view_end + PAGE_LINES)
+        lines: List[str] = self.chat_history.get_range(self.view_end, end)
+        top: int = self.get_top_visible_line()
+        self.chat_text.config(state=NORMAL)
+        if len(lines) > 0:
+            self.chat_text.insert(END, "\n".join(lines) + "\n")
+            self.view_end = end
+        excess: int = (self.view_end - self.view_start) - MAX_LINES
+        if excess > 0:
+            self.chat_text.delete("1.0", f"{excess + 1}.0")
+            self.view_start += excess
+        self.chat_text.config(state=DISABLED)
+        self.chat_text.yview(f"{max(1, top - max(0, excess))}.0")
+        if self.view_end >= self.chat_history.count: # догнали хвост истории - снова показываем новые строки сразу
+            self.view_following = True
+
+    def search_history_event(self, event):
+        """
+        * Обработчик нажатия Enter в строке поиска
+        """
+        self.search_history()
+        return "break"
+
+    def search_history(self):
+        """
+        * Поиск по сохранённой истории чата и вывод результатов в отдельном окне
+        """
+        query: str = self.search_entry.get()
+        if self.message_store is None or "".__eq__(query.strip()):
+            return
+        try:
+            self.search_results = self.message_store.search(query)
+        except Exception as e:
+            Miscellaneous.print_message(f"Ошибка поиска по истории чата: {e}")
+            return
+        results_window = Toplevel(root)
+        results_window.title(f"Поиск: {query} (найдено: {len(self.search_results)})")
+        results_window.geometry("700x300")
+        results_listbox = Listbox(results_window, selectmode=SINGLE, font=(FONT_FACE, 10), bg=FONT_BGCOLOR)
+        results_listbox.pack(side=LEFT, fill=BOTH, expand=True)
+        results_scrollbar = ttk.Scrollbar(results_window, command=results_listbox.yview)
+        results_scrollbar.pack(side=RIGHT, fill=Y)
+        results_listbox.config(yscrollcommand=results_scrollbar.set)
+        if len(self.search_results) > 0:
+            results_listbox.insert(END, *[str(found) for found in self.search_results])
+        results_listbox.bind("<Double-Button-1>", self.on_search_result_double_click)
+
+    def open_diagnostics(self):
+        """
+        * Окно диагностики: счётчики, глубина очередей и задержки (см. metrics.py)
+        """
+        if self.diagnostics_window is not None and self.diagnostics_window.winfo_exists():
+            self.diagnostics_window.lift()
+            return
+        self.diagnostics_window = Toplevel(root)
+        self.diagnostics_window.title("Диагностика")
+        self.diagnostics_window.geometry("700x500")
+        buttons_container = ttk.Frame(self.diagnostics_window)
+        buttons_container.pack(side=BOTTOM, fill=X, padx=5, pady=5)
+        ttk.Button(buttons_container, text="Сохранить в JSON", command=self.save_metrics).pack(side=RIGHT)
+        ttk.Button(buttons_container, text="Сбросить", command=METRICS.reset).pack(side=RIGHT, padx=(0, 5))
+        self.diagnostics_text = Text(self.diagnostics_window, wrap=NONE, font=(FONT_FACE, 10), bg=FONT_BGCOLOR)
+        self.diagnostics_text.pack(side=TOP, fill=BOTH, expand=True)
+        self.refresh_diagnostics()
+
+    def refresh_diagnostics(self):
+        """
+        * Обновление окна диагностики (пока окно открыто)
+        """
+        if self.diagnostics_window is None or not self.diagnostics_window.winfo_exists():
+            self.diagnostics_window = None
+            return
+        self.diagnostics_text.config(state=NORMAL)
+        self.diagnostics_text.delete("1.0", END)
+        self.diagnostics_text.insert(END, METRICS.format_text())
+        self.diagnostics_text.config(state=DISABLED)
+        root.after(DIAGNOSTICS_REFRESH_MS, self.refresh_diagnostics)
+
+    def save_metrics(self):
+        """
+        * Запись метрик в файл JSON по запросу пользователя
+        """
+        path: str = self.objDMconnect.metrics_file if not "".__eq__(self.objDMconnect.metrics_file) else METRICS_FILE
+        try:
+            METRICS.dump(path)
+            Miscellaneous.print_message(f"Метрики записаны в файл {path}.")
+        except OSError as e:
+            Miscellaneous.print_message(f"Ошибка записи метрик: {e}")
+
+    def on_search_result_double_click(self, event):
+        """
+        * Переход к найденному сообщению в окне чата (только для сообщений текущего запуска)
+        """
+        index = event.widget.curselection()
+        if index and self.search_results is not None:
+            found: StoredMessage = self.search_results[index[0]]
+            if found.is_current_session and found.seq is not None:
+                self.jump_to_history(found.seq)
+
+    def jump_to_history(self, seq: int):
+        """
+        * Показ в окне чата страницы истории вокруг строки с заданным номером
+        *
+        * @param seq Номер строки в истории
+        """
+        self.view_start = max(0, seq - PAGE_LINES // 2)
+        self.view_end = min(self.chat_history.count, self.view_start + MAX_LINES)
+        lines: List[str] = self.chat_history.get_range(self.view_start, self.view_end)
+        self.view_following = (self.view_end >= self.chat_history.count)
+        self.pending_chat_lines.clear()
+        self.render_reset = False
+        self.chat_text.config(state=NORMAL)
+        self.chat_text.delete("1.0", END)
+        if len(lines) > 0:
+            self.chat_text.insert(END, "\n".join(lines) + "\n")
+        line_index: str = f"{seq - self.view_start + 1}.0"
+        self.chat_text.tag_remove("search_hit", "1.0", END)
+        self.chat_text.tag_add("search_hit", line_index, f"{line_index} lineend")
+        self.chat_text.tag_config("search_hit", background="#FFE08A")
+        self.chat_text.config(state=DISABLED)
+        self.chat_text.see(line_index)
+
+    def submit_task(self, cmd_type: str, payload) -> None:
+        """
+        * Постановка задачи в очередь воркера с немедленным его пробуждением
+        *
+        * @param cmd_type Тип задачи
+        * @param payload Данные задачи
+        """
+        self.task_queue.put((cmd_type, payload))
+        self.wake_worker()
+
+    def wake_worker(self) -> None:
+        """
+        * Пробуждение воркера (новая задача или изменился интервал опроса)
+        """
+        try:
+            self.wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass # буфер self-pipe полон - воркер и так будет разбужен
+
+    def on_user_typing(self, event=None):
+        """
+        * Пользователь набирает текст - опрос сервера сразу становится частым
+        """
+        if self.poll_scheduler.get_interval_ms() > self.poll_scheduler.min_ms:
+            self.poll_scheduler.on_activity()
+            self.wake_worker()
+
+    def on_window_state_change(self, event=None):
+        """
+        * Обработчик сворачивания/разворачивания главного окна
+        """
+        if event is not None and event.widget is not root: # событие дочернего виджета
+            return
+        try:
+            is_iconified: bool = (root.state() == "iconic")
+        except TclError:
+            return
+        if is_iconified != self.poll_scheduler.is_iconified:
+            self.poll_scheduler.set_iconified(is_iconified)
+            if not is_iconified:
+                self.poll_scheduler.on_activity()
+                self.wake_worker()
+
+    def put_result(self, kind: str, payload) -> None:
+        """
+        * Передача результата из воркера в GUI с немедленным пробуждением цикла Tk
+        *
+        * @param kind Тип результата
+        * @param payload Данные результата
+        """
+        self.result_queue.put(kind, payload)
+        if self.gui_wakeup_supported and not self.gui_wakeup_pending:
+            self.gui_wakeup_pending = True
             try:
-                kind, payload = item
-                if kind == "messages":
-                    for msg in payload:
-                        self.add_message_to_chat(msg)
-                elif kind == "users":
-                    self.user_listbox_items = payload
-                    self.populate_users_listbox()
-                elif kind == "command_response":
-                    for line in payload:
-                        self.add_message_to_chat(line)
-                elif kind == "error":
-                    # просто обновим статус (DMconnect изменит is_connected)
-                    pass
-            finally:
-                try:
-                    self.result_queue.task_done()
-                except Exception:
-                    pass
+                root.event_generate(NETWORK_RESULT_EVENT, when="tail")
+            except (RuntimeError, TclError):
+                # Tcl собран без поддержки потоков - остаётся страховочный таймер REFRESH_INTERVAL_MS
+                self.gui_wakeup_supported = False
+                self.gui_wakeup_pending = False
+
+    def on_network_result(self, event=None):
+        """
+        * Обработчик события NETWORK_RESULT_EVENT от воркера
+        """
+        self.process_results()
+
+    def update_chat_messages(self):
+        """
+        * Страховочное периодическое чтение результатов фонового потока
+        """
+        self.process_results()
         # Планируем следующее чтение результатов (не сетевой опрос)
         self.schedule_message_update()
 
+    def process_results(self):
+        """
+        * Получает результаты от фонового потока и добавляет их в чат / список пользователей
+        """
+        self.gui_wakeup_pending = False
+        # Все накопленные результаты - одним вызовом (снимки уже сведены к последнему, пачки строк слиты)
+        for kind, payload in self.result_queue.drain():
+            if kind == "overflow":
+                self.add_messages_to_chat([f"Пропущено строк: {payload} (интерфейс не успевал их показывать)."], render=False, store=False)
+            elif kind == "messages":
+                self.add_messages_to_chat(payload, render=False)
+            elif kind == "users":
+                self.user_listbox_items = payload
+                self.populate_users_listbox()
+            elif kind == "command_response":
+                self.add_messages_to_chat(payload, render=False)
+            elif kind == "command_failed":
+                self.add_messages_to_chat([payload], render=False, store=False)
+            elif kind == "session":
+                self.process_session_event(*payload)
+            elif kind == "connection_state":
+                self.connection_status_text = payload
+                self.update_status_text()
+            elif kind == "connect_progress":
+                self.objDMconnect.on_connect_progress(CONNECT_STAGES.get(payload, payload))
+                self.connection_status_text = CONNECT_STAGES.get(payload, payload)
+                self.update_status_text()
+            elif kind == "connect_done":
+                self.objDMconnect.on_connect_finished(payload)
+                if payload is not None:
+                    self.connection_status_text = payload
+                    self.update_status_text()
+            elif kind == "delivery":
+                status, text, pending = payload
+                if status == STATUS_DROPPED:
+                    self.add_messages_to_chat([f"Сообщение не отправлено: {text}"], render=False, store=False)
+                self.delivery_status_text = f" Ожидают отправки: {pending}." if pending > 0 else ""
+                self.update_status_text()
+            elif kind == "error":
+                # просто обновим статус (DMconnect изменит is_connected)
+                pass
+        if not self.render_scheduled: # все накопленные строки - одной отрисовкой
+            self.render_pending_messages()
+
+    def update_status_text(self) -> None:
+        """
+        * Строка состояния: соединение основного сеанса и очередь исходящих сообщений
+        """
+        self.status_label.config(text=self.connection_status_text + self.delivery_status_text)
+
     def schedule_message_update(self):
         """
         * Планирует следующее обновление сообщений чата
         """
         if not self.objDMconnect.is_connected:
-            Miscellaneous.print_message("Нет соединения с сервером.")
-        root.after(REFRESH_INTERVAL_MS, self.update_chat_messages)
+            UI_LOG.debug("Нет соединения с сервером.")
+        interval: int = REFRESH_INTERVAL_MS if self.gui_wakeup_supported else min(REFRESH_INTERVAL_MS, self.poll_scheduler.get_interval_ms())
+        root.after(interval, self.update_chat_messages)
 
-    def _network_worker_loop(self):
+    def _get_watched_socket(self) -> Optional[socket.socket]:
         """
-        * Фоновый цикл для выполнения сетевых задач из self.task_queue.
-        * Все сетевые операции с objDMconnect должны выполняться в этом потоке.
+        * Сокет сервера, готовность которого к чтению можно ожидать в selector'е
+        *
+        * @return Экземпляр сокета или None (нет подключения, нативный протокол, режим отладки)
         """
-        while not self.worker_stop_event.is_set():
+        if self.objDMconnect is not None and self.objDMconnect.is_connected and not self.objDMconnect.is_native:
+            return self.objDMconnect.sock
+        return None
+
+    def _drain_wakeups(self) -> None:
+        """
+        * Вычитывание байтов пробуждения из self-pipe
+        """
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _poll_server(self) -> None:
+        """
+        * Полный опрос сервера: новые сообщения и список пользователей
+        """
+        if self.objDMconnect is not None and self.objDMconnect.is_connected:
+            try:
+                messages = self.get_messages_for_chat()
+                if messages:
+                    self.put_result("messages", messages)
+                users = self.get_user_list()
+                if users:
+                    self.members_version = self.objDMconnect.members.version
+                    self.put_result("users", users)
+            except Exception:
+                # при ошибке поместим маркер, GUI обновит статус по is_connected
+                self.put_result("error", None)
+
+    def _receive_pending(self) -> bool:
+        """
+        * Чтение уже пришедших от сервера строк (без отправки команд серверу)
+        *
+        * @return True, если от сервера что-нибудь пришло
+        """
+        has_data: bool = False
+        if self.objDMconnect is not None and self.objDMconnect.is_connected:
+            try:
+                messages = self.objDMconnect.read_socket(self.objDMconnect.sock)
+                if messages:
+                    has_data = True
+                    self.put_result("messages", messages)
+                members = self.objDMconnect.members
+                if members is not None and members.version != self.members_version: # кто-то вошёл или вышел
+                    self.members_version = members.version
+                    self.put_result("users", members.get_users())
+            except Exception:
+                self.put_result("error", None)
+        return has_data
+
+    def _process_tasks(self) -> bool:
+        """
+        * Выполнение всех задач, накопившихся в self.task_queue
+        *
+        * @return True, если получена задача завершения работы воркера
+        """
+        while True:
+            try:
+                task = self.task_queue.get_nowait()
+            except queue.Empty:
+                return False
             try:
-                task = None
-                try:
-                    task = self.task_queue.get(timeout=NETWORK_WORKER_POLL_INTERVAL_MS / 1000.0)
-                except queue.Empty:
-                    # периодически инициируем опрос сервера на новые сообщения/список пользователей
-                    if self.objDMconnect is not None and self.objDMconnect.is_connected:
-                        try:
-                            messages = self.get_messages_for_chat()
-                            if messages:
-                                self.result_queue.put(("messages", messages))
-                            users = self.get_user_list()
-                            if users:
-                                self.result_queue.put(("users", users))
-                        except Exception:
-                            # при ошибке поместим маркер, GUI обновит статус по is_connected
-                            self.result_queue.put(("error", None))
-                    continue
-                # обработка конкретной задачи
-                if task is None:
-                    continue
                 cmd_type, payload = task
-                if cmd_type == "execute_command":
-                    cmd = payload
-                    try:
-                        response = self.objDMconnect.execute_command(self.objDMconnect.sock, cmd)
-                        self.result_queue.put(("command_response", response))
-                    except Exception:
-                        self.result_queue.put(("error", None))
+                if cmd_type == "send_message":
+                    self.outbound.submit(payload) # отправит self.outbound.pump() в цикле воркера
+                elif cmd_type == "execute_command":
+                    # Команда не задерживает воркер: ответ придёт в Future вместе с входящими строками
+                    cmd, future = payload
+                    reply = self.objDMconnect.submit_command(self.objDMconnect.sock, cmd)
+                    reply.add_done_callback(lambda reply, future=future: Application.copy_future(reply, future))
+                elif cmd_type == "connect":
+                    self._connect(*payload)
                 elif cmd_type == "shutdown":
-                    break
+                    return True
                 elif cmd_type == "initial_poll":
                     # Начальный асинхронный опрос: получить пользователей и сообщения сразу после старта
-                    try:
-                        users = self.get_user_list()
-                        if users:
-                            self.result_queue.put(("users", users))
-                        messages = self.get_messages_for_chat()
-                        if messages:
-                            self.result_queue.put(("messages", messages))
-                    except Exception:
-                        self.result_queue.put(("error", None))
+                    self._poll_server()
             finally:
-                if task is not None:
+                try:
+                    self.task_queue.task_done()
+                except Exception:
+                    pass
+
+    def _network_worker_loop(self):
+        """
+        * Фоновый цикл для выполнения сетевых задач из self.task_queue.
+        * Все сетевые операции с objDMconnect должны выполняться в этом потоке.
+        * Воркер спит в selector'е на сокете сервера и self-pipe очереди задач:
+        * входящие данные и новые задачи обрабатываются сразу по готовности,
+        * а простаивающий клиент не расходует процессорное время.
+        """
+        selector = selectors.DefaultSelector()
+        selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        watched_sock: Optional[socket.socket] = None # сокет сервера, зарегистрированный в selector'е
+        next_poll: float = time.monotonic() + SERVER_POLL_INTERVAL_MS / 1000.0 # момент следующего полного опроса сервера
+        next_tick: float = time.monotonic() # момент следующей проверки входящих данных без selector'а
+        last_tick: float = next_tick # момент последней такой проверки
+        send_at: Optional[float] = None # момент, когда можно отправить следующую строку из очереди исходящих сообщений
+        try:
+            while not self.worker_stop_event.is_set():
+                self.reconnect_supervisor.check() # обнаружение разрыва и, если пора, переподключение
+                sock = self._get_watched_socket()
+                if sock is not watched_sock: # соединение установлено, разорвано или заменено
+                    if watched_sock is not None:
+                        try:
+                            selector.unregister(watched_sock)
+                        except (KeyError, ValueError, OSError):
+                            pass
+                        watched_sock = None
+                    if sock is not None:
+                        try:
+                            selector.register(sock, selectors.EVENT_READ)
+                            watched_sock = sock
+                        except (KeyError, ValueError, OSError):
+                            pass
+                # интервал мог сократиться (ввод текста, окно развёрнуто) - пересчитываем момент проверки
+                next_tick = min(next_tick, last_tick + self.poll_scheduler.get_interval())
+                now: float = time.monotonic()
+                wake_at: float = next_poll if watched_sock is not None else min(next_poll, next_tick)
+                reconnect_at: Optional[float] = self.reconnect_supervisor.get_wake_time()
+                if reconnect_at is not None:
+                    wake_at = min(wake_at, reconnect_at)
+                if send_at is not None: # ограничитель скорости отправки разрешит следующую строку
+                    wake_at = min(wake_at, send_at)
+                reply_at: Optional[float] = self.objDMconnect.commands.get_wake_time() # крайний срок ответа на команду
+                if reply_at is not None:
+                    wake_at = min(wake_at, reply_at)
+                try:
+                    events = selector.select(max(0.0, wake_at - now))
+                except (ValueError, OSError): # сокет закрыт из другого потока
+                    events = []
                     try:
-                        self.task_queue.task_done()
-                    except Exception:
+                        selector.unregister(watched_sock)
+                    except (KeyError, ValueError, OSError):
                         pass
+                    watched_sock = None
+                cycle_started: float = time.perf_counter()
+                sock_ready: bool = False
+                for key, _ in events:
+                    if key.fileobj is self.wakeup_reader:
+                        self._drain_wakeups()
+                    else:
+                        sock_ready = True
+                if self._process_tasks():
+                    break
+                send_at = self.outbound.pump()
+                self.objDMconnect.commands.expire()
+                now = time.monotonic()
+                is_tick: bool = (watched_sock is None and now >= next_tick) # без selector'а проверяем входящие данные периодически
+                if sock_ready or is_tick:
+                    if self._receive_pending():
+                        self.poll_scheduler.on_activity()
+                    elif is_tick:
+                        self.poll_scheduler.on_idle()
+                if is_tick:
+                    last_tick = now
+                    next_tick = now + self.poll_scheduler.get_interval()
+                if now >= next_poll:
+                    self._poll_server()
+                    next_poll = time.monotonic() + SERVER_POLL_INTERVAL_MS / 1000.0
+                METRICS.observe("poll_cycle", (time.perf_counter() - cycle_started) * 1000.0)
+        finally:
+            selector.close()
 
     def on_user_double_click(self, event):
         """
@@ -359,26 +1142,29 @@ class Application:
         * Завершение работы программы
         """
         global root
+        if self.metrics_dumper is not None: # последняя запись метрик
+            self.metrics_dumper.stop()
+        if self.reconnect_supervisor is not None: # при закрытии соединение не восстанавливаем
+            self.reconnect_supervisor.stop()
+        self.cancel_connect() # выполняющееся подключение прерывается
         if self.objDMconnect is not None: # попытка корректного завершения работы с сервером DMconnect
-            if self.objDMconnect.is_connected == True and self.objDMconnect.sock is not None:
-                if self.objDMconnect.is_native:
-                    self.objDMconnect.dm_obj.close()
-                else:
-                    try:
-                        self.objDMconnect.sock.close()
-                    except Exception:
-                        pass
-                self.objDMconnect.sock = None
-                self.objDMconnect.is_connected = False
+            self.objDMconnect.close()
+        if self.session_manager is not None: # закрытие дополнительных сеансов
+            self.session_manager.stop()
         try: # остановка фонового воркера
             if self.worker_stop_event is not None:
                 self.worker_stop_event.set()
+                self.submit_task("shutdown", None)
             if self.worker_thread is not None:
                 self.worker_thread.join(timeout=2.0)
             if self.worker_executor is not None:
                 self.worker_executor.shutdown(wait=False)
         except Exception:
             pass
+        if self.chat_history is not None: # файл истории чата больше не нужен
+            self.chat_history.close()
+        if self.message_store is not None: # запись оставшихся строк в хранилище
+            self.message_store.close()
         root.destroy()
         root.quit()
         Miscellaneous.print_message("Работа программы завершена.")
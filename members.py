@@ -0,0 +1,104 @@
+"""
+* Кэш списка участников чата
+* *************************
+* Список участников запрашивается у сервера командой "/members"
+* один раз, а затем поддерживается в актуальном состоянии по
+* уведомлениям сервера о входе и выходе пользователей:
+* "*** X has joined the server." / "*** X has left the server.".
+* Полная пересинхронизация выполняется раз в ttl секунд.
+* Строки разбирает модуль protocol.py; кэш получает события
+* MembersList / Join / Leave (см. apply()).
+"""
+
+from typing import Optional, List, Dict
+import time
+
+from protocol import ProtocolEvent, MembersList, Join, Leave
+MEMBERS_TTL: float = 5 * 60 # период полной пересинхронизации списка участников (в секундах)
+
+class MembersCache:
+
+    room: Optional[str] = None # комната, для которой получен список
+    ttl: float = MEMBERS_TTL
+    synced_at: Optional[float] = None # момент последней полной синхронизации (time.monotonic())
+    version: int = 0 # номер версии списка (увеличивается при каждом изменении)
+
+    def __init__(self, ttl: float = MEMBERS_TTL):
+        """
+        * @param ttl Период полной пересинхронизации (в секундах)
+        """
+        self.ttl = ttl
+        self._users: Dict[str, None] = {} # упорядоченное множество логинов
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        """
+        * Сброс кэша (новое подключение, смена комнаты)
+        """
+        self.room = None
+        self.synced_at = None
+        if len(self._users) > 0:
+            self._users.clear()
+            self.version += 1
+
+    def is_stale(self) -> bool:
+        """
+        * Требуется ли полная пересинхронизация списка
+        *
+        * @return True, если список ни разу не получен или устарел
+        """
+        return self.synced_at is None or time.monotonic() - self.synced_at >= self.ttl
+
+    def seed(self, room: str, users: List[str]) -> None:
+        """
+        * Заполнение кэша полным списком участников
+        *
+        * @param room Комната
+        * @param users Список логинов
+        """
+        self.room = room
+        self._users = dict.fromkeys(users)
+        self.synced_at = time.monotonic()
+
+    def apply(self, event: ProtocolEvent, room: Optional[str] = None) -> bool:
+        """
+        * Учёт события протокола (MembersList, Join, Leave; прочие пропускаются)
+        *
+        * @param event Событие
+        * @param room Текущая комната сеанса: список другой комнаты (ответ на
+        *        "/members", пришедший после смены комнаты) не учитывается;
+        *        None - комната не проверяется
+        * @return True, если список участников изменился
+        """
+        if isinstance(event, MembersList):
+            if room is not None and event.room != room:
+                return False
+            changed: bool = list(self._users) != event.users
+            self.seed(event.room, event.users)
+            if changed:
+                self.version += 1
+            return changed
+        if self.synced_at is None: # пока нет полного списка, уведомления не применяем
+            return False
+        if not isinstance(event, (Join, Leave)):
+            return False
+        login: str = event.login
+        if isinstance(event, Join):
+            if login in self._users:
+                return False
+            self._users[login] = None
+            self.version += 1
+            return True
+        if login not in self._users:
+            return False
+        del self._users[login]
+        self.version += 1
+        return True
+
+    def get_users(self) -> List[str]:
+        """
+        * Текущий список участников
+        *
+        * @return Список логинов
+        """
+        return list(self._users)
@@ -0,0 +1,199 @@
+"""
+* Метрики работы клиента DMconnect
+* *************************
+* Счётчики (байты и строки в обе стороны, переподключения и т.п.),
+* гистограммы задержек (время ответа сервера по видам команд,
+* длительность цикла опроса, время отрисовки пачки строк) и
+* датчики глубины очередей. Запись метрики - одно сложение без
+* блокировок и форматирования; датчики опрашиваются, а гистограммы
+* сводятся, только когда метрики кто-то читает (окно диагностики,
+* запись в JSON по запросу или с заданным периодом).
+* Счётчики увеличиваются из разных потоков без блокировок: при
+* одновременной записи возможна потеря единичных приращений, что
+* для диагностики допустимо.
+"""
+
+from typing import Optional, List, Dict, Callable
+import threading
+import json
+import time
+import os
+
+METRICS_FILE: str = "metrics.json" # файл метрик по умолчанию (запись по запросу)
+METRICS_INTERVAL: float = 60.0 # период записи метрик в metrics_file (в секундах)
+HISTOGRAM_BOUNDS_MS: tuple = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000) # верхние границы корзин (мс)
+
+class Histogram:
+    """
+    * Гистограмма задержек с фиксированными корзинами (в миллисекундах)
+    """
+
+    __slots__ = ("count", "total", "min", "max", "buckets")
+
+    def __init__(self):
+        self.count: int = 0
+        self.total: float = 0.0
+        self.min: float = 0.0
+        self.max: float = 0.0
+        self.buckets: List[int] = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1) # последняя - больше всех границ
+
+    def observe(self, value: float) -> None:
+        """
+        * Учёт одного значения (мс)
+        """
+        if self.count == 0 or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.count += 1
+        self.total += value
+        index: int = 0
+        for bound in HISTOGRAM_BOUNDS_MS:
+            if value <= bound:
+                break
+            index += 1
+        self.buckets[index] += 1
+
+    def percentile(self, share: float) -> float:
+        """
+        * Оценка перцентиля: верхняя граница корзины, в которую он попадает
+        """
+        if self.count == 0:
+            return 0.0
+        rank: float = share * self.count
+        seen: int = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count > 0:
+                return min(self.max, HISTOGRAM_BOUNDS_MS[index]) if index < len(HISTOGRAM_BOUNDS_MS) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": round(self.total / self.count, 3) if self.count > 0 else 0.0,
+            "min": round(self.min, 3),
+            "max": round(self.max, 3),
+            "p50": round(self.percentile(0.5), 3),
+            "p95": round(self.percentile(0.95), 3),
+            "p99": round(self.percentile(0.99), 3),
+        }
+
+class Metrics:
+    """
+    * Набор метрик клиента
+    """
+
+    def __init__(self):
+        self.started: float = time.monotonic()
+        self.counters: Dict[str, int] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    def add(self, name: str, value: int = 1) -> None:
+        """
+        * Увеличение счётчика
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value_ms: float) -> None:
+        """
+        * Учёт задержки (мс) в гистограмме
+        """
+        histogram: Optional[Histogram] = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(value_ms)
+
+    def gauge(self, name: str, getter: Callable[[], float]) -> None:
+        """
+        * Регистрация датчика: getter() вызывается только при чтении метрик
+        """
+        self.gauges[name] = getter
+
+    def snapshot(self) -> Dict[str, object]:
+        """
+        * Текущие значения всех метрик
+        """
+        gauges: Dict[str, object] = {}
+        for name, getter in list(self.gauges.items()):
+            try:
+                gauges[name] = getter()
+            except Exception:
+                gauges[name] = None
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "uptime": round(time.monotonic() - self.started, 1),
+            "counters": dict(sorted(self.counters.items())),
+            "gauges": dict(sorted(gauges.items())),
+            "histograms": {name: histogram.snapshot() for name, histogram in sorted(list(self.histograms.items()))},
+        }
+
+    def format_text(self) -> str:
+        """
+        * Метрики в виде текста (для окна диагностики)
+        """
+        snapshot: Dict[str, object] = self.snapshot()
+        lines: List[str] = [f"Время работы: {snapshot['uptime']:.0f} с", "", "Счётчики:"]
+        lines.extend(f"  {name:<32} {value:>12}" for name, value in snapshot["counters"].items())
+        lines.extend(["", "Очереди:"])
+        lines.extend(f"  {name:<32} {value if value is not None else '-':>12}" for name, value in snapshot["gauges"].items())
+        lines.extend(["", f"Задержки, мс: {'число':>10} {'среднее':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'макс.':>9}"])
+        for name, item in snapshot["histograms"].items():
+            lines.append(f"  {name:<24} {item['count']:>10} {item['mean']:>9.2f} {item['p50']:>8.2f} {item['p95']:>8.2f} {item['p99']:>8.2f} {item['max']:>9.2f}")
+        return "\n".join(lines)
+
+    def dump(self, path: str = METRICS_FILE) -> None:
+        """
+        * Запись метрик в файл JSON (файл заменяется целиком)
+        """
+        temp_path: str = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+
+    def reset(self) -> None:
+        self.started = time.monotonic()
+        self.counters.clear()
+        self.histograms.clear()
+
+METRICS: Metrics = Metrics() # метрики процесса (общие для всех сеансов)
+
+class MetricsDumper:
+    """
+    * Периодическая запись метрик в файл (в отдельном потоке)
+    """
+
+    def __init__(self, path: str, interval: float = METRICS_INTERVAL, metrics: Metrics = METRICS):
+        """
+        * @param path Файл метрик
+        * @param interval Период записи (в секундах)
+        * @param metrics Набор метрик
+        """
+        self.path = path
+        self.interval = max(1.0, interval)
+        self.metrics = metrics
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> "MetricsDumper":
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self) -> None:
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.metrics.dump(self.path)
+            except OSError:
+                pass
+
+    def stop(self) -> None:
+        """
+        * Остановка с последней записью метрик
+        """
+        self.stop_event.set()
+        try:
+            self.metrics.dump(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,215 @@
+"""
+* Очередь исходящих сообщений
+* *************************
+* Сообщения пользователя отправляются серверу подряд, без ожидания
+* ответа на каждое (ответы читаются вместе с остальными входящими
+* строками), но не чаще, чем позволяет "ведро токенов": в среднем
+* send_rate строк в секунду и не более send_burst строк подряд -
+* под ограничения сервера на флуд. Слишком длинные сообщения
+* делятся на части по границам символов кодировки обмена.
+* Пока соединение восстанавливается, сообщения ждут в очереди
+* ограниченного размера. О каждом сообщении сообщается слушателю:
+* поставлено в очередь, ожидает соединения, отправлено, отброшено.
+"""
+
+from typing import Optional, List, Callable
+from collections import deque
+import itertools
+import threading
+import time
+
+from metrics import METRICS
+
+SEND_RATE: float = 2.0 # средняя скорость отправки (строк в секунду)
+SEND_BURST: int = 5 # сколько строк можно отправить подряд без паузы
+MAX_MESSAGE_BYTES: int = 1024 # максимальная длина одной отправляемой строки (в байтах кодировки обмена)
+QUEUE_SIZE: int = 100 # максимальное число сообщений в очереди
+
+STATUS_QUEUED: str = "queued" # поставлено в очередь
+STATUS_HELD: str = "held" # ожидает восстановления соединения
+STATUS_SENT: str = "sent" # все части записаны в сокет
+STATUS_DROPPED: str = "dropped" # вытеснено из переполненной очереди или не отправлено из-за ошибки
+
+class TokenBucket:
+    """
+    * Ограничитель скорости "ведро токенов"
+    """
+
+    def __init__(self, rate: float = SEND_RATE, burst: int = SEND_BURST):
+        """
+        * @param rate Скорость пополнения (токенов в секунду)
+        * @param burst Ёмкость ведра
+        """
+        self.rate = max(0.001, rate)
+        self.burst = max(1, burst)
+        self.tokens: float = float(self.burst)
+        self.updated: float = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, now: Optional[float] = None) -> bool:
+        """
+        * Взять один токен
+        *
+        * @return True, если токен был
+        """
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def get_wait(self, now: Optional[float] = None) -> float:
+        """
+        * Время до появления следующего токена (в секундах)
+        """
+        self._refill(time.monotonic() if now is None else now)
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+def split_message(text: str, max_bytes: int = MAX_MESSAGE_BYTES, codepage: str = "utf-8") -> List[str]:
+    """
+    * Деление сообщения на части не длиннее max_bytes байтов в кодировке
+    * обмена. Символ никогда не разрезается; если рядом с границей есть
+    * пробел, часть заканчивается на нём.
+    *
+    * @param text Сообщение
+    * @param max_bytes Максимальная длина части (в байтах)
+    * @param codepage Кодировка обмена данными с сервером
+    * @return Массив частей
+    """
+    data: bytes = text.encode(codepage, errors="replace")
+    if len(data) <= max_bytes:
+        return [text]
+    parts: List[str] = []
+    if codepage.replace("_", "-").lower() in ("utf-8", "utf8"):
+        start: int = 0
+        while len(data) - start > max_bytes:
+            cut: int = start + max_bytes
+            while cut > start and (data[cut] & 0xC0) == 0x80: # байт-продолжение UTF-8: граница символа левее
+                cut -= 1
+            space: int = data.rfind(b" ", start + max_bytes * 3 // 4, cut)
+            if space > start:
+                cut = space + 1
+            parts.append(data[start:cut].decode(codepage))
+            start = cut
+        parts.append(data[start:].decode(codepage))
+    else: # прочие кодировки: считаем длину каждого символа
+        current: List[str] = []
+        size: int = 0
+        for char in text:
+            char_size: int = len(char.encode(codepage, errors="replace"))
+            if size + char_size > max_bytes and len(current) > 0:
+                parts.append("".join(current))
+                current = []
+                size = 0
+            current.append(char)
+            size += char_size
+        parts.append("".join(current))
+    return [part for part in (p.strip() for p in parts) if part]
+
+class OutgoingMessage:
+    """
+    * Исходящее сообщение и его состояние
+    """
+
+    def __init__(self, message_id: int, text: str, parts: List[str]):
+        self.id = message_id
+        self.text = text
+        self.parts = parts
+        self.sent_parts: int = 0 # сколько частей уже отправлено
+        self.status: str = STATUS_QUEUED
+
+class OutboundQueue:
+
+    session = None # сеанс DMconnectSession, через который отправляются сообщения
+    listener: Optional[Callable[[OutgoingMessage], None]] = None # получатель изменений состояния сообщений
+
+    def __init__(self, session, rate: float = SEND_RATE, burst: int = SEND_BURST, max_bytes: int = MAX_MESSAGE_BYTES, size: int = QUEUE_SIZE, listener: Optional[Callable[[OutgoingMessage], None]] = None):
+        """
+        * @param session Сеанс DMconnectSession
+        * @param rate Средняя скорость отправки (строк в секунду)
+        * @param burst Сколько строк можно отправить подряд
+        * @param max_bytes Максимальная длина одной строки (в байтах)
+        * @param size Максимальное число сообщений в очереди
+        * @param listener Функция listener(сообщение), вызывается при смене состояния сообщения
+        """
+        self.session = session
+        self.bucket = TokenBucket(rate, burst)
+        self.max_bytes = max(16, max_bytes)
+        self.size = max(1, size)
+        self.listener = listener
+        self._queue: deque = deque()
+        self._lock = threading.Lock() # сообщения ставит в очередь поток GUI, отправляет - сетевой поток
+        self._ids = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def _notify(self, message: OutgoingMessage, status: str) -> None:
+        message.status = status
+        METRICS.add(f"messages_{status}")
+        if self.listener is not None:
+            try:
+                self.listener(message)
+            except Exception:
+                pass
+
+    def submit(self, text: str) -> OutgoingMessage:
+        """
+        * Постановка сообщения в очередь (можно вызывать из любого потока)
+        *
+        * @param text Сообщение или команда
+        * @return Экземпляр OutgoingMessage
+        """
+        message: OutgoingMessage = OutgoingMessage(next(self._ids), text, split_message(text.strip(), self.max_bytes, self.session.codepage))
+        dropped: Optional[OutgoingMessage] = None
+        with self._lock:
+            if len(self._queue) >= self.size: # вытесняется самое старое сообщение
+                dropped = self._queue.popleft()
+            self._queue.append(message)
+        if dropped is not None:
+            self._notify(dropped, STATUS_DROPPED)
+        self._notify(message, STATUS_QUEUED)
+        return message
+
+    def pump(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        * Отправка сообщений, пока позволяет ограничитель скорости
+        * (вызывается из потока, который работает с сетью)
+        *
+        * @param now Текущий момент (time.monotonic())
+        * @return Момент, когда нужно вызвать pump() снова, или None
+        """
+        now = time.monotonic() if now is None else now
+        session = self.session
+        while True:
+            with self._lock:
+                message: Optional[OutgoingMessage] = self._queue[0] if len(self._queue) > 0 else None
+            if message is None:
+                return None
+            if message.sent_parts >= len(message.parts): # все части отправлены (или отправлять нечего)
+                with self._lock:
+                    if len(self._queue) > 0 and self._queue[0] is message:
+                        self._queue.popleft()
+                self._notify(message, STATUS_SENT)
+                continue
+            if not session.is_connected: # отправим после восстановления соединения
+                if message.status != STATUS_HELD:
+                    self._notify(message, STATUS_HELD)
+                return None
+            if not self.bucket.consume(now):
+                return now + self.bucket.get_wait(now)
+            try:
+                written: bool = session.send_command(session.sock, message.parts[message.sent_parts])
+            except Exception: # соединение разорвано: часть будет отправлена повторно после переподключения
+                self._notify(message, STATUS_HELD)
+                return None if not session.is_connected else now + self.bucket.get_wait(now)
+            if not written: # часть не записана, соединение не разорвано - сообщение отбрасывается
+                with self._lock:
+                    if len(self._queue) > 0 and self._queue[0] is message:
+                        self._queue.popleft()
+                self._notify(message, STATUS_DROPPED)
+                continue
+            message.sent_parts += 1
@@ -0,0 +1,190 @@
+"""
+* Разбор строк сервера DMconnect в типизированные события
+* *************************
+* Каждая строка ответа сервера за один проход превращается в одно
+* событие: ChatMessage (сообщение "автор: текст"), MembersList
+* (список участников), Join / Leave (вход и выход участника),
+* ServerList (список комнат), LoginResult (результат входа) или
+* SystemNotice (прочие служебные строки). Вид строки определяется
+* по заранее построенной таблице префиксов (по первому символу
+* строки проверяются только подходящие префиксы). Получатели
+* подписываются на нужные виды событий; события доставляются в
+* порядке строк, одинаковые строки не схлопываются.
+"""
+
+from typing import Optional, List, Dict, Tuple, Callable, Type
+import re
+
+LIST_OF_USERS: str = "Members in " # признак списка пользователей в ответе от сервера
+NOTICE_PREFIX: str = "*** " # признак служебного уведомления сервера
+JOINED_SUFFIX: str = " has joined the server."
+LEFT_SUFFIX: str = " has left the server."
+SERVER_LIST_PREFIX: str = "Available servers: "
+LOGIN_SUCCESS: str = "Login successful"
+LOGIN_FAILURES: Tuple[str, ...] = ("Login failed", "Invalid username or password")
+AUTHOR_PATTERN = re.compile(r"^([^\s:]+): (.*)$", re.DOTALL) # строка чата вида "nick: text"
+
+class ProtocolEvent:
+    """
+    * Событие протокола: исходная строка и разобранные поля
+    """
+
+    __slots__ = ("line",)
+
+    def __init__(self, line: str):
+        self.line = line
+
+    def __repr__(self) -> str:
+        fields: str = ", ".join(f"{name}={getattr(self, name)!r}" for cls in type(self).__mro__ for name in getattr(cls, "__slots__", ()))
+        return f"{type(self).__name__}({fields})"
+
+class ChatMessage(ProtocolEvent):
+    __slots__ = ("author", "text")
+
+    def __init__(self, line: str, author: str, text: str):
+        super().__init__(line)
+        self.author = author
+        self.text = text
+
+class MembersList(ProtocolEvent):
+    __slots__ = ("room", "users")
+
+    def __init__(self, line: str, room: str, users: List[str]):
+        super().__init__(line)
+        self.room = room
+        self.users = users
+
+class Join(ProtocolEvent):
+    __slots__ = ("login",)
+
+    def __init__(self, line: str, login: str):
+        super().__init__(line)
+        self.login = login
+
+class Leave(ProtocolEvent):
+    __slots__ = ("login",)
+
+    def __init__(self, line: str, login: str):
+        super().__init__(line)
+        self.login = login
+
+class ServerList(ProtocolEvent):
+    __slots__ = ("servers",)
+
+    def __init__(self, line: str, servers: List[str]):
+        super().__init__(line)
+        self.servers = servers
+
+class LoginResult(ProtocolEvent):
+    __slots__ = ("success",)
+
+    def __init__(self, line: str, success: bool):
+        super().__init__(line)
+        self.success = success
+
+class SystemNotice(ProtocolEvent):
+    __slots__ = ()
+
+def split_names(text: str) -> List[str]:
+    """
+    * Разбор перечня "a, b, c" (пустые элементы отбрасываются)
+    """
+    return [name.strip() for name in text.split(",") if not "".__eq__(name.strip())]
+
+def parse_members(line: str) -> Optional[MembersList]:
+    """
+    * Разбор строки "Members in '<room>': a, b, c"
+    """
+    parts: List[str] = line[len(LIST_OF_USERS):].split(":", 1)
+    if len(parts) != 2:
+        return None
+    return MembersList(line, parts[0].strip().strip("'"), split_names(parts[1].lstrip())) # берём всё после первого ':'
+
+def parse_notice(line: str) -> Optional[ProtocolEvent]:
+    """
+    * Разбор уведомления "*** X has joined the server." / "*** X has left the server."
+    """
+    body: str = line[len(NOTICE_PREFIX):].rstrip()
+    if body.endswith(JOINED_SUFFIX):
+        return Join(line, body[:-len(JOINED_SUFFIX)].strip())
+    if body.endswith(LEFT_SUFFIX):
+        return Leave(line, body[:-len(LEFT_SUFFIX)].strip())
+    return SystemNotice(line)
+
+def parse_server_list(line: str) -> ServerList:
+    return ServerList(line, split_names(line[len(SERVER_LIST_PREFIX):]))
+
+# Таблица префиксов: (префикс, разбор); разбор возвращает событие или None (строка разбирается дальше)
+PREFIXES: Tuple[Tuple[str, Callable[[str], Optional[ProtocolEvent]]], ...] = (
+    (LIST_OF_USERS, parse_members),
+    (NOTICE_PREFIX, parse_notice),
+    (SERVER_LIST_PREFIX, parse_server_list),
+    (LOGIN_SUCCESS, lambda line: LoginResult(line, True)),
+) + tuple((prefix, lambda line: LoginResult(line, False)) for prefix in LOGIN_FAILURES)
+
+def build_prefix_table(prefixes: Tuple[Tuple[str, Callable[[str], Optional[ProtocolEvent]]], ...]) -> Dict[str, Tuple[Tuple[str, Callable[[str], Optional[ProtocolEvent]]], ...]]:
+    """
+    * Группировка префиксов по первому символу (длинные префиксы проверяются первыми)
+    """
+    table: Dict[str, List[Tuple[str, Callable[[str], Optional[ProtocolEvent]]]]] = {}
+    for prefix, parse in prefixes:
+        table.setdefault(prefix[0], []).append((prefix, parse))
+    return {char: tuple(sorted(entries, key=lambda entry: -len(entry[0]))) for char, entries in table.items()}
+
+PREFIX_TABLE = build_prefix_table(PREFIXES)
+
+def parse_line(line: str) -> ProtocolEvent:
+    """
+    * Строка сервера в событие
+    *
+    * @param line Строка ответа сервера
+    * @return Экземпляр одного из классов событий
+    """
+    for prefix, parse in PREFIX_TABLE.get(line[:1], ()):
+        if line.startswith(prefix):
+            event: Optional[ProtocolEvent] = parse(line)
+            if event is not None:
+                return event
+    match = AUTHOR_PATTERN.match(line)
+    if match is not None:
+        return ChatMessage(line, match.group(1), match.group(2))
+    return SystemNotice(line)
+
+class EventDispatcher:
+    """
+    * Разбор строк и доставка событий подписчикам
+    """
+
+    def __init__(self):
+        self._handlers: Dict[Type[ProtocolEvent], List[Callable[[ProtocolEvent], None]]] = {}
+        self._all: List[Callable[[ProtocolEvent], None]] = [] # подписчики на все события
+
+    def subscribe(self, kind: Optional[Type[ProtocolEvent]], handler: Callable[[ProtocolEvent], None]) -> None:
+        """
+        * Подписка на события
+        *
+        * @param kind Класс события (None - все события)
+        * @param handler Функция handler(событие)
+        """
+        if kind is None:
+            self._all.append(handler)
+        else:
+            self._handlers.setdefault(kind, []).append(handler)
+
+    def dispatch(self, lines: List[str]) -> List[ProtocolEvent]:
+        """
+        * Разбор строк и доставка событий в порядке строк
+        *
+        * @param lines Массив строк ответа сервера
+        * @return Массив событий
+        """
+        events: List[ProtocolEvent] = []
+        handlers: Dict[Type[ProtocolEvent], List[Callable[[ProtocolEvent], None]]] = self._handlers
+        for line in lines:
+            event: ProtocolEvent = parse_line(line)
+            events.append(event)
+            for handler in handlers.get(type(event), ()):
+                handler(event)
+            for handler in self._all:
+                handler(event)
+        return events
@@ -0,0 +1,231 @@
+"""
+* Автоматическое восстановление соединения с сервером DMconnect
+* *************************
+* Супервизор следит за сеансом: если соединение разорвано, он
+* повторяет подключение с экспоненциально растущей задержкой со
+* случайным разбросом (чтобы многие клиенты не переподключались
+* одновременно). После успешного подключения повторяется вход
+* (/login выполняет establish_connection()) и последняя команда
+* /join_server. Сообщения, написанные за время разрыва, ждут в
+* очереди исходящих сообщений (см. outbound.py).
+* Все методы, кроме чтения состояния, вызываются из потока, который
+* работает с сетью. Если этот поток обслуживает несколько сеансов
+* (см. sessions.py), попытка подключения выполняется в пуле потоков,
+* а её результат забирает check(): сеть другого сеанса не ждёт
+* медленного сервера.
+"""
+
+from typing import Optional, Callable
+from concurrent.futures import Executor, Future, CancelledError
+import threading
+import random
+import time
+
+from logs import TRANSPORT_LOG
+from metrics import METRICS
+
+RECONNECT_MIN_DELAY: float = 1.0 # базовая задержка перед первой попыткой переподключения (в секундах)
+RECONNECT_MAX_DELAY: float = 60.0 # максимальная задержка между попытками (в секундах)
+
+STATE_IDLE: str = "idle" # подключения ещё не было (или работа завершается)
+STATE_CONNECTED: str = "connected"
+STATE_RECONNECTING: str = "reconnecting" # соединение разорвано, ожидается следующая попытка
+STATE_CONNECTING: str = "connecting" # попытка подключения выполняется в пуле потоков
+
+class ReconnectSupervisor:
+
+    session = None # сеанс DMconnectSession (модуль session импортирует настройки отсюда)
+    state: str = STATE_IDLE
+    attempt: int = 0 # номер неудачной попытки подряд
+    next_attempt: float = 0.0 # момент следующей попытки (time.monotonic())
+    last_room: Optional[str] = None # комната, в которую нужно войти снова
+    executor: Optional[Executor] = None # пул потоков для попыток подключения
+    pending: Optional[Future] = None # попытка подключения, выполняющаяся в пуле
+    was_connected: bool = False # соединение уже устанавливалось (следующее подключение - восстановление)
+
+    def __init__(self, session, min_delay: float = RECONNECT_MIN_DELAY, max_delay: float = RECONNECT_MAX_DELAY, listener: Optional[Callable[["ReconnectSupervisor"], None]] = None, executor: Optional[Executor] = None, wakeup: Optional[Callable[[], None]] = None):
+        """
+        * @param session Сеанс, соединение которого восстанавливается
+        * @param min_delay Базовая задержка перед первой попыткой (в секундах)
+        * @param max_delay Максимальная задержка между попытками (в секундах)
+        * @param listener Функция listener(supervisor), вызывается при смене состояния
+        * @param executor Пул потоков для попыток подключения (None - попытка
+        *        выполняется в вызывающем потоке и блокирует его)
+        * @param wakeup Функция, будящая сетевой цикл, когда попытка в пуле завершилась
+        """
+        self.session = session
+        self.min_delay = max(0.0, min_delay)
+        self.max_delay = max(self.min_delay, max_delay)
+        self.listener = listener
+        self.executor = executor
+        self.wakeup = wakeup
+        self.cancel_event = threading.Event() # прерывание попытки при завершении работы
+        self.state = STATE_IDLE
+        self.attempt = 0
+        self.next_attempt = 0.0
+        self.last_room = None
+        self.pending = None
+        self.was_connected = False
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        if self.listener is not None:
+            try:
+                self.listener(self)
+            except Exception as e:
+                TRANSPORT_LOG.error("Ошибка обработки состояния соединения: %s", e)
+
+    def get_delay(self) -> float:
+        """
+        * Задержка перед следующей попыткой: половина - экспоненциальная,
+        * половина - случайная ("equal jitter")
+        """
+        cap: float = min(self.max_delay, self.min_delay * (2 ** min(self.attempt, 30)))
+        return cap / 2.0 + random.uniform(0.0, cap / 2.0)
+
+    def is_active(self) -> bool:
+        """
+        * Соединение было установлено и сейчас восстанавливается
+        """
+        return self.state == STATE_RECONNECTING
+
+    def is_busy(self) -> bool:
+        """
+        * Попытка подключения выполняется в пуле потоков: сеанс принадлежит
+        * потоку пула, сетевой цикл его не трогает
+        """
+        return self.pending is not None
+
+    def get_wake_time(self) -> Optional[float]:
+        """
+        * Момент, к которому нужно разбудить сетевой цикл (None - не нужно)
+        """
+        return self.next_attempt if self.state == STATE_RECONNECTING else None
+
+    def begin(self) -> None:
+        """
+        * Немедленная попытка подключения с повторами до успеха (без формы подключения)
+        """
+        self.attempt = 0
+        self.next_attempt = time.monotonic()
+        self.was_connected = False
+        self.cancel_event.clear()
+        self._set_state(STATE_RECONNECTING)
+
+    def stop(self) -> None:
+        """
+        * Прекращение попыток (завершение работы программы); попытка в пуле
+        * потоков прерывается и сама закрывает соединение
+        """
+        self.cancel_event.set()
+        self.state = STATE_IDLE
+
+    def check(self, now: Optional[float] = None) -> None:
+        """
+        * Проверка состояния соединения и, если пора, попытка переподключения
+        *
+        * @param now Текущий момент (time.monotonic())
+        """
+        now = time.monotonic() if now is None else now
+        if self.pending is not None: # попытка выполняется в пуле потоков
+            if self.pending.done():
+                future: Future = self.pending
+                self.pending = None
+                self._finish(CancelledError() if future.cancelled() else future.exception())
+            return
+        session = self.session
+        if session.is_connected:
+            if self.state != STATE_CONNECTED: # подключение установлено (в том числе формой подключения)
+                self.attempt = 0
+                self.was_connected = True
+                self._set_state(STATE_CONNECTED)
+            return
+        if self.state == STATE_CONNECTED: # соединение разорвано
+            self.last_room = session.room
+            session.close()
+            self.attempt = 0
+            self.next_attempt = now + self.get_delay()
+            TRANSPORT_LOG.warning("Соединение с %s потеряно, переподключение через %.1f с.", session.server, self.next_attempt - now)
+            METRICS.add("disconnects")
+            self._set_state(STATE_RECONNECTING)
+        elif self.state == STATE_RECONNECTING and now >= self.next_attempt:
+            self.reconnect()
+
+    def reconnect(self) -> bool:
+        """
+        * Попытка переподключения: вход и повторный вход в комнату. При
+        * заданном пуле потоков попытка только запускается в пуле, а её
+        * результат забирает check()
+        *
+        * @return True, если соединение восстановлено
+        """
+        METRICS.add("reconnect_attempts")
+        if self.executor is not None:
+            self.pending = self.executor.submit(self._connect)
+            if self.wakeup is not None:
+                self.pending.add_done_callback(lambda future: self.wakeup())
+            self._set_state(STATE_CONNECTING)
+            return False
+        error: Optional[BaseException] = None
+        try:
+            self._connect()
+        except Exception as e:
+            error = e
+        return self._finish(error)
+
+    def _connect(self) -> None:
+        """
+        * Подключение, вход и повторный вход в комнату (поток ждёт ответов
+        * сервера). Ответ на вход в комнату и строки чата, прочитанные во
+        * время ожидания, остаются в session.left_for_chat: их забирает
+        * слушатель при переходе в STATE_CONNECTED
+        """
+        session = self.session
+        session.establish_connection(session.host, session.port, session.login, session.password, cancel=self.cancel_event)
+        if session.is_connected and self.last_room:
+            session.left_for_chat.extend(session.execute_command(session.sock, f"/join_server {self.last_room}"))
+        if self.cancel_event.is_set(): # работа завершается - соединение уже не нужно
+            session.close()
+
+    def _finish(self, error: Optional[BaseException]) -> bool:
+        """
+        * Учёт результата попытки подключения (в потоке, который работает с сетью)
+        *
+        * @param error Исключение попытки (None - попытка завершилась без ошибок)
+        * @return True, если соединение восстановлено
+        """
+        session = self.session
+        if error is not None:
+            TRANSPORT_LOG.warning("Попытка %s к %s не удалась: %s", "переподключения" if self.was_connected else "подключения", session.server, error)
+            session.close()
+        if not session.is_connected:
+            self.attempt += 1
+            self.next_attempt = time.monotonic() + self.get_delay()
+            self._set_state(STATE_RECONNECTING) # слушатель покажет номер попытки и время следующей
+            return False
+        if self.was_connected: # восстановление после разрыва
+            TRANSPORT_LOG.warning("Соединение с %s восстановлено (попыток: %d).", session.server, self.attempt + 1)
+            METRICS.add("reconnects")
+        else: # первое подключение (begin())
+            TRANSPORT_LOG.info("Соединение с %s установлено (попыток: %d).", session.server, self.attempt + 1)
+        self.attempt = 0
+        self.was_connected = True
+        self._set_state(STATE_CONNECTED)
+        return True
+
+    def get_status_text(self) -> str:
+        """
+        * Описание состояния соединения для строки состояния
+        """
+        session = self.session
+        if self.state == STATE_CONNECTED:
+            room: str = f", комната {session.room}" if session.room else ""
+            return f"Подключено к {session.server}{room}."
+        if self.state == STATE_RECONNECTING:
+            wait: float = max(0.0, self.next_attempt - time.monotonic())
+            if not self.was_connected:
+                return f"Нет подключения к {session.host}:{session.port}. Попытка {self.attempt + 1} через {wait:.0f} с."
+            return f"Соединение потеряно. Попытка {self.attempt + 1} через {wait:.0f} с."
+        if self.state == STATE_CONNECTING:
+            return f"Подключение к {session.host}:{session.port}..."
+        return "Отсутствует подключение к серверу."
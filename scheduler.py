@@ -0,0 +1,89 @@
+"""
+* Адаптивный интервал опроса сервера
+* *************************
+* Сразу после активности (входящие сообщения, ввод текста
+* пользователем) интервал опроса минимален; при тишине он
+* экспоненциально растёт до заданного потолка. Пока окно программы
+* свёрнуто, интервал дополнительно увеличивается.
+"""
+
+from typing import Optional
+import threading
+
+from logs import TRANSPORT_LOG
+
+POLL_MIN_MS: int = 250 # минимальный интервал опроса (мс)
+POLL_MAX_MS: int = 10 * 1000 # максимальный интервал опроса (мс)
+BACKOFF_FACTOR: float = 2.0 # во сколько раз растёт интервал после опроса без новых данных
+ICONIFIED_FACTOR: float = 4.0 # во сколько раз увеличивается интервал, пока окно свёрнуто
+
+class PollScheduler:
+
+    min_ms: int = POLL_MIN_MS
+    max_ms: int = POLL_MAX_MS
+    is_iconified: bool = False # окно программы свёрнуто
+
+    def __init__(self, min_ms: int = POLL_MIN_MS, max_ms: int = POLL_MAX_MS, backoff: float = BACKOFF_FACTOR, iconified_factor: float = ICONIFIED_FACTOR):
+        """
+        * @param min_ms Минимальный интервал опроса (мс)
+        * @param max_ms Максимальный интервал опроса (мс)
+        * @param backoff Множитель роста интервала при тишине
+        * @param iconified_factor Множитель интервала, пока окно свёрнуто
+        """
+        self.min_ms = max(1, min_ms)
+        self.max_ms = max(self.min_ms, max_ms)
+        self.backoff = max(1.0, backoff)
+        self.iconified_factor = max(1.0, iconified_factor)
+        self._lock = threading.Lock() # активность отмечает поток GUI, интервал читает воркер
+        self._base_ms: float = self.min_ms
+        self._reported_ms: Optional[int] = None
+
+    def on_activity(self) -> None:
+        """
+        * Отметка активности: интервал сбрасывается до минимального
+        """
+        with self._lock:
+            self._base_ms = self.min_ms
+        self._report()
+
+    def on_idle(self) -> None:
+        """
+        * Отметка опроса без новых данных: интервал растёт до потолка
+        """
+        with self._lock:
+            self._base_ms = min(self._base_ms * self.backoff, self.max_ms)
+        self._report()
+
+    def set_iconified(self, is_iconified: bool) -> None:
+        """
+        * Отметка сворачивания/разворачивания окна программы
+        *
+        * @param is_iconified True, если окно свёрнуто
+        """
+        self.is_iconified = is_iconified
+        self._report()
+
+    def get_interval_ms(self) -> int:
+        """
+        * Текущий интервал опроса (мс)
+        """
+        with self._lock:
+            interval: float = self._base_ms
+        if self.is_iconified:
+            interval *= self.iconified_factor
+        return int(interval)
+
+    def get_interval(self) -> float:
+        """
+        * Текущий интервал опроса (в секундах)
+        """
+        return self.get_interval_ms() / 1000.0
+
+    def _report(self) -> None:
+        """
+        * Вывод интервала в журнал на уровне DEBUG (только при изменении)
+        """
+        interval: int = self.get_interval_ms()
+        if interval != self._reported_ms:
+            self._reported_ms = interval
+            TRANSPORT_LOG.debug("Интервал опроса сервера: %d мс%s.", interval, " (окно свёрнуто)" if self.is_iconified else "")
@@ -0,0 +1,144 @@
+"""
+* Буфер входящих сообщений нативного протокола DMconnect
+* *************************
+* DMconn складывает принятые сообщения в msg_buffer из своего
+* потока, а клиент забирает их из потока, который работает с сетью.
+* Раньше клиент перебирал список и затем очищал его, поэтому
+* сообщение, добавленное между перебором и clear(), терялось.
+* SequenceBuffer нумерует сообщения по порядку; потребитель хранит
+* номер последнего прочитанного сообщения (курсор) и забирает только
+* более новые, ничего не удаляя. Чтение стоит O(число новых
+* сообщений). Буфер ограничен: самые старые сообщения вытесняются;
+* вытесненные до прочтения сообщения учитываются в счётчике evicted.
+* Для DMconn буфер выглядит как список: append(), len(), перебор,
+* clear(). DMconn добавляет сообщения без блокировки клиента, поэтому
+* буфер должен оказаться у DMconn раньше, чем запустится его поток
+* чтения: with_sequence_buffer() строит подкласс, у которого любое
+* присваивание буфера (в том числе в конструкторе) переносит
+* сообщения в SequenceBuffer.
+"""
+
+from typing import List, Tuple, Iterator, Iterable
+from collections import deque
+import itertools
+import threading
+
+from metrics import METRICS
+
+MSG_BUFFER_SIZE: int = 50000 # сколько последних сообщений хранит буфер
+
+class SequenceBuffer:
+
+    def __init__(self, size: int = MSG_BUFFER_SIZE):
+        """
+        * @param size Ёмкость буфера (сообщений)
+        """
+        self._items: deque = deque(maxlen=max(1, size))
+        self._lock = threading.Lock()
+        self.next_seq: int = 0 # номер, который получит следующее сообщение
+        self.read_seq: int = 0 # курсор после последнего чтения (сообщения до него уже прочитаны)
+        self.evicted: int = 0 # сколько непрочитанных сообщений вытеснено из-за переполнения
+
+    def append(self, line: str) -> None:
+        """
+        * Добавление сообщения (из любого потока)
+        """
+        with self._lock:
+            self._push(line)
+
+    def _push(self, line: str) -> None:
+        if len(self._items) == self._items.maxlen and self.next_seq - len(self._items) >= self.read_seq: # вытесняется непрочитанное
+            self.evicted += 1
+            METRICS.add("msg_buffer_evicted")
+        self._items.append(line)
+        self.next_seq += 1
+
+    def extend(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            self.append(line)
+
+    def adopt(self, owner, attr: str = "msg_buffer") -> None:
+        """
+        * Замена буфера-списка уже работающего владельца этим буфером с
+        * переносом накопленных сообщений. Поток владельца блокировку не
+        * берёт: сообщения, добавленные в список во время замены, переносятся
+        * повторным проходом после неё; сообщение, которое поток добавит в
+        * старый список ещё позже (по ранее прочитанной ссылке), будет
+        * потеряно - поэтому предпочтителен with_sequence_buffer()
+        *
+        * @param owner Объект, которому принадлежит буфер (DMconn)
+        * @param attr Имя атрибута с буфером
+        """
+        old = getattr(owner, attr, None)
+        with self._lock:
+            copied: List[str] = list(old) if old is not None else []
+            for line in copied:
+                self._push(line)
+            setattr(owner, attr, self)
+            if old is not None: # добавленные в список между переносом и заменой (список только растёт)
+                for line in list(old)[len(copied):]:
+                    self._push(line)
+
+    def read_after(self, cursor: int) -> Tuple[List[str], int]:
+        """
+        * Сообщения, добавленные после курсора
+        *
+        * @param cursor Номер следующего непрочитанного сообщения
+        * @return Кортеж (сообщения по порядку, новый курсор)
+        """
+        with self._lock:
+            count: int = min(self.next_seq - cursor, len(self._items)) # вытесненные сообщения уже не прочитать
+            if count <= 0:
+                return [], self.next_seq
+            lines: List[str] = list(itertools.islice(reversed(self._items), count)) # с конца: O(count), а не O(размер буфера)
+            end: int = self.next_seq
+            self.read_seq = max(self.read_seq, end)
+        lines.reverse()
+        return lines, end
+
+    def has_after(self, cursor: int) -> bool:
+        """
+        * Есть ли сообщения после курсора
+        """
+        return self.next_seq > cursor
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._items))
+
+    def clear(self) -> None:
+        """
+        * Удаление хранимых сообщений (нумерация продолжается)
+        """
+        with self._lock:
+            self._items.clear()
+
+def with_sequence_buffer(cls: type, attr: str = "msg_buffer") -> type:
+    """
+    * Подкласс, у которого буфер сообщений - SequenceBuffer с момента
+    * создания объекта: присваивание списка (self.msg_buffer = [] в
+    * конструкторе, до запуска потока чтения) переносит его элементы
+    * в SequenceBuffer объекта, а не заменяет буфер
+    *
+    * @param cls Класс-владелец буфера (DMconn)
+    * @param attr Имя атрибута с буфером
+    * @return Подкласс cls
+    """
+    key: str = f"_{attr}_sequence"
+
+    def get_buffer(owner) -> SequenceBuffer:
+        buffer: SequenceBuffer = owner.__dict__.get(key)
+        if buffer is None:
+            buffer = owner.__dict__.setdefault(key, SequenceBuffer())
+        return buffer
+
+    def set_buffer(owner, value) -> None:
+        if isinstance(value, SequenceBuffer):
+            owner.__dict__[key] = value
+        else:
+            get_buffer(owner).extend(value) # новый список - продолжение того же потока сообщений
+
+    return type(cls.__name__, (cls,), {attr: property(get_buffer, set_buffer), "__doc__": cls.__doc__})
@@ -0,0 +1,825 @@
+"""
+* Сетевой сеанс DMconnect без графического интерфейса
+* *************************
+* Класс содержит всю работу с сервером DMconnect: настройки,
+* подключение, аутентификацию, отправку команд и чтение ответов.
+* Модуль не импортирует tkinter, поэтому используется как
+* графическим клиентом (см. dmconnect.py), так и консольным
+* режимом без дисплея (см. headless.py).
+* Документацию по протоколу DMconnect можно изучить на
+* сайте: https://dmconnectspec.w10.site
+"""
+
+from typing import Optional, List, Dict, Callable
+import os
+from socket import socket
+from socket import SOL_SOCKET, SO_KEEPALIVE, IPPROTO_TCP
+try: # решение проблемы "ImportError: cannot import name 'TCP_KEEPCNT' from 'socket'"
+    from socket import TCP_KEEPCNT
+except ImportError:
+    TCP_KEEPCNT = None
+try: # решение проблемы "ImportError: cannot import name 'TCP_KEEPINTVL' from 'socket'"
+    from socket import TCP_KEEPINTVL
+except ImportError:
+    TCP_KEEPINTVL = None
+try: # решение проблемы "ImportError: cannot import name 'TCP_KEEPIDLE' from 'socket'"
+    from socket import TCP_KEEPIDLE
+except ImportError:
+    TCP_KEEPIDLE = None
+try: # только Microsoft Windows
+    from socket import SIO_KEEPALIVE_VALS
+except ImportError:
+    SIO_KEEPALIVE_VALS = None
+import sys
+import time
+import threading
+import random
+import configparser
+import logging
+import errno
+import select
+import codecs
+from concurrent.futures import Future
+
+from dmconn import DMconn # подключение класса для работы с протоколом DMconnect
+from miscellaneous import Miscellaneous
+from models import Constant
+from completion import ResponseCompletion, PROMPTS
+from framer import SocketReader
+from commands import CommandPipeline
+from seqbuffer import SequenceBuffer, with_sequence_buffer
+from connector import RESOLVER, CONNECT_TIMEOUT, CANCEL_CHECK_INTERVAL, ConnectCancelled, connect_first
+from members import MembersCache, MEMBERS_TTL
+from protocol import EventDispatcher, ProtocolEvent, MembersList, Join, Leave, LoginResult, LIST_OF_USERS, parse_line
+from scheduler import POLL_MIN_MS, POLL_MAX_MS
+from reconnect import RECONNECT_MAX_DELAY
+from outbound import SEND_RATE, SEND_BURST, QUEUE_SIZE
+from metrics import METRICS, METRICS_INTERVAL
+from logs import TRANSPORT_LOG, PROTOCOL_LOG, INCOMING, OUTGOING, LOG_LEVEL, TrafficRing, setup_logging
+
+CODEPAGE: str = "utf-8" # используемая кодировка (по умолчанию)
+NEW_LINE: str = "\n" # признак новой строки
+DELAY: float = 5 # крайний срок ожидания ответа сервера на команду (в секундах)
+NATIVE_POLL_INTERVAL: float = 0.05 # период проверки буфера сообщений нативного протокола (в секундах)
+DISCONNECT_MESSAGE: str = "Соединение с сервером разорвано."
+
+STAGE_RESOLVING: str = "resolving" # этапы подключения (см. establish_connection())
+STAGE_CONNECTING: str = "connecting"
+STAGE_AUTHENTICATING: str = "authenticating"
+STAGE_JOINING: str = "joining"
+CONNECT_STAGES: Dict[str, str] = {
+    STAGE_RESOLVING: "Поиск адреса сервера...",
+    STAGE_CONNECTING: "Подключение к серверу...",
+    STAGE_AUTHENTICATING: "Вход на сервер...",
+    STAGE_JOINING: "Вход в комнату...",
+}
+PING_CMD: str = "/" # команда "ping" для сервера DMconnect
+KEEPALIVE_IDLE: int = 60 # время простоя соединения до отправки "ping" и до первой TCP keepalive-пробы (в секундах)
+TCP_KEEPALIVE_INTERVAL: int = 10 # интервал между TCP keepalive-пробами (в секундах)
+TCP_KEEPALIVE_COUNT: int = 3 # число TCP keepalive-проб без ответа до разрыва соединения
+
+HISTORY_DB: str = "history.sqlite3" # файл базы данных истории чата по умолчанию
+
+ENV_HOST: str = "DMCONNECT_HOST" # переменные окружения с параметрами подключения (имеют приоритет над файлом настроек)
+ENV_PORT: str = "DMCONNECT_PORT"
+ENV_LOGIN: str = "DMCONNECT_LOGIN"
+ENV_PASSWORD: str = "DMCONNECT_PASSWORD"
+ENV_ROOM: str = "DMCONNECT_ROOM"
+
+# Настройки, общие для всех сеансов (копируются из сеанса-образца, см. DMconnectSession.__init__())
+SETTINGS_ATTRS: tuple = ("is_telnet", "is_native", "codepage", "members_ttl", "history_db", "poll_min_ms", "poll_max_ms", "keepalive_idle", "log_level", "log_file", "reconnect_max_delay", "outbox_size", "send_rate", "send_burst", "metrics_file", "metrics_interval")
+
+debugged: bool = False # режим отладки (по умолчанию отключён)
+
+def is_debugged() -> bool:
+    """
+    * Включён ли режим отладки (работа без реальной сети)
+    """
+    return debugged
+
+BufferedDMconn = with_sequence_buffer(DMconn) # msg_buffer - SequenceBuffer ещё до запуска потока чтения DMconn
+
+class DMconnectSession:
+
+    sock: Optional[socket] = None
+    dm_obj: Optional[DMconn] = None
+    msg_cursor: int = 0 # номер следующего непрочитанного сообщения в буфере DMconn (см. get_msg_buffer())
+    is_connected: bool = False
+    is_authenticated: bool = False # признак аутентификации пользователя
+    is_telnet: bool = False # признак Telnet-совместимого обмена данными
+    is_native: bool = True # нативный протокол DMconnect
+    codepage: str = CODEPAGE # кодировка обмена данными с сервером
+    reader: Optional[SocketReader] = None # буферизованный читатель сокета текущего соединения
+    members: Optional[MembersCache] = None # кэш списка участников чата
+    members_ttl: float = MEMBERS_TTL # период полной пересинхронизации списка участников (в секундах)
+    server: Optional[str] = None # сервер текущего соединения ("хост:порт")
+    room: Optional[str] = None # комната, в которую выполнен вход командой /join_server
+    history_db: str = HISTORY_DB # файл базы данных истории чата (пустая строка - история не сохраняется)
+    poll_min_ms: int = POLL_MIN_MS # минимальный интервал опроса сервера (мс)
+    poll_max_ms: int = POLL_MAX_MS # максимальный интервал опроса сервера (мс)
+    keepalive_idle: int = KEEPALIVE_IDLE # время простоя соединения до отправки "ping" (в секундах)
+    reconnect_max_delay: float = RECONNECT_MAX_DELAY # максимальная задержка между попытками переподключения (в секундах)
+    outbox_size: int = QUEUE_SIZE # сколько исходящих сообщений может ждать отправки (в том числе на время разрыва соединения)
+    send_rate: float = SEND_RATE # средняя скорость отправки сообщений (строк в секунду)
+    send_burst: int = SEND_BURST # сколько строк можно отправить подряд без паузы
+    metrics_file: str = "" # файл для периодической записи метрик (пустая строка - только по запросу)
+    metrics_interval: float = METRICS_INTERVAL # период записи метрик в файл (в секундах)
+    last_sent: float = 0.0 # момент последней успешной отправки данных серверу (time.monotonic())
+    last_received: float = 0.0 # момент последнего получения данных от сервера (time.monotonic())
+    log_level: str = LOG_LEVEL # уровень журнала (DEBUG, INFO, WARNING, ERROR)
+    log_file: str = "" # файл журнала с ротацией (пустая строка - только консоль)
+    host: str = "" # параметры подключения из файла настроек или переменных окружения
+    port: Optional[int] = None
+    login: str = ""
+    password: str = ""
+    default_room: str = "" # комната, в которую выполняется вход после подключения (пустая строка - без входа)
+    left_for_chat: List[str] = [] # строки ответа от сервера для чата (в порядке получения)
+    cancel_event: Optional[threading.Event] = None # отмена выполняющегося подключения (только во время establish_connection())
+    events: Optional[EventDispatcher] = None # разбор входящих строк и рассылка событий протокола
+    commands: Optional[CommandPipeline] = None # команды, ожидающие ответа (см. submit_command())
+    traffic: Optional[TrafficRing] = None # последние строки обмена с сервером этого сеанса
+
+    def __init__(self, template: Optional["DMconnectSession"] = None):
+        """
+        * @param template Сеанс, настройки которого копируются вместо повторного
+        *        чтения файла настроек (для нескольких одновременных сеансов)
+        """
+        if template is None:
+            self.get_config()
+            self.get_credentials()
+        else:
+            for attr in SETTINGS_ATTRS:
+                setattr(self, attr, getattr(template, attr))
+        self.left_for_chat = [] # у каждого сеанса - свои буферы
+        self.traffic = TrafficRing()
+        self.members = MembersCache(self.members_ttl)
+        self.events = EventDispatcher()
+        for kind in (MembersList, Join, Leave):
+            self.events.subscribe(kind, self.on_members_event)
+        self.commands = CommandPipeline()
+        if debugged:
+            self.is_connected = True
+
+    def on_members_event(self, event: ProtocolEvent) -> None:
+        """
+        * Список участников и уведомления о входе/выходе - в кэш участников
+        """
+        if self.members is not None:
+            self.members.apply(event, self.room)
+
+    def log_disconnect(self) -> None:
+        """
+        * Запись в журнал разрыва соединения вместе с последними строками обмена с сервером
+        """
+        TRANSPORT_LOG.error(DISCONNECT_MESSAGE)
+        self.traffic.dump(TRANSPORT_LOG)
+
+    def get_idle_time(self) -> float:
+        """
+        * Время простоя соединения: сколько прошло с последней отправки или получения данных
+        *
+        * @return Время в секундах
+        """
+        return time.monotonic() - max(self.last_sent, self.last_received)
+
+    def keepalive(self) -> None:
+        """
+        * Поддержание соединения путём отправки команды "ping" на сервер.
+        * Команда отправляется, только если соединение простаивало дольше
+        * keepalive_idle секунд: любой реальный обмен данными уже доказывает,
+        * что соединение живо. Обрыв "молчащего" соединения дополнительно
+        * обнаруживает TCP keepalive (см. set_tcp_keepalive()).
+        """
+        if self.is_connected: # есть вообще подключение к серверу?
+            if not debugged:
+                if not self.is_native and self.get_idle_time() >= self.keepalive_idle:
+                    PROTOCOL_LOG.debug("Отправка ping на сервер.")
+                    self.submit_command(self.sock, PING_CMD) # ответ на ping не нужен - не ждём его
+    
+    def get_user_list(self) -> List[str]:
+        """
+        * Возвращает массив логинов пользователей. Если список устарел,
+        * серверу отправляется "/members" без ожидания ответа: ответ
+        * обновит кэш участников при чтении входящих строк (см. read_socket()),
+        * а сообщения, пришедшие до него, попадут в чат в обычном порядке
+        *
+        * @return Список пользователей (из кэша)
+        """
+        if debugged: # в режиме отладки возвращаем фиксированный список пользователей без обращения в сеть
+            return [name.strip() for name in "Bepyaka, logger, arson-test, pro_O, Khrich, kopor'je, Archie, guester, 0010, root, dm906, Peacemaker, ZiNc".split(',')]
+        user_list = []
+        if self.is_connected: # есть вообще подключение к серверу?
+            self.left_for_chat.clear()
+            if not debugged:
+                self.keepalive()
+                if self.is_authenticated and self.members.is_stale() and not self.commands.is_pending("/members"): # список участников ведётся по уведомлениям сервера, /members - только для пересинхронизации
+                    PROTOCOL_LOG.debug("Запрос у сервера списка участников чата...")
+                    self.submit_command(self.sock, "/members")
+            else:
+                events: List[ProtocolEvent] = self.events.dispatch([
+                    f"{LIST_OF_USERS}'general': Bepyaka, logger, arson-test, pro_O, Khrich, kopor'je, Archie, guester, 0010, root, dm906, Peacemaker, ZiNc, bwMate, IRC_bridge, Vasylich, perliT@geeks.l5.ca, dymka2@linuxers.hs.vc, usr34098",
+                    "user01: test2",
+                    f"{LIST_OF_USERS}'dsalin_': John, Peter,Joe, Вася,   Bethany, Пётр,Mark,John, Peter,Joe, Вася,John, Peter,Joe, Вася,John, Peter,Joe, Вася,John, Peter,Joe, Вася,John, Peter,Joe, Вася,John, Peter,Joe, Вася,John, Peter,Joe, Вася,John, Peter,Joe, Вася",
+                ])
+                self.left_for_chat.extend(event.line for event in events if not isinstance(event, MembersList))
+            user_list = self.members.get_users() # кэш заполнен/обновлён в read_socket()
+        return user_list
+
+    def get_messages_for_chat(self) -> List[str]:
+        """
+        * Возвращает массив новых строк для чата
+        *
+        * @return Список строк для чата
+        """
+        messages = []
+        if self.is_connected: # есть вообще подключение к серверу?
+            if not debugged:
+                self.keepalive()
+                response_lines: List[str] = []
+                response_lines = self.read_socket(self.sock)
+                for line in response_lines:
+                    messages.append(line)
+            else:
+                if random.choice([True, False, False]): # Пример: ~33% шанс получить новые сообщения
+                    messages.append("Alex: Привет всем!")
+                if random.choice([True, False, False]):
+                    messages.append("Guest: Как дела?")
+                if random.choice([True, False, False]):
+                    messages.append("Admin: Не забывайте про правила.")
+        return messages
+
+    def get_config(self) -> None:
+        """
+         * Получение конфигурации программы
+        """
+        global debugged
+        GLOBAL_SECTION: str = "global"
+        DEBUG: str = "debug"
+        TELNET: str = "telnet"
+        NATIVE: str = "native"
+        MEMBERS_TTL_KEY: str = "members_ttl"
+        CODEPAGE_KEY: str = "codepage"
+        HISTORY_DB_KEY: str = "history_db"
+        POLL_MIN_KEY: str = "poll_min_ms"
+        POLL_MAX_KEY: str = "poll_max_ms"
+        KEEPALIVE_KEY: str = "keepalive_idle"
+        RECONNECT_KEY: str = "reconnect_max_delay"
+        OUTBOX_KEY: str = "outbox_size"
+        SEND_RATE_KEY: str = "send_rate"
+        SEND_BURST_KEY: str = "send_burst"
+        METRICS_FILE_KEY: str = "metrics_file"
+        METRICS_INTERVAL_KEY: str = "metrics_interval"
+        LOG_LEVEL_KEY: str = "log_level"
+        LOG_FILE_KEY: str = "log_file"
+        CONNECTION_KEYS: tuple = ("host", "port", "login", "password", "room")
+        if Miscellaneous.is_file_readable(Constant.SETTINGS_FILE.value):
+            config = configparser.ConfigParser()
+            try:
+                with open(Constant.SETTINGS_FILE.value, 'r', encoding=Constant.GLOBAL_CODEPAGE.value) as f:
+                    config.read_file(f)
+                    if not debugged: # включали и настраивали уже отладку?
+                        if GLOBAL_SECTION in config and DEBUG in config[GLOBAL_SECTION]:
+                            debugged = (config[GLOBAL_SECTION][DEBUG].upper().strip() == "Y")
+                        if GLOBAL_SECTION in config and TELNET in config[GLOBAL_SECTION]:
+                            self.is_telnet = (config[GLOBAL_SECTION][TELNET].upper().strip() == "Y")
+                        if GLOBAL_SECTION in config and NATIVE in config[GLOBAL_SECTION]:
+                            self.is_native = (config[GLOBAL_SECTION][NATIVE].upper().strip() == "Y")
+                        if GLOBAL_SECTION in config and MEMBERS_TTL_KEY in config[GLOBAL_SECTION]:
+                            try:
+                                self.members_ttl = max(0.0, float(config[GLOBAL_SECTION][MEMBERS_TTL_KEY].strip()))
+                            except ValueError:
+                                Miscellaneous.print_message(f"Некорректное значение '{MEMBERS_TTL_KEY}', используется {MEMBERS_TTL}.")
+                        if GLOBAL_SECTION in config and POLL_MIN_KEY in config[GLOBAL_SECTION]:
+                            try:
+                                self.poll_min_ms = max(1, int(config[GLOBAL_SECTION][POLL_MIN_KEY].strip()))
+                            except ValueError:
+                                Miscellaneous.print_message(f"Некорректное значение '{POLL_MIN_KEY}', используется {POLL_MIN_MS}.")
+                        if GLOBAL_SECTION in config and POLL_MAX_KEY in config[GLOBAL_SECTION]:
+                            try:
+                                self.poll_max_ms = max(1, int(config[GLOBAL_SECTION][POLL_MAX_KEY].strip()))
+                            except ValueError:
+                                Miscellaneous.print_message(f"Некорректное значение '{POLL_MAX_KEY}', используется {POLL_MAX_MS}.")
+                        if GLOBAL_SECTION in config and KEEPALIVE_KEY in config[GLOBAL_SECTION]:
+                            try:
+                                self.keepalive_idle = max(1, int(config[GLOBAL_SECTION][KEEPALIVE_KEY].strip()))
+                            except ValueError:
+                                Miscellaneous.print_message(f"Некорректное значение '{KEEPALIVE_KEY}', используется {KEEPALIVE_IDLE}.")
+                        if GLOBAL_SECTION in config and RECONNECT_KEY in config[GLOBAL_SECTION]:
+                            try:
+                                self.reconnect_max_delay = max(1.0, float(config[GLOBAL_SECTION][RECONNECT_KEY].strip()))
+                            except ValueError:
+                                Miscellaneous.print_message(f"Некорректное значение '{RECONNECT_KEY}', используется {RECONNECT_MAX_DELAY}.")
+                        if GLOBAL_SECTION in config and OUTBOX_KEY in config[GLOBAL_SECTION]:
+                            try:
+                                self.outbox_size = max(1, int(config[GLOBAL_SECTION][OUTBOX_KEY].strip()))
+                            except ValueError:
+                                Miscellaneous.print_message(f"Некорректное значение '{OUTBOX_KEY}', используется {QUEUE_SIZE}.")
+                        if GLOBAL_SECTION in config and SEND_RATE_KEY in config[GLOBAL_SECTION]:
+                            try:
+                                self.send_rate = max(0.1, float(config[GLOBAL_SECTION][SEND_RATE_KEY].strip()))
+                            except ValueError:
+                                Miscellaneous.print_message(f"Некорректное значение '{SEND_RATE_KEY}', используется {SEND_RATE}.")
+                        if GLOBAL_SECTION in config and SEND_BURST_KEY in config[GLOBAL_SECTION]:
+                            try:
+                                self.send_burst = max(1, int(config[GLOBAL_SECTION][SEND_BURST_KEY].strip()))
+                            except ValueError:
+                                Miscellaneous.print_message(f"Некорректное значение '{SEND_BURST_KEY}', используется {SEND_BURST}.")
+                        if GLOBAL_SECTION in config and METRICS_FILE_KEY in config[GLOBAL_SECTION]:
+                            self.metrics_file = config[GLOBAL_SECTION][METRICS_FILE_KEY].strip()
+                        if GLOBAL_SECTION in config and METRICS_INTERVAL_KEY in config[GLOBAL_SECTION]:
+                            try:
+                                self.metrics_interval = max(1.0, float(config[GLOBAL_SECTION][METRICS_INTERVAL_KEY].strip()))
+                            except ValueError:
+                                Miscellaneous.print_message(f"Некорректное значение '{METRICS_INTERVAL_KEY}', используется {METRICS_INTERVAL}.")
+                        if GLOBAL_SECTION in config and LOG_LEVEL_KEY in config[GLOBAL_SECTION]:
+                            self.log_level = config[GLOBAL_SECTION][LOG_LEVEL_KEY].strip()
+                        if GLOBAL_SECTION in config and LOG_FILE_KEY in config[GLOBAL_SECTION]:
+                            self.log_file = config[GLOBAL_SECTION][LOG_FILE_KEY].strip()
+                        for key in CONNECTION_KEYS:
+                            if GLOBAL_SECTION in config and key in config[GLOBAL_SECTION]:
+                                self.set_credential(key, config[GLOBAL_SECTION][key].strip())
+                        if GLOBAL_SECTION in config and HISTORY_DB_KEY in config[GLOBAL_SECTION]:
+                            self.history_db = config[GLOBAL_SECTION][HISTORY_DB_KEY].strip()
+                        if GLOBAL_SECTION in config and CODEPAGE_KEY in config[GLOBAL_SECTION]:
+                            codepage: str = config[GLOBAL_SECTION][CODEPAGE_KEY].strip()
+                            try:
+                                self.codepage = codecs.lookup(codepage).name
+                            except LookupError:
+                                Miscellaneous.print_message(f"Неизвестная кодировка '{codepage}', используется {CODEPAGE}.")
+            except FileNotFoundError:
+                Miscellaneous.print_message(f"Ошибка: Файл настроек не найден: {Constant.SETTINGS_FILE.value}")
+                raise
+            except Exception as e:
+                Miscellaneous.print_message(f"Ошибка при чтении файла настроек: {e}")
+                raise
+        setup_logging(self.log_level, self.log_file)
+        if debugged:
+            Miscellaneous.print_message("Включён режим отладки.")
+        if self.is_telnet:
+            Miscellaneous.print_message("Включён режим совместимости с Telnet.")
+        if self.is_native:
+            Miscellaneous.print_message("Включена поддержка нативного протокола DMconnect.")
+        Miscellaneous.print_message(f"Кодировка обмена данными с сервером: {self.codepage}.")
+
+    def set_credential(self, key: str, value: str) -> None:
+        """
+        * Установка параметра подключения
+        *
+        * @param key Имя параметра (host, port, login, password, room)
+        * @param value Значение
+        """
+        if key == "port":
+            try:
+                port: int = int(value)
+                self.port = port if 1 <= port <= 65534 else None
+            except ValueError:
+                self.port = None
+        elif key == "room":
+            self.default_room = value
+        elif key in ("host", "login", "password"):
+            setattr(self, key, value)
+
+    def get_credentials(self) -> None:
+        """
+        * Получение параметров подключения из переменных окружения
+        * (дополняют и переопределяют значения из файла настроек)
+        """
+        for key, env in (("host", ENV_HOST), ("port", ENV_PORT), ("login", ENV_LOGIN), ("password", ENV_PASSWORD), ("room", ENV_ROOM)):
+            value: Optional[str] = os.environ.get(env)
+            if value is not None:
+                self.set_credential(key, value.strip())
+
+    def has_credentials(self) -> bool:
+        """
+        * Заданы ли все параметры, необходимые для подключения без формы
+        """
+        return not "".__eq__(self.host) and self.port is not None and not "".__eq__(self.login) and not "".__eq__(self.password)
+
+    def get_reader(self, s: socket) -> SocketReader:
+        """
+        * Буферизованный читатель для сокета текущего соединения
+        *
+        * @param s Экземпляр сокета
+        * @return Экземпляр SocketReader (создаётся один раз на соединение)
+        """
+        if self.reader is None or self.reader.sock is not s:
+            self.reader = SocketReader(s, self.codepage)
+        return self.reader
+
+    def get_msg_buffer(self) -> SequenceBuffer:
+        """
+        * Буфер принятых сообщений нативного протокола (SequenceBuffer с
+        * момента создания DMconn, см. BufferedDMconn)
+        *
+        * @return Экземпляр SequenceBuffer
+        """
+        buffer = self.dm_obj.msg_buffer
+        if not isinstance(buffer, SequenceBuffer): # DMconn обошёл свойство msg_buffer - замена на ходу
+            buffer = SequenceBuffer()
+            buffer.adopt(self.dm_obj)
+            self.msg_cursor = 0
+        return buffer
+
+    def read_socket(self, s: socket) -> List[str]:
+        """
+        * Неблокирующее чтение всех уже полученных от сервера строк
+        *
+        * @param s Экземпляр сокета
+        * @return Массив строк
+        """
+        response_lines: List[str] = []
+        if self.is_connected: # есть вообще подключение к серверу?
+            if not debugged:
+                if self.is_native: # только сообщения после курсора, буфер не очищается - ничего не теряется
+                    response_lines, self.msg_cursor = self.get_msg_buffer().read_after(self.msg_cursor)
+                else:
+                    line: Optional[str] = None
+                    if not self.is_telnet:
+                        try:
+                            reader: SocketReader = self.get_reader(s)
+                            for line in reader.drain(PROMPTS):
+                                line = line.strip()
+                                if not "".__eq__(line):
+                                    response_lines.append(line)
+                            if reader.is_eof: # сервер закрыл соединение
+                                self.is_connected = False
+                            elif len(response_lines) > 0:
+                                self.last_received = time.monotonic()
+                        except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError): # фатальная сетевая ошибка - закрываем сокет
+                            self.log_disconnect()
+                            try:
+                                s.close()
+                            except Exception:
+                                pass
+                            self.sock = None
+                            self.is_connected = False
+                            raise
+                        except OSError as e:
+                            if e.errno in (errno.ENETDOWN, errno.ENETUNREACH, errno.ECONNRESET, errno.ECONNABORTED, errno.ECONNREFUSED): # фатальная сетевая ошибка - закрываем сокет
+                                self.log_disconnect()
+                                try:
+                                    s.close()
+                                except Exception:
+                                    pass
+                                self.sock = None
+                                self.is_connected = False
+                                raise
+                            else:
+                                pass
+                        except Exception:
+                            pass
+                    else:
+                        try:
+                            # читаем ответ построчно через долгоживущий буферизованный читатель соединения
+                            reader: SocketReader = self.get_reader(s)
+                            for line in reader.drain(PROMPTS):
+                                if not "".__eq__(line): # пустые строки в чат не выводим
+                                    response_lines.append(line)
+                            if reader.is_eof: # EOF - сервер закрыл соединение
+                                self.is_connected = False
+                            elif len(response_lines) > 0:
+                                self.last_received = time.monotonic()
+                        except Exception:
+                            try:
+                                s.close()
+                            except Exception:
+                                pass
+                            self.sock = None
+                            self.is_connected = False
+                            raise
+        if len(response_lines) > 0:
+            METRICS.add("lines_in", len(response_lines))
+            self.traffic.record_lines(INCOMING, response_lines)
+            if TRANSPORT_LOG.isEnabledFor(logging.DEBUG): # строка для журнала строится, только если она будет выведена
+                TRANSPORT_LOG.debug("Получено строк: %d\n%s", len(response_lines), NEW_LINE.join(response_lines))
+            if self.events is not None:
+                events: List[ProtocolEvent] = self.events.dispatch(response_lines) # один разбор строк: список участников, уведомления о входе/выходе и т.д.
+                if self.commands is not None and len(self.commands) > 0:
+                    response_lines = self.commands.claim(events) # ответы на команды - в их Future, остальное - в чат
+        if self.commands is not None and len(self.commands) > 0:
+            self.commands.expire()
+        return response_lines
+
+    def wait_response(self, s: socket, completion: ResponseCompletion) -> List[str]:
+        """
+        * Ожидание ответа сервера на команду (без фиксированной паузы)
+        *
+        * @param s Экземпляр сокета
+        * @param completion Условие завершения ответа
+        * @return Массив строк
+        """
+        response_lines: List[str] = []
+        while self.is_connected:
+            wait: float = completion.next_wait()
+            if wait <= 0:
+                break
+            if self.cancel_event is not None: # идёт подключение - ожидание прерывается отменой
+                if self.cancel_event.is_set():
+                    raise ConnectCancelled("Подключение отменено.")
+                wait = min(wait, CANCEL_CHECK_INTERVAL)
+            lines: List[str] = []
+            if self.is_native:
+                if not self.get_msg_buffer().has_after(self.msg_cursor):
+                    time.sleep(min(wait, NATIVE_POLL_INTERVAL))
+                lines = self.read_socket(s)
+            else:
+                readable, _, _ = select.select([s], [], [], wait)
+                if readable:
+                    lines = self.read_socket(s)
+            response_lines.extend(lines)
+            completion.feed(lines)
+        return response_lines
+
+    def write_command(self, s: socket, cmd: str) -> bool:
+        """
+        * Запись команды в сокет (без ожидания ответа). Фатальная сетевая
+        * ошибка закрывает сокет и передаётся вызывающему коду
+        *
+        * @param s Экземпляр сокета
+        * @param cmd Команда
+        * @return True, если команда записана (False - нефатальная ошибка, соединение не разорвано)
+        """
+        cmd2: str = f"{cmd.strip()}{NEW_LINE}"
+        data: bytes = b""
+        if PROTOCOL_LOG.isEnabledFor(logging.DEBUG):
+            PROTOCOL_LOG.debug("Отправка команды \"%s\" серверу...", TrafficRing.mask(cmd.strip()))
+        self.traffic.record(OUTGOING, cmd.strip())
+        if self.is_native:
+            self.dm_obj.write(cmd.strip())
+        else:
+            if not self.is_telnet:
+                try:
+                    data = cmd2.encode(self.codepage, errors="replace") # с переводом строки: команды, отправленные подряд, не склеиваются
+                    s.sendall(data)
+                except (ConnectionResetError, ConnectionAbortedError, BrokenPipeError): # фатальная сетевая ошибка - закрываем сокет
+                    self.log_disconnect()
+                    try:
+                        s.close()
+                    except Exception:
+                        pass
+                    self.sock = None
+                    self.is_connected = False
+                    raise
+                except OSError as e:
+                    if e.errno in (errno.ENETDOWN, errno.ENETUNREACH, errno.ECONNRESET, errno.ECONNABORTED, errno.ECONNREFUSED): # фатальная сетевая ошибка - закрываем сокет
+                        self.log_disconnect()
+                        try:
+                            s.close()
+                        except Exception:
+                            pass
+                        self.sock = None
+                        self.is_connected = False
+                        raise
+                    TRANSPORT_LOG.warning("Команда не отправлена серверу: %s", e)
+                    return False
+                except Exception as e:
+                    TRANSPORT_LOG.warning("Команда не отправлена серверу: %s", e)
+                    return False
+            else:
+                data = cmd2.encode(self.codepage, errors="replace")
+                s.sendall(data)
+        METRICS.add("lines_out")
+        METRICS.add("bytes_out", len(data)) # нативный протокол: считаются только строки
+        self.last_sent = time.monotonic()
+        if cmd.strip().lower().startswith("/join_server"):
+            parts: List[str] = cmd.strip().split(maxsplit=1)
+            self.room = parts[1] if len(parts) == 2 else None
+            if self.members is not None:
+                self.members.invalidate() # смена комнаты - список участников нужно получить заново
+        return True
+
+    def drop_connection(self, s: socket) -> None:
+        """
+        * Закрытие соединения после ошибки обмена данными
+        *
+        * @param s Экземпляр сокета
+        """
+        self.traffic.dump(TRANSPORT_LOG) # что предшествовало ошибке
+        if self.is_native:
+            self.dm_obj.close()
+        else:
+            try:
+                s.close()
+            except Exception:
+                pass
+        self.sock = None
+        self.is_connected = False
+        if self.commands is not None:
+            self.commands.fail_all(ConnectionError(DISCONNECT_MESSAGE))
+
+    def send_command(self, s: socket, cmd: str) -> bool:
+        """
+        * Команда для сервера без ожидания ответа: ответ будет прочитан
+        * вместе с остальными входящими строками (см. read_socket())
+        *
+        * @param s Экземпляр сокета
+        * @param cmd Команда
+        * @return True, если команда записана в сокет (в режиме отладки - всегда)
+        """
+        if debugged:
+            return True
+        if not self.is_connected:
+            return False
+        try:
+            return self.write_command(s, cmd)
+        except Exception:
+            self.drop_connection(s)
+            raise
+
+    def submit_command(self, s: socket, cmd: str, deadline: Optional[float] = None) -> Future:
+        """
+        * Команда для сервера без ожидания ответа в вызывающем коде: несколько
+        * команд могут ожидать ответа одновременно, ответ каждой соотносится с
+        * командой по виду строк (см. commands.py) и исключается из строк для чата
+        *
+        * @param s Экземпляр сокета
+        * @param cmd Команда
+        * @param deadline Крайний срок ожидания ответа (в секундах); по умолчанию DELAY
+        * @return Future, результат - массив строк ответа
+        """
+        future: Future = Future()
+        if not self.is_connected or debugged:
+            future.set_result([])
+            return future
+        pending: Optional[Future] = self.commands.get_pending(cmd)
+        if pending is not None: # такая же команда уже ждёт ответа - второй ответ сервера никому не достанется
+            return pending
+        try:
+            if not self.write_command(s, cmd):
+                future.set_exception(OSError(f"Команда \"{cmd.strip()}\" не отправлена серверу."))
+                return future
+        except Exception as e:
+            self.drop_connection(s)
+            future.set_exception(e)
+            return future
+        return self.commands.add(cmd, DELAY if deadline is None else deadline)
+
+    @staticmethod
+    def get_command_type(cmd: str) -> str:
+        """
+        * Вид команды для метрик: сама команда ("/members") или "message"
+        """
+        cmd = cmd.strip()
+        return cmd.split(maxsplit=1)[0].lower() if cmd.startswith("/") else "message"
+
+    def execute_command(self, s: socket, cmd: str, deadline: Optional[float] = None) -> List[str]:
+        """
+        * Команда для сервера
+        *
+        * @param s Экземпляр сокета
+        * @param cmd Команда
+        * @param deadline Крайний срок ожидания ответа (в секундах); по умолчанию DELAY
+        *        для команд с явным ответом и короткий интервал для остальных
+        * @return Массив строк
+        """
+        response_lines: List[str] = []
+        if self.is_connected: # есть вообще подключение к серверу?
+            if not debugged:
+                try:
+                    started: float = time.perf_counter()
+                    self.write_command(s, cmd)
+                    if deadline is None and ResponseCompletion.expects_reply(cmd):
+                        deadline = DELAY
+                    response_lines = self.wait_response(s, ResponseCompletion(cmd, deadline))
+                    METRICS.observe(f"rtt {self.get_command_type(cmd)}", (time.perf_counter() - started) * 1000.0)
+                except ConnectCancelled: # отмена - не ошибка обмена, журнал обмена не нужен
+                    self.close()
+                    raise
+                except Exception:
+                    self.drop_connection(s)
+                    raise
+        return response_lines
+    
+    def set_tcp_keepalive(self, s: socket) -> None:
+        """
+        * Включение TCP keepalive: операционная система сама проверяет
+        * простаивающее соединение и обнаруживает его обрыв
+        *
+        * @param s Экземпляр сокета
+        """
+        TCP_KEEPALIVE: int = 0x10
+        try:
+            s.setsockopt(SOL_SOCKET, SO_KEEPALIVE, 1)
+            if sys.platform.startswith("linux"):
+                if TCP_KEEPIDLE is not None:
+                    s.setsockopt(IPPROTO_TCP, TCP_KEEPIDLE, self.keepalive_idle) # время простоя до первого keepalive
+                if TCP_KEEPINTVL is not None:
+                    s.setsockopt(IPPROTO_TCP, TCP_KEEPINTVL, TCP_KEEPALIVE_INTERVAL) # интервал между keepalive
+                if TCP_KEEPCNT is not None:
+                    s.setsockopt(IPPROTO_TCP, TCP_KEEPCNT, TCP_KEEPALIVE_COUNT) # число попыток до разрыва
+            elif sys.platform.startswith("darwin") or "bsd" in sys.platform:
+                s.setsockopt(IPPROTO_TCP, TCP_KEEPALIVE, self.keepalive_idle)
+            elif sys.platform.startswith("win") and SIO_KEEPALIVE_VALS is not None:
+                s.ioctl(SIO_KEEPALIVE_VALS, (1, self.keepalive_idle * 1000, TCP_KEEPALIVE_INTERVAL * 1000))
+        except AttributeError:
+            pass # какая-то опция не поддерживается на текущей платформе
+        except OSError:
+            pass # ошибка при установке опции
+
+    def establish_connection(self, host: str, port: int, login: str, password: str, progress: Optional[Callable[[str], None]] = None, cancel: Optional[threading.Event] = None) -> None:
+        """
+        * Установка сетевого соединения с сервером
+        *
+        * @param host Доменное имя хоста сервера DMconnect или его IP-адрес
+        * @param port TCP-порт сервера DMconnect
+        * @param login Имя пользователя на сервере DMconnect
+        * @param password Пароль пользователя на сервере DMconnect
+        * @param progress Функция progress(этап), вызывается в начале каждого этапа (STAGE_*)
+        * @param cancel Признак отмены: проверяется во время ожидания сети, при отмене
+        *        соединение закрывается и возбуждается ConnectCancelled
+        """
+        Miscellaneous.print_message(f"Попытка подключения к {host}:{port} с логином {login}...")
+        self.server = f"{host}:{port}"
+        self.host, self.port, self.login, self.password = host, port, login, password # для переподключения
+        self.room = None
+        self.reader = None # новый буфер чтения на каждое соединение
+        if self.members is not None:
+            self.members.invalidate()
+        if self.is_native:
+            if progress is not None:
+                progress(STAGE_CONNECTING)
+            self.dm_obj = BufferedDMconn(host, port, login, password) # подключение и вход выполняет DMconn (без отмены)
+            self.msg_cursor = 0 # у нового соединения свой буфер сообщений
+            self.sock = self.dm_obj.sock
+            if cancel is not None and cancel.is_set():
+                self.close()
+                raise ConnectCancelled("Подключение отменено.")
+        else:
+            s: Optional[socket] = None
+            try:
+                if progress is not None:
+                    progress(STAGE_RESOLVING)
+                addresses = RESOLVER.resolve(host, port) # IPv4 и IPv6, повторные подключения - без обращения к DNS
+                if cancel is not None and cancel.is_set():
+                    raise ConnectCancelled("Подключение отменено.")
+                if progress is not None:
+                    progress(STAGE_CONNECTING)
+                try:
+                    s = connect_first(addresses, CONNECT_TIMEOUT, cancel) # попытки ко всем адресам со сдвигом, побеждает первая
+                except ConnectCancelled:
+                    raise
+                except OSError:
+                    RESOLVER.invalidate(host, port) # адреса могли смениться - при следующей попытке спросим DNS снова
+                    raise
+                self.set_tcp_keepalive(s)
+                if self.is_telnet:
+                    s.settimeout(5.0)
+                else:
+                    s.setblocking(True)
+                self.sock = s # сохраняем сокет в экземпляре для дальнейшего использования
+            except Exception:
+                if s is not None:
+                    try:
+                        s.close()
+                    except Exception:
+                        pass
+                self.sock = None
+                self.is_connected = False
+                raise
+        if self.sock is not None: # выставление признака успешного или неуспешного подключения
+            self.traffic.clear() # буфер обмена с сервером - только для текущего соединения
+            self.is_connected = True
+            self.last_sent = self.last_received = time.monotonic()
+        else:
+            self.is_connected = False
+        Miscellaneous.print_message(f"Подключение {'установлено' if self.is_connected else 'не установлено'}.")
+        if self.is_connected: # аутентификации пользователя
+            if not self.is_native:
+                Miscellaneous.print_message("Отправка на сервер данных аутентификации пользователя.")
+                if progress is not None:
+                    progress(STAGE_AUTHENTICATING)
+                cmd: str = f"/login {login} {password}"
+                self.cancel_event = cancel
+                try:
+                    response_lines: List[str] = self.execute_command(s, cmd)
+                finally:
+                    self.cancel_event = None
+                failure: Optional[LoginResult] = next((event for event in map(parse_line, response_lines) if isinstance(event, LoginResult) and not event.success), None)
+                if failure is not None: # сервер отверг логин или пароль - соединение остаётся, но без входа
+                    self.is_authenticated = False
+                    TRANSPORT_LOG.error("Вход на %s с логином %s не выполнен: %s", self.server, login, failure.line)
+                    Miscellaneous.print_message(f"Вход не выполнен: {failure.line}")
+                else:
+                    self.is_authenticated = True
+                    Miscellaneous.print_message("Данные аутентификации пользователя отправлены на сервер.")
+            else:
+                self.is_authenticated = True
+
+    def close(self) -> None:
+        """
+        * Закрытие соединения с сервером (в том числе уже разорванного сервером)
+        """
+        if self.is_native:
+            if self.dm_obj is not None:
+                self.dm_obj.close()
+                self.dm_obj = None
+        elif self.sock is not None:
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+        self.sock = None
+        self.is_connected = False
+        self.is_authenticated = False
+        if self.commands is not None: # ответов на отправленные команды уже не будет
+            self.commands.fail_all(ConnectionError(DISCONNECT_MESSAGE))
@@ -0,0 +1,416 @@
+"""
+* Несколько одновременных сеансов DMconnect в одном процессе
+* *************************
+* Менеджер ведёт N соединений (свои хост, порт, логин, комната и
+* режим протокола у каждого) в одном потоке: сокеты всех сеансов
+* ожидаются в одном selector'е, команды отправляются без ожидания
+* ответа, а ответы читаются вместе с остальными входящими строками.
+* Только подключение и вход ждут сервера: они выполняются в
+* небольшом пуле потоков, а подключённый сокет затем ожидается в
+* общем selector'е, поэтому медленный или недоступный сервер не
+* задерживает остальные сеансы.
+* У каждого сеанса свои буферы, кэш участников и супервизор
+* переподключения (см. reconnect.py). Сеансы описываются в файле настроек секциями
+* вида:
+* [session:имя]
+* host = ...
+* port = ...
+* login = ...
+* password = ...
+* room = ...
+* mode = raw | telnet | native
+"""
+
+from typing import Optional, List, Dict, Callable
+from concurrent.futures import Executor, ThreadPoolExecutor
+import configparser
+import selectors
+import threading
+import socket
+import random
+import queue
+import time
+
+from session import DMconnectSession
+from reconnect import ReconnectSupervisor, RECONNECT_MIN_DELAY, STATE_CONNECTED, STATE_RECONNECTING
+from outbound import OutboundQueue, OutgoingMessage, MAX_MESSAGE_BYTES
+from scheduler import PollScheduler
+from logs import TRANSPORT_LOG
+from metrics import METRICS
+from miscellaneous import Miscellaneous
+from models import Constant
+
+SESSION_SECTION_PREFIX: str = "session:" # префикс секций файла настроек с описанием сеансов
+MODE_RAW: str = "raw" # обмен без Telnet-совместимости
+MODE_TELNET: str = "telnet" # Telnet-совместимый обмен
+MODE_NATIVE: str = "native" # нативный протокол DMconnect
+SERVER_POLL_INTERVAL: float = 30.0 # период полного опроса сервера каждым сеансом (в секундах)
+CONNECT_WORKERS: int = 8 # сколько сеансов могут подключаться одновременно
+
+class SessionSpec:
+    """
+    * Параметры одного сеанса
+    """
+
+    def __init__(self, name: str, host: str, port: int, login: str, password: str, room: str = "", mode: str = MODE_RAW):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.login = login
+        self.password = password
+        self.room = room
+        self.mode = mode if mode in (MODE_RAW, MODE_TELNET, MODE_NATIVE) else MODE_RAW
+
+    @staticmethod
+    def from_section(name: str, section) -> Optional["SessionSpec"]:
+        """
+        * Параметры сеанса из секции файла настроек
+        *
+        * @param name Имя сеанса
+        * @param section Секция configparser
+        * @return Экземпляр SessionSpec или None, если параметры заданы некорректно
+        """
+        try:
+            port: int = int(section.get("port", "").strip())
+        except ValueError:
+            return None
+        host: str = section.get("host", "").strip()
+        login: str = section.get("login", "").strip()
+        if "".__eq__(host) or "".__eq__(login) or not (1 <= port <= 65534):
+            return None
+        return SessionSpec(name, host, port, login, section.get("password", "").strip(), section.get("room", "").strip(), section.get("mode", MODE_RAW).strip().lower())
+
+def load_session_specs(path: Optional[str] = None) -> List[SessionSpec]:
+    """
+    * Чтение описаний сеансов из файла настроек
+    *
+    * @param path Путь к файлу настроек (по умолчанию - файл настроек программы)
+    * @return Массив параметров сеансов
+    """
+    specs: List[SessionSpec] = []
+    path = Constant.SETTINGS_FILE.value if path is None else path
+    if not Miscellaneous.is_file_readable(path):
+        return specs
+    config = configparser.ConfigParser()
+    try:
+        with open(path, 'r', encoding=Constant.GLOBAL_CODEPAGE.value) as f:
+            config.read_file(f)
+    except Exception as e:
+        Miscellaneous.print_message(f"Ошибка при чтении файла настроек: {e}")
+        return specs
+    for section_name in config.sections():
+        if section_name.startswith(SESSION_SECTION_PREFIX):
+            name: str = section_name[len(SESSION_SECTION_PREFIX):].strip()
+            spec: Optional[SessionSpec] = SessionSpec.from_section(name, config[section_name])
+            if spec is None:
+                Miscellaneous.print_message(f"Сеанс '{name}' описан некорректно и будет пропущен.")
+            else:
+                specs.append(spec)
+    return specs
+
+class ManagedSession:
+    """
+    * Сеанс под управлением SessionManager: соединение и его состояние
+    """
+
+    def __init__(self, spec: SessionSpec, template: Optional[DMconnectSession] = None, listener: Optional[Callable[[ReconnectSupervisor], None]] = None, delivery_listener: Optional[Callable[[OutgoingMessage], None]] = None, executor: Optional[Executor] = None, wakeup: Optional[Callable[[], None]] = None):
+        """
+        * @param spec Параметры сеанса
+        * @param template Сеанс, настройки которого копируются
+        * @param listener Функция, вызываемая при смене состояния соединения
+        * @param delivery_listener Функция, вызываемая при смене состояния исходящего сообщения
+        * @param executor Пул потоков для попыток подключения
+        * @param wakeup Функция, будящая цикл менеджера по завершении попытки
+        """
+        self.spec = spec
+        self.session: DMconnectSession = DMconnectSession(template)
+        self.session.is_native = (spec.mode == MODE_NATIVE)
+        self.session.is_telnet = (spec.mode == MODE_TELNET)
+        for key in ("host", "port", "login", "password"):
+            setattr(self.session, key, getattr(spec, key))
+        self.supervisor: ReconnectSupervisor = ReconnectSupervisor(self.session, RECONNECT_MIN_DELAY, self.session.reconnect_max_delay, listener, executor, wakeup)
+        self.outbound: OutboundQueue = OutboundQueue(self.session, self.session.send_rate, self.session.send_burst, MAX_MESSAGE_BYTES, self.session.outbox_size, delivery_listener)
+        self.send_at: Optional[float] = None # момент, когда можно отправить следующую строку из очереди
+        if not "".__eq__(spec.room):
+            self.supervisor.last_room = spec.room # вход в комнату - при каждом (пере)подключении
+        self.next_poll: float = 0.0 # момент следующего полного опроса сервера
+        self.watched_sock: Optional[socket.socket] = None # сокет, зарегистрированный в selector'е
+        self.members_version: int = -1 # версия кэша участников, последней отправленная слушателю
+
+    @property
+    def name(self) -> str:
+        return self.spec.name
+
+    @property
+    def state(self) -> str:
+        return self.supervisor.state
+
+class SessionManager:
+
+    sessions: Optional[Dict[str, ManagedSession]] = None
+    listener: Optional[Callable[[str, str, object], None]] = None # получатель событий сеансов (имя, вид, данные)
+    template: Optional[DMconnectSession] = None
+
+    def __init__(self, listener: Callable[[str, str, object], None], template: Optional[DMconnectSession] = None):
+        """
+        * @param listener Функция listener(имя сеанса, вид, данные), вызывается в потоке менеджера;
+        *        виды: "messages" (массив строк), "users" (массив логинов),
+        *        "state" (кортеж: состояние STATE_* из reconnect.py, текст для строки состояния),
+        *        "delivery" (кортеж: состояние STATUS_* из outbound.py, сообщение, длина очереди)
+        * @param template Сеанс, настройки которого копируются во все сеансы
+        """
+        self.listener = listener
+        self.template = template
+        self.sessions = {}
+        self.outgoing: queue.Queue = queue.Queue() # (имя сеанса, строка) от других потоков
+        self.stop_event = threading.Event()
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair() # self-pipe для пробуждения цикла
+        self.wakeup_reader.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.wakeup_reader, selectors.EVENT_READ)
+        poll_min_ms: int = template.poll_min_ms if template is not None else DMconnectSession.poll_min_ms
+        poll_max_ms: int = template.poll_max_ms if template is not None else DMconnectSession.poll_max_ms
+        self.poll_scheduler = PollScheduler(poll_min_ms, poll_max_ms) # для сеансов без сокета (нативный протокол)
+        self.executor = ThreadPoolExecutor(max_workers=CONNECT_WORKERS, thread_name_prefix="dmconnect-connect") # подключение и вход ждут сервера вне цикла
+        self.thread: Optional[threading.Thread] = None
+        METRICS.gauge("sessions_outgoing", self.outgoing.qsize)
+        METRICS.gauge("sessions_outbound", lambda: sum(len(managed.outbound) for managed in list(self.sessions.values())))
+
+    def add(self, spec: SessionSpec) -> ManagedSession:
+        """
+        * Добавление сеанса (до запуска менеджера)
+        *
+        * @param spec Параметры сеанса
+        * @return Экземпляр ManagedSession
+        """
+        managed: ManagedSession = ManagedSession(spec, self.template, lambda supervisor: self._on_state(spec.name), lambda message: self._on_delivery(spec.name, message), self.executor, self.wake)
+        self.sessions[spec.name] = managed
+        return managed
+
+    def send(self, name: str, text: str) -> None:
+        """
+        * Отправка сообщения или команды в сеанс (можно вызывать из любого потока)
+        *
+        * @param name Имя сеанса
+        * @param text Сообщение или команда
+        """
+        self.outgoing.put((name, text))
+        self.wake()
+
+    def wake(self) -> None:
+        """
+        * Пробуждение цикла менеджера
+        """
+        try:
+            self.wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def start(self) -> None:
+        """
+        * Запуск цикла менеджера в отдельном потоке
+        """
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        """
+        * Остановка цикла и закрытие всех соединений
+        """
+        self.stop_event.set()
+        self.wake()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+
+    def notify(self, managed: ManagedSession, kind: str, payload) -> None:
+        """
+        * Передача события сеанса слушателю
+        """
+        try:
+            self.listener(managed.name, kind, payload)
+        except Exception as e:
+            TRANSPORT_LOG.error("Ошибка обработки события сеанса %s: %s", managed.name, e)
+
+    def _on_state(self, name: str) -> None:
+        """
+        * Смена состояния соединения сеанса (вызывается супервизором)
+        """
+        managed: Optional[ManagedSession] = self.sessions.get(name)
+        if managed is None:
+            return
+        if managed.state == STATE_CONNECTED:
+            managed.next_poll = time.monotonic() + random.uniform(0.0, SERVER_POLL_INTERVAL) # опросы сеансов разнесены во времени
+            if len(managed.outbound) > 0: # сообщения, написанные за время разрыва
+                managed.send_at = time.monotonic()
+        self.notify(managed, "state", (managed.state, managed.supervisor.get_status_text()))
+        if managed.state == STATE_CONNECTED and len(managed.session.left_for_chat) > 0: # ответ на вход в комнату
+            self.notify(managed, "messages", list(managed.session.left_for_chat))
+            managed.session.left_for_chat.clear()
+
+    def _on_delivery(self, name: str, message: OutgoingMessage) -> None:
+        """
+        * Смена состояния исходящего сообщения сеанса
+        """
+        managed: Optional[ManagedSession] = self.sessions.get(name)
+        if managed is not None:
+            self.notify(managed, "delivery", (message.status, message.text, len(managed.outbound)))
+
+    def _watch(self, managed: ManagedSession) -> None:
+        """
+        * Приведение регистрации сокета сеанса в selector'е к текущему состоянию соединения
+        """
+        session: DMconnectSession = managed.session
+        sock = session.sock if session.is_connected and not session.is_native and not managed.supervisor.is_busy() else None
+        if sock is managed.watched_sock:
+            return
+        if managed.watched_sock is not None:
+            try:
+                self.selector.unregister(managed.watched_sock)
+            except (KeyError, ValueError, OSError):
+                pass
+            managed.watched_sock = None
+        if sock is not None:
+            try:
+                self.selector.register(sock, selectors.EVENT_READ, managed)
+                managed.watched_sock = sock
+            except (KeyError, ValueError, OSError):
+                pass
+
+    def _receive(self, managed: ManagedSession) -> bool:
+        """
+        * Чтение уже пришедших строк сеанса
+        *
+        * @return True, если что-нибудь пришло
+        """
+        session: DMconnectSession = managed.session
+        try:
+            lines: List[str] = session.read_socket(session.sock)
+        except Exception:
+            lines = []
+        if lines:
+            self.notify(managed, "messages", lines)
+        if session.members is not None and session.members.version != managed.members_version:
+            managed.members_version = session.members.version
+            self.notify(managed, "users", session.members.get_users())
+        return len(lines) > 0
+
+    def _poll(self, managed: ManagedSession) -> None:
+        """
+        * Полный опрос сервера сеансом: ping при простое и пересинхронизация списка участников
+        """
+        session: DMconnectSession = managed.session
+        try:
+            session.get_user_list()
+        except Exception:
+            pass
+        if len(session.left_for_chat) > 0:
+            self.notify(managed, "messages", list(session.left_for_chat))
+            session.left_for_chat.clear()
+        if session.members is not None and session.members.version != managed.members_version:
+            managed.members_version = session.members.version
+            self.notify(managed, "users", session.members.get_users())
+
+    def _process_outgoing(self) -> None:
+        """
+        * Постановка накопившихся сообщений в очереди исходящих сообщений сеансов
+        * (отправляет их _pump() без ожидания ответа сервера)
+        """
+        while True:
+            try:
+                name, text = self.outgoing.get_nowait()
+            except queue.Empty:
+                return
+            managed: Optional[ManagedSession] = self.sessions.get(name)
+            if managed is not None:
+                managed.outbound.submit(text)
+                managed.send_at = time.monotonic()
+
+    def _pump(self) -> None:
+        """
+        * Отправка сообщений из очередей сеансов, которым это уже разрешено ограничителем скорости
+        """
+        now: float = time.monotonic()
+        for managed in self.sessions.values():
+            if managed.send_at is not None and now >= managed.send_at and not managed.supervisor.is_busy():
+                managed.send_at = managed.outbound.pump(now)
+
+    def _drain_wakeups(self) -> None:
+        try:
+            while self.wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def run(self) -> None:
+        """
+        * Цикл менеджера: все сеансы ожидаются в одном selector'е
+        """
+        next_tick: float = time.monotonic() # момент следующей проверки сеансов без сокета
+        for managed in self.sessions.values():
+            managed.supervisor.begin() # первое подключение - с теми же повторами, что и переподключение
+        try:
+            while not self.stop_event.is_set():
+                now: float = time.monotonic()
+                for managed in self.sessions.values():
+                    self._watch(managed) # разорванный сокет снимается с ожидания до закрытия
+                    managed.supervisor.check(now)
+                    self._watch(managed)
+                wake_at: float = now + SERVER_POLL_INTERVAL
+                has_unwatched: bool = False
+                for managed in self.sessions.values():
+                    if managed.state == STATE_CONNECTED:
+                        wake_at = min(wake_at, managed.next_poll)
+                        if managed.watched_sock is None:
+                            has_unwatched = True
+                    elif managed.state == STATE_RECONNECTING:
+                        wake_at = min(wake_at, managed.supervisor.next_attempt)
+                    if managed.supervisor.is_busy(): # сеанс подключается в пуле потоков, пул разбудит цикл сам
+                        continue
+                    if managed.send_at is not None:
+                        wake_at = min(wake_at, managed.send_at)
+                    reply_at: Optional[float] = managed.session.commands.get_wake_time() # крайний срок ответа на команду
+                    if reply_at is not None:
+                        wake_at = min(wake_at, reply_at)
+                if has_unwatched:
+                    wake_at = min(wake_at, next_tick)
+                try:
+                    events = self.selector.select(max(0.0, wake_at - time.monotonic()))
+                except (ValueError, OSError): # сокет закрыт - регистрации будут исправлены в _watch()
+                    events = []
+                cycle_started: float = time.perf_counter()
+                ready: List[ManagedSession] = []
+                for key, _ in events:
+                    if key.fileobj is self.wakeup_reader:
+                        self._drain_wakeups()
+                    else:
+                        ready.append(key.data)
+                self._process_outgoing()
+                self._pump()
+                for managed in self.sessions.values():
+                    if not managed.supervisor.is_busy():
+                        managed.session.commands.expire()
+                has_data: bool = False
+                for managed in ready:
+                    has_data = self._receive(managed) or has_data
+                now = time.monotonic()
+                if has_unwatched and now >= next_tick:
+                    for managed in self.sessions.values():
+                        if managed.state == STATE_CONNECTED and managed.watched_sock is None:
+                            has_data = self._receive(managed) or has_data
+                    if has_data:
+                        self.poll_scheduler.on_activity()
+                    else:
+                        self.poll_scheduler.on_idle()
+                    next_tick = now + self.poll_scheduler.get_interval()
+                for managed in self.sessions.values():
+                    if managed.state == STATE_CONNECTED and now >= managed.next_poll:
+                        self._poll(managed)
+                        managed.next_poll = time.monotonic() + SERVER_POLL_INTERVAL
+                METRICS.observe("sessions_poll_cycle", (time.perf_counter() - cycle_started) * 1000.0)
+        finally:
+            for managed in self.sessions.values():
+                managed.supervisor.stop()
+                if not managed.supervisor.is_busy(): # попытка в пуле закроет соединение сама
+                    managed.session.close()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.selector.close()
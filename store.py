@@ -0,0 +1,198 @@
+"""
+* Локальное хранилище сообщений чата с полнотекстовым поиском
+* *************************
+* Все строки чата сохраняются во встроенную базу SQLite (время,
+* сервер, комната, автор из строк вида "nick: text", текст).
+* Запись выполняется отдельным потоком пачками в одной транзакции,
+* поэтому поток GUI не ждёт диска. По тексту сообщений строится
+* индекс FTS5; если SQLite собран без FTS5, поиск выполняется
+* через LIKE.
+"""
+
+from typing import Optional, List, Tuple
+import threading
+import queue
+import time
+import uuid
+try: # модуль sqlite3 может отсутствовать в урезанных сборках Python
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from miscellaneous import Miscellaneous
+from protocol import AUTHOR_PATTERN
+
+BATCH_SIZE: int = 500 # максимальное число строк в одной транзакции
+FLUSH_INTERVAL: float = 0.5 # максимальная задержка записи накопленных строк (в секундах)
+SEARCH_LIMIT: int = 200 # максимальное число результатов поиска
+
+SCHEMA: Tuple[str, ...] = (
+    "CREATE TABLE IF NOT EXISTS messages ("
+    " id INTEGER PRIMARY KEY,"
+    " ts REAL NOT NULL,"
+    " session TEXT NOT NULL,"
+    " seq INTEGER,"
+    " server TEXT,"
+    " room TEXT,"
+    " author TEXT,"
+    " text TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS messages_ts ON messages(ts)",
+)
+FTS_SCHEMA: Tuple[str, ...] = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(text, content='messages', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN"
+    " INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text); END",
+)
+
+class StoredMessage:
+    """
+    * Результат поиска по хранилищу
+    """
+
+    def __init__(self, row: tuple, session: str):
+        self.id, self.ts, self.session, self.seq, self.server, self.room, self.author, self.text = row
+        self.is_current_session: bool = (self.session == session) # строка есть в истории текущего окна чата
+
+    def __str__(self) -> str:
+        when: str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.ts))
+        where: str = "/".join(part for part in (self.server, self.room) if part)
+        who: str = f"{self.author}: " if self.author else ""
+        return f"[{when}] {where} {who}{self.text}"
+
+class MessageStore:
+
+    path: str = ""
+    session: str = "" # идентификатор текущего запуска программы
+    has_fts: bool = False # доступен ли индекс FTS5
+
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        """
+        * @param path Путь к файлу базы данных
+        * @param batch_size Максимальное число строк в одной транзакции
+        * @param flush_interval Максимальная задержка записи (в секундах)
+        """
+        if sqlite3 is None:
+            raise RuntimeError("Модуль sqlite3 недоступен.")
+        self.path = path
+        self.session = uuid.uuid4().hex
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue()
+        self._reader = self._open() # соединение для поиска (используется потоком GUI)
+        self._reader.executescript(";".join(SCHEMA))
+        try:
+            self._reader.executescript(";".join(FTS_SCHEMA))
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            Miscellaneous.print_message("SQLite собран без FTS5, поиск по истории будет медленнее.")
+            self.has_fts = False
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
+
+    def _open(self):
+        """
+        * Открытие соединения с базой данных
+        """
+        conn = sqlite3.connect(self.path)
+        conn.execute("PRAGMA journal_mode=WAL") # чтение не блокируется записью
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def parse_author(line: str) -> Tuple[Optional[str], str]:
+        """
+        * Выделение автора из строки чата вида "nick: text"
+        *
+        * @param line Строка чата
+        * @return Кортеж (автор или None для служебных строк, текст)
+        """
+        match = AUTHOR_PATTERN.match(line)
+        if match is None:
+            return None, line
+        return match.group(1), match.group(2)
+
+    def add(self, line: str, server: Optional[str] = None, room: Optional[str] = None, seq: Optional[int] = None) -> None:
+        """
+        * Постановка строки чата в очередь на запись (не блокирует вызывающий поток)
+        *
+        * @param line Строка чата
+        * @param server Сервер ("хост:порт")
+        * @param room Комната
+        * @param seq Номер строки в истории текущего окна чата (ChatHistory)
+        """
+        author, text = MessageStore.parse_author(line)
+        self._queue.put((time.time(), self.session, seq, server, room, author, text))
+
+    def _writer_loop(self) -> None:
+        """
+        * Поток записи: накопление строк и запись пачками в одной транзакции
+        """
+        conn = self._open()
+        try:
+            stop: bool = False
+            while not stop:
+                rows: List[tuple] = []
+                try:
+                    row = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                deadline: float = time.monotonic() + self.flush_interval
+                while row is not None:
+                    rows.append(row)
+                    if len(rows) >= self.batch_size:
+                        break
+                    try:
+                        row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                if row is None: # признак завершения работы
+                    stop = True
+                if len(rows) > 0:
+                    try:
+                        with conn:
+                            conn.executemany("INSERT INTO messages (ts, session, seq, server, room, author, text) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                    except sqlite3.Error as e:
+                        Miscellaneous.print_message(f"Ошибка записи истории чата: {e}")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def build_fts_query(query: str) -> str:
+        """
+        * Преобразование запроса пользователя в запрос FTS5 (каждое слово - фраза,
+        * чтобы спецсимволы FTS5 не вызывали синтаксических ошибок)
+        """
+        return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> List[StoredMessage]:
+        """
+        * Поиск сообщений по тексту (новые - первыми)
+        *
+        * @param query Строка поиска
+        * @param limit Максимальное число результатов
+        * @return Массив найденных сообщений
+        """
+        if "".__eq__(query.strip()):
+            return []
+        columns: str = "m.id, m.ts, m.session, m.seq, m.server, m.room, m.author, m.text"
+        if self.has_fts:
+            rows = self._reader.execute(
+                f"SELECT {columns} FROM messages_fts f JOIN messages m ON m.id = f.rowid"
+                " WHERE messages_fts MATCH ? ORDER BY m.id DESC LIMIT ?",
+                (MessageStore.build_fts_query(query), limit)).fetchall()
+        else:
+            rows = self._reader.execute(
+                f"SELECT {columns} FROM messages m WHERE m.text LIKE ? ESCAPE '\\' ORDER BY m.id DESC LIMIT ?",
+                ("%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%", limit)).fetchall()
+        return [StoredMessage(row, self.session) for row in rows]
+
+    def close(self) -> None:
+        """
+        * Запись оставшихся строк и закрытие базы данных
+        """
+        self._queue.put(None)
+        self._writer_thread.join(timeout=30.0)
+        try:
+            self._reader.close()
+        except Exception:
+            pass
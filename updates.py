@@ -0,0 +1,141 @@
+"""
+* Ограниченная очередь обновлений от сетевых потоков к GUI
+* *************************
+* Пока GUI занят (модальное окно, долгая отрисовка), сетевые потоки
+* продолжают присылать результаты. Очередь не растёт без предела:
+* 1) из снимков состояния (список пользователей, состояние
+*    соединения, этап подключения, состояние дополнительного сеанса)
+*    хранится только последний, он будет показан на месте первого из
+*    заменённых;
+* 2) подряд идущие пачки строк чата одного источника сливаются в
+*    одну;
+* 3) если строк больше max_lines или записей больше size, отбрасываются
+*    самые старые строки чата; их число учитывается в счётчике overflow
+*    и выдаётся GUI записью ("overflow", число).
+* Управляющие записи (завершение подключения, состояние исходящего
+* сообщения, ошибка команды и т.д.) не отбрасываются никогда: от них
+* зависит состояние формы подключения и очереди исходящих сообщений.
+* Их немного, поэтому очередь остаётся ограниченной.
+* Производители никогда не блокируются. GUI забирает всё одним
+* вызовом drain() и отрисовывает за один проход.
+"""
+
+from typing import Optional, List, Dict, Tuple
+from collections import deque
+import threading
+
+from metrics import METRICS
+
+RESULT_QUEUE_SIZE: int = 1000 # максимальное число записей в очереди
+RESULT_QUEUE_LINES: int = 20000 # максимальное число строк чата в очереди
+SNAPSHOT_KINDS: Tuple[str, ...] = ("users", "connection_state", "connect_progress", "error") # важен только последний снимок
+LINE_KINDS: Tuple[str, ...] = ("messages", "command_response") # пачки строк чата
+SESSION_SNAPSHOT_KINDS: Tuple[str, ...] = ("users", "state") # снимки дополнительного сеанса ("session", (имя, вид, данные))
+LATEST = object() # запись очереди, вместо которой выдаётся последний снимок
+
+class UpdateChannel:
+
+    def __init__(self, size: int = RESULT_QUEUE_SIZE, max_lines: int = RESULT_QUEUE_LINES):
+        """
+        * @param size Максимальное число записей
+        * @param max_lines Максимальное число строк чата
+        """
+        self.size = max(1, size)
+        self.max_lines = max(1, max_lines)
+        self._items: deque = deque() # записи [вид, данные, строки] или [LATEST, ключ, None]
+        self._latest: Dict[object, Tuple[str, object]] = {} # ключ снимка -> (вид, данные)
+        self._lines: int = 0 # строк чата в очереди
+        self._dropped: int = 0 # отброшено с последнего drain()
+        self._lock = threading.Lock()
+        self.overflow: int = 0 # всего отброшено строк и записей
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @staticmethod
+    def get_snapshot_key(kind: str, payload) -> Optional[object]:
+        if kind in SNAPSHOT_KINDS:
+            return kind
+        if kind == "session" and payload[1] in SESSION_SNAPSHOT_KINDS:
+            return (kind, payload[0], payload[1])
+        return None
+
+    def put(self, kind: str, payload) -> None:
+        """
+        * Добавление результата (из любого потока, без блокировки производителя)
+        *
+        * @param kind Вид результата
+        * @param payload Данные результата
+        """
+        key: Optional[object] = UpdateChannel.get_snapshot_key(kind, payload)
+        with self._lock:
+            if key is not None:
+                if key not in self._latest:
+                    self._items.append([LATEST, key, None])
+                self._latest[key] = (kind, payload)
+            else:
+                lines: Optional[List[str]] = None
+                if kind in LINE_KINDS:
+                    lines = list(payload)
+                    payload = lines
+                elif kind == "session" and payload[1] == "messages":
+                    lines = list(payload[2])
+                    payload = (payload[0], payload[1], lines)
+                tail: Optional[list] = self._items[-1] if len(self._items) > 0 else None
+                if lines is not None and tail is not None and tail[2] is not None and tail[0] == kind and (kind != "session" or tail[1][0] == payload[0]):
+                    tail[2].extend(lines) # та же лента чата - одна пачка
+                else:
+                    self._items.append([kind, payload, lines])
+                if lines is not None:
+                    self._lines += len(lines)
+            self._trim()
+
+    def _trim(self) -> None:
+        """
+        * Отбрасывание самых старых строк чата сверх ограничений
+        * (снимки и управляющие записи остаются)
+        """
+        while self._lines > self.max_lines:
+            entry: Optional[list] = next((item for item in self._items if item[2] is not None and len(item[2]) > 0), None)
+            if entry is None:
+                break
+            count: int = min(len(entry[2]), self._lines - self.max_lines)
+            del entry[2][:count]
+            self._lines -= count
+            self._drop(count)
+        while len(self._items) > self.size:
+            index: Optional[int] = next((i for i, item in enumerate(self._items) if item[0] is not LATEST and item[2] is not None), None)
+            if index is None: # остались только снимки и управляющие записи
+                break
+            entry = self._items[index]
+            del self._items[index] # порядок остальных записей сохраняется
+            self._lines -= len(entry[2])
+            self._drop(len(entry[2]))
+
+    def _drop(self, count: int) -> None:
+        if count > 0:
+            self._dropped += count
+            self.overflow += count
+            METRICS.add("result_overflow", count)
+
+    def drain(self) -> List[Tuple[str, object]]:
+        """
+        * Все накопленные результаты (вызывается в потоке GUI)
+        *
+        * @return Массив (вид, данные); первым идёт ("overflow", число), если что-то отброшено
+        """
+        with self._lock:
+            items: deque = self._items
+            latest: Dict[object, Tuple[str, object]] = self._latest
+            dropped: int = self._dropped
+            self._items = deque()
+            self._latest = {}
+            self._lines = 0
+            self._dropped = 0
+        result: List[Tuple[str, object]] = [("overflow", dropped)] if dropped > 0 else []
+        for entry in items:
+            if entry[0] is LATEST:
+                result.append(latest[entry[1]])
+            elif entry[2] is None or len(entry[2]) > 0: # пачка могла опустеть при отбрасывании строк
+                result.append((entry[0], entry[1]))
+        return result